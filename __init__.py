@@ -1,5 +1,6 @@
 #!/usr/bin/env python
 
 from . import *
+from ._internal import stats, enable_stats, disable_stats, reset_stats
 
-__all__ = ["har", "utils"]
+__all__ = ["har", "utils", "stats"]
@@ -1,10 +1,25 @@
 #!/usr/bin/env python
 
+import gc
+import os
+import re
 import json
+import codecs
+import atexit
+import shutil
+import hashlib
+import tempfile
+import binascii
+import weakref
+from timeit import default_timer as _clock
+from base64 import b64encode, b64decode
+from calendar import timegm
 from StringIO import StringIO
 from datetime import datetime
+from urllib import quote, unquote
+from json.encoder import encode_basestring_ascii, c_make_encoder
 try:
-    from dateutil import tz
+    from dateutil import tz, parser
 except ImportError:
     print ("Please verify that dateutil is installed. On Debian based systems "
            "like Ubuntu this can be  done with `aptitude install "
@@ -17,6 +32,21 @@ now = datetime.now #we imported datetime already, we only use now() in har.py
 # Constants
 ###############################################################################
 TIMEZONE = tz.tzlocal()
+SPILL_THRESHOLD = 8 * 1024 * 1024 # bodies larger than this go to disk
+CHUNK_SIZE = 3 * 21845 # a multiple of 3 so chunks base64 encode cleanly
+ISO_8601 = re.compile(r"(\d{4})-(\d\d)-(\d\d)[T ](\d\d):(\d\d):(\d\d)"
+                      r"(?:\.(\d+))?(Z|[+-]\d\d:?\d\d)?$")
+PAUSE_GC_ON_LOAD = True # see _gc_paused
+DEFAULT_PORTS = {"http": 80, "https": 443, "ws": 80, "wss": 443}
+BOUNDARY = re.compile(r'boundary=(?:"([^"]+)"|([^;\s]+))', re.I)
+PART_DISPOSITION = re.compile(
+    r'Content-Disposition: form-data; name="([^"]*)"(?:; filename="([^"]*)")?$')
+HEAD_END = re.compile(r"\r\n\r\n")
+MAX_PART_HEAD = 16 * 1024 # more than this without a blank line is garbage
+LONE_PERCENT = re.compile(r"%(?![0-9a-fA-F]{2})")
+QUERY_SAFE = "/:@!$'()*,;?~%" # left as they are in a query value
+CHILD_MARKER = re.compile(r'"\\u0000(\d+)"') # see _MetaHar._json_pieces
+MERGE_SIZE = 4096 # memoized json shorter than this is kept as one string
 
 
 ###############################################################################
@@ -37,6 +67,9 @@ class MissingValue(Exception):
                     self.in_class))
 
 
+MissingValueException = MissingValue # the name it is raised and tested by
+
+
 class ValidationError(Exception):
 
     def __init__(self, msg):
@@ -71,6 +104,30 @@ def _localize_datetime(dto):
     #YYYY-MM-DDThh:mm:ss.sTZD
 
 
+def _epoch_ms(value):
+    """Return a HAR date, as a string or a datetime, in milliseconds
+    since the epoch. The usual ISO 8601 forms are parsed directly,
+    anything else is handed to dateutil."""
+    if not isinstance(value, datetime):
+        match = ISO_8601.match(value)
+        if not match:
+            value = parser.parse(value)
+        else:
+            year, month, day, hour, minute, second, fraction, zone = \
+                match.groups()
+            seconds = timegm((int(year), int(month), int(day), int(hour),
+                              int(minute), int(second)))
+            if zone and zone != "Z":
+                offset = int(zone[1:3]) * 3600 + int(zone[-2:]) * 60
+                seconds -= offset if zone[0] == "+" else -offset
+            return seconds * 1000.0 + float("0." + (fraction or "0")) * 1000
+    offset = value.utcoffset()
+    seconds = timegm(value.timetuple()) - (offset and
+                                           offset.days * 86400 +
+                                           offset.seconds or 0)
+    return seconds * 1000.0 + value.microsecond / 1000.0
+
+
 class HarEncoder(json.JSONEncoder):
     """json Encoder override.
 
@@ -78,24 +135,937 @@ class HarEncoder(json.JSONEncoder):
 
     """
 
+    def __init__(self, inline_bodies=True, stream_bodies=False, **kwargs):
+        # inline_bodies=False leaves message bodies as references in
+        # to the body store instead of writing them out.
+        #
+        # stream_bodies=True leaves a placeholder for bodies spilled to
+        # disk, see _MetaHar.dump.
+        self.inline_bodies = inline_bodies
+        self.stream_bodies = stream_bodies
+        self.streamed = {}
+        json.JSONEncoder.__init__(self, **kwargs)
+
     def default(self, obj):
         if isinstance(obj, _MetaHar):
-            return dict((k, v) for k, v in obj.__dict__.iteritems()
-                         if k != "_parent")
+            return obj._to_dict(self.inline_bodies)
+        if isinstance(obj, _JsonBody):
+            if not self.stream_bodies:
+                return obj.read()
+            placeholder = "harpy-body:{0}".format(id(obj))
+            self.streamed[encode_basestring_ascii(placeholder)] = obj
+            return placeholder
         if isinstance(obj, datetime):
             obj = _localize_datetime(obj)
             return obj.isoformat()
         return json.JSONEncoder.default(self, obj)
 
 
+def _object_encoder(inline_bodies):
+    """Return a function that encodes one object the way to_json
+    always has. It is called for every object in a HAR, so the C
+    encoder is made once instead of once a call."""
+    encoder = HarEncoder(inline_bodies=inline_bodies)
+    if c_make_encoder is None:
+        return encoder.encode
+    iterencode = c_make_encoder(None, encoder.default,
+                                encode_basestring_ascii, None, ": ", ", ",
+                                False, False, True)
+    return lambda obj: "".join(iterencode(obj, 0))
+
+
+_ENCODERS = {True: _object_encoder(True), False: _object_encoder(False)}
+
+
+class BlobStore(object):
+    """A content addressed store for message bodies.
+
+    Crawls fetch the same javascript, css and images over and over, so
+    bodies are kept here once, keyed by the sha1 of their bytes, and
+    `Content` objects only hold the digest. Storing a body that is
+    already present costs nothing but the hash::
+
+        In [0]: BODY_STORE.put('body') == BODY_STORE.put('body')
+        Out[0]: True
+
+        In [1]: len(BODY_STORE), BODY_STORE.size, BODY_STORE.saved
+        Out[1]: (1, 4, 4)
+
+    Bodies larger than `spill_threshold` are written to a temporary
+    directory and held as a `FileBody`, so a capture with a 500MB
+    download in it does not need 500MB of memory. `size` only counts
+    the bytes held in memory.
+
+    Objects with a body `hold` it, and a body is dropped as soon as the
+    last object holding it is gone or holds another body, its spilled
+    file with it. A body that was `put` but never held stays until
+    `clear`, which drops every body that nothing holds.
+    """
+
+    def __init__(self, spill_threshold=SPILL_THRESHOLD):
+        self._blobs = {}
+        self._refs = {}    # digest -> number of objects holding it
+        self._holders = {} # id of an object -> the _Holder for it
+        self._gone = self._release_holder # one bound method for them all
+        self.spill_threshold = spill_threshold
+        self._spill_dir = None
+        self.size = 0  # bytes held in memory
+        self.saved = 0 # bytes not held because they were duplicates
+
+    def __contains__(self, digest):
+        return digest in self._blobs
+
+    def __len__(self):
+        return len(self._blobs)
+
+    def __repr__(self):
+        return "<BlobStore: {0} blobs, {1} bytes, {2} bytes saved>".format(
+            len(self), self.size, self.saved)
+
+    @staticmethod
+    def digest(data):
+        """Return the key `data` is stored under."""
+        if isinstance(data, unicode):
+            data = data.encode('utf8')
+        sha1 = hashlib.sha1()
+        for chunk in _chunks(data):
+            sha1.update(chunk)
+        return sha1.hexdigest()
+
+    def put(self, data):
+        """Store `data` if it is not already stored and return its
+        digest."""
+        digest = self.digest(data)
+        if digest in self._blobs:
+            self.saved += len(data)
+        elif len(data) > self.spill_threshold:
+            self._blobs[digest] = self._spill(digest, data)
+        else:
+            self._blobs[digest] = data
+            self.size += len(data)
+        return digest
+
+    def _spill(self, digest, data):
+        if isinstance(data, FileBody) and data.delete:
+            return data # already a temporary file nobody else owns
+        if not self._spill_dir:
+            self._spill_dir = tempfile.mkdtemp(prefix="harpy-")
+            atexit.register(shutil.rmtree, self._spill_dir, True)
+        if isinstance(data, unicode):
+            data = data.encode('utf8')
+        path = os.path.join(self._spill_dir, digest)
+        with open(path, 'wb') as fd:
+            for chunk in _chunks(data):
+                fd.write(chunk)
+        return FileBody(path, len(data), delete=True)
+
+    def get(self, digest):
+        """Return the body stored under `digest`."""
+        try:
+            return self._blobs[digest]
+        except KeyError:
+            raise KeyError("No body with digest {0} in store".format(digest))
+
+    def hold(self, owner, digest):
+        """Keep the body under `digest` for as long as `owner` is alive
+        and holds it, letting go of the one it held before."""
+        holder = self._holders.get(id(owner))
+        if holder is not None:
+            if holder.digest == digest:
+                return
+            self._release(holder.digest)
+        holder = _Holder(owner, self._gone)
+        holder.key, holder.digest = id(owner), digest
+        self._holders[holder.key] = holder
+        self._refs[digest] = self._refs.get(digest, 0) + 1
+
+    def drop(self, owner):
+        """Let go of the body `owner` holds, if any."""
+        holder = self._holders.pop(id(owner), None)
+        if holder is not None:
+            self._release(holder.digest)
+
+    def _release_holder(self, holder):
+        # the owner is gone, unless its id already belongs to another
+        if self._holders.get(holder.key) is holder:
+            del self._holders[holder.key]
+            self._release(holder.digest)
+
+    def _release(self, digest):
+        count = self._refs.get(digest, 0) - 1
+        if count > 0:
+            self._refs[digest] = count
+            return
+        self._refs.pop(digest, None)
+        self._forget(digest)
+
+    def _forget(self, digest):
+        # as put counted it, and without globals, which may be gone
+        # when the last holders go at exit. A spilled FileBody removes
+        # its own file.
+        body = self._blobs.pop(digest, None)
+        if body is not None and len(body) <= self.spill_threshold:
+            self.size -= len(body)
+
+    def clear(self):
+        """Drop every body no object holds."""
+        for digest in [d for d in self._blobs if not d in self._refs]:
+            self._forget(digest)
+        if not self._blobs:
+            self.saved = 0
+            if self._spill_dir:
+                shutil.rmtree(self._spill_dir, True)
+                self._spill_dir = None
+
+
+class _Holder(weakref.ref):
+    """A weak reference to an object holding a body, which lets go of
+    the body when the object is gone."""
+
+    __slots__ = ("key", "digest")
+
+
+BODY_STORE = BlobStore()
+
+
+class FileBody(object):
+    """A body that lives in a file instead of in memory.
+
+    It has a length and can be read in chunks. Nothing is read from
+    disk until it is asked for. With delete=True the file is removed
+    once the object is gone.
+    """
+
+    def __init__(self, path, size=None, delete=False):
+        self.path = path
+        if size is None:
+            size = os.path.getsize(path)
+        self.size = size
+        self.delete = delete
+
+    def __len__(self):
+        return self.size
+
+    def __repr__(self):
+        return "<FileBody {0}: {1} bytes>".format(self.path, self.size)
+
+    def __str__(self):
+        return self.read()
+
+    def __del__(self, _remove=os.remove):
+        # os may already be gone if this runs at interpreter exit
+        if self.delete:
+            try:
+                _remove(self.path)
+            except OSError:
+                pass
+
+    def chunks(self, size=CHUNK_SIZE):
+        with open(self.path, 'rb') as fd:
+            chunk = fd.read(size)
+            while chunk:
+                yield chunk
+                chunk = fd.read(size)
+
+    def read(self):
+        with open(self.path, 'rb') as fd:
+            return fd.read()
+
+    def b64decoded(self):
+        """Return a new FileBody with the base64 decoded contents of this
+        one."""
+        fd, path = tempfile.mkstemp(prefix="harpy-")
+        with os.fdopen(fd, 'wb') as out:
+            left = ''
+            for chunk in self.chunks():
+                chunk = left + ''.join(chunk.split())
+                cut = len(chunk) - len(chunk) % 4
+                out.write(binascii.a2b_base64(chunk[:cut]))
+                left = chunk[cut:]
+        return FileBody(path, delete=True)
+
+
+class _JsonBody(object):
+    """A FileBody on its way to json, either as utf8 text or base64.
+    HarEncoder turns this in to a string, _MetaHar.dump streams it."""
+
+    def __init__(self, body, encoding):
+        self.body = body
+        self.encoding = encoding
+
+    def chunks(self):
+        if self.encoding == "base64":
+            for chunk in self.body.chunks():
+                yield b64encode(chunk)
+        else:
+            decoder = codecs.getincrementaldecoder('utf8')()
+            for chunk in self.body.chunks():
+                yield decoder.decode(chunk)
+            yield decoder.decode('', True)
+
+    def read(self):
+        return u''.join(self.chunks())
+
+
+def _chunks(data):
+    """Yield `data` in chunks whether it is a string, a buffer, a
+    FileBody or a _MultipartBody."""
+    if isinstance(data, (FileBody, _MultipartBody)):
+        for chunk in data.chunks():
+            yield chunk
+    else:
+        yield data
+
+
+def _is_utf8(body):
+    decoder = codecs.getincrementaldecoder('utf8')()
+    try:
+        for chunk in _chunks(body):
+            decoder.decode(chunk)
+        decoder.decode('', True)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+def _write_body(fd, body):
+    """Write `body` to `fd` a chunk at a time."""
+    for chunk in _chunks(body):
+        fd.write(chunk)
+
+
+class _BodyBuffer(object):
+    """Collects the pieces of a body, moving them to a temporary file
+    once they pass SPILL_THRESHOLD."""
+
+    def __init__(self, spill_threshold=SPILL_THRESHOLD):
+        self.spill_threshold = spill_threshold
+        self.size = 0
+        self._parts = []
+        self._fd = None
+        self._path = None
+
+    def write(self, data):
+        self.size += len(data)
+        if self._fd:
+            self._fd.write(data)
+            return
+        self._parts.append(data)
+        if self.size > self.spill_threshold:
+            fd, self._path = tempfile.mkstemp(prefix="harpy-")
+            self._fd = os.fdopen(fd, 'wb')
+            for part in self._parts:
+                self._fd.write(part)
+            self._parts = []
+
+    def getvalue(self):
+        if self._fd:
+            self._fd.close()
+            return FileBody(self._path, self.size, delete=True)
+        return ''.join(self._parts)
+
+
+def _inline_body(har, field):
+    """Put the body `har` refers to by "_blob" back in to `har` as
+    `field`, as utf8 text or, failing that, base64."""
+    text = BODY_STORE.get(har.pop("_blob"))
+    if isinstance(text, FileBody):
+        if "encoding" in har or _is_utf8(text):
+            text = _JsonBody(text, "utf8")
+        else:
+            text = _JsonBody(text, "base64")
+            har["encoding"] = "base64"
+    elif not isinstance(text, unicode):
+        try:
+            text = unicode(text, 'utf8')
+        except UnicodeDecodeError:
+            text = b64encode(text)
+            har["encoding"] = "base64"
+    har[field] = text
+    return har
+
+
+###############################################################################
+# Multipart Bodies
+###############################################################################
+
+
+def _boundary(mime_type):
+    """Return the boundary of a multipart/form-data `mime_type`, or
+    None."""
+    if not mime_type or \
+       not mime_type.lower().startswith("multipart/form-data"):
+        return None
+    match = BOUNDARY.search(mime_type)
+    return match and str(match.group(1) or match.group(2)) or None
+
+
+class _MultipartParser(object):
+    """Splits a multipart/form-data body, fed to it a piece at a time,
+    in to its parts.
+
+    Only bodies in the form _MultipartBody writes them are taken, that
+    is the form browsers send: a Content-Disposition line, then an
+    optional Content-Type line, then any other headers, and the body
+    ending with the closing delimiter and a line break. Anything else
+    makes `close` return None, so the body can be kept as it is and
+    still be rendered back byte for byte.
+
+    The content of a part that arrives in one piece is kept as a
+    buffer in to that piece, without a copy. Content that spans pieces
+    is collected in a _BodyBuffer, which moves it to a temporary file
+    once it passes `spill_threshold`, so large file parts are never
+    held in memory.
+
+    """
+
+    def __init__(self, boundary, spill_threshold=SPILL_THRESHOLD):
+        self.boundary = boundary
+        self.spill_threshold = spill_threshold
+        self.parts = [] # (name, fileName, contentType, headers, content)
+        self._delimiter = re.compile(re.escape("\r\n--" + boundary))
+        self._keep = len(boundary) + 3 # a delimiter cut short may follow
+        self._buf = ""
+        self._pos = 0
+        self._state = "start"
+        self._head = None
+        self._pending = None # the one piece of content not yet collected
+        self._content = None
+
+    def feed(self, data):
+        """Parse the next piece of the body. Returns False once the body
+        can no longer be one this parser takes."""
+        if self._state == "failed":
+            return False
+        if self._pos >= len(self._buf):
+            self._buf = data
+        else:
+            self._buf = str(buffer(self._buf, self._pos)) + str(data)
+        self._pos = 0
+        while getattr(self, "_on_" + self._state)():
+            pass
+        return self._state != "failed"
+
+    def close(self):
+        """Return the parts, or None if the body was not one this parser
+        takes."""
+        rest = str(buffer(self._buf, self._pos))
+        if self._state != "epilogue" or rest != "\r\n":
+            return None
+        return self.parts
+
+    def _fail(self):
+        self._state = "failed"
+        self.parts = []
+        return False
+
+    def _on_start(self):
+        opening = "--" + self.boundary + "\r\n"
+        if len(self._buf) - self._pos < len(opening):
+            return False
+        if str(buffer(self._buf, self._pos, len(opening))) != opening:
+            return self._fail()
+        self._pos += len(opening)
+        self._state = "head"
+        return True
+
+    def _on_head(self):
+        match = HEAD_END.search(self._buf, self._pos)
+        if not match:
+            if len(self._buf) - self._pos > MAX_PART_HEAD:
+                return self._fail()
+            return False
+        lines = str(buffer(self._buf, self._pos,
+                           match.start() - self._pos)).split("\r\n")
+        disposition = PART_DISPOSITION.match(lines.pop(0))
+        if not disposition:
+            return self._fail()
+        content_type = None
+        if lines and lines[0].startswith("Content-Type: "):
+            content_type = lines.pop(0)[len("Content-Type: "):]
+        if any(line.lower().startswith(("content-disposition:",
+                                         "content-type:"))
+               for line in lines):
+            return self._fail() # could not be written back in order
+        self._head = (disposition.group(1), disposition.group(2),
+                      content_type, lines)
+        self._pos = match.end()
+        self._content = None
+        self._state = "content"
+        return True
+
+    def _on_content(self):
+        match = self._delimiter.search(self._buf, self._pos)
+        if not match:
+            end = max(self._pos, len(self._buf) - self._keep)
+            self._add(self._pos, end)
+            self._pos = end
+            return False
+        if len(self._buf) - match.end() < 2:
+            self._add(self._pos, match.start())
+            self._pos = match.start()
+            return False
+        self._add(self._pos, match.start())
+        after = str(buffer(self._buf, match.end(), 2))
+        if after == "\r\n":
+            self._state = "head"
+        elif after == "--":
+            self._state = "epilogue"
+        else:
+            return self._fail()
+        self._pos = match.end() + 2
+        self.parts.append(self._head + (self._collected(),))
+        return True
+
+    def _on_epilogue(self):
+        if len(self._buf) - self._pos > 2:
+            return self._fail()
+        return False
+
+    def _add(self, start, end):
+        if end <= start:
+            return
+        if self._pending is not None:
+            if self._content is None:
+                self._content = _BodyBuffer(self.spill_threshold)
+            self._content.write(str(self._pending))
+        self._pending = buffer(self._buf, start, end - start)
+
+    def _collected(self):
+        pending, self._pending = self._pending, None
+        if self._content is None:
+            return pending is not None and pending or ""
+        if pending is not None:
+            self._content.write(str(pending))
+        content, self._content = self._content.getvalue(), None
+        return content
+
+
+def _parse_multipart(body, boundary, spill_threshold=SPILL_THRESHOLD):
+    """Return the parts of the multipart/form-data `body`, a string, a
+    buffer or a FileBody, or None if it is not in the form browsers
+    send. See _MultipartParser."""
+    parser = _MultipartParser(boundary, spill_threshold)
+    for chunk in _chunks(body):
+        if not parser.feed(chunk):
+            return None
+    return parser.close()
+
+
+class _MultipartBody(object):
+    """A multipart/form-data body rendered from a list of Params, a
+    piece at a time. File contents are streamed from the body store,
+    so a large upload is never held in memory whole."""
+
+    def __init__(self, params, boundary):
+        self.params = params
+        self.boundary = boundary
+
+    def __len__(self):
+        return sum(len(piece) for piece in self._pieces(False))
+
+    def __repr__(self):
+        return "<_MultipartBody: {0} parts>".format(len(self.params))
+
+    def _head(self, param, first):
+        lines = [first and "--" or "\r\n--", self.boundary, "\r\n",
+                 'Content-Disposition: form-data; name="', param.name, '"']
+        if param._get("fileName", None) is not None:
+            lines.extend(['; filename="', param.fileName, '"'])
+        lines.append("\r\n")
+        if param._get("contentType", None) is not None:
+            lines.extend(["Content-Type: ", param.contentType, "\r\n"])
+        for header in param._get("_headers", []):
+            lines.extend([header, "\r\n"])
+        lines.append("\r\n")
+        head = "".join(lines)
+        if isinstance(head, unicode):
+            head = head.encode('utf8')
+        return head
+
+    def _pieces(self, read=True):
+        for i, param in enumerate(self.params):
+            yield self._head(param, not i)
+            if read:
+                for chunk in _chunks(param.body):
+                    yield chunk
+            else:
+                yield param.body
+        yield "{0}--{1}--\r\n".format(self.params and "\r\n" or "",
+                                      self.boundary)
+
+    def chunks(self):
+        return self._pieces()
+
+
+def _quote_query(text):
+    """Percent-encode `text` for a query string. Escapes already in it
+    are kept, so a value taken from a url goes back the same."""
+    if isinstance(text, unicode):
+        text = text.encode('utf8')
+    return LONE_PERCENT.sub("%25", quote(text, QUERY_SAFE))
+
+
+def _unquote_query(text):
+    if isinstance(text, unicode):
+        text = text.encode('utf8')
+    text = unquote(text.replace("+", " "))
+    try:
+        return text.decode('utf8')
+    except UnicodeDecodeError:
+        return text
+
+
+class _Url(object):
+    """A url split once in to its parts.
+
+    `target` is what goes on the request line, everything after the
+    host. `pairs` are the (name, value) pairs of the query string, as
+    they are in the url, without any decoding. `with_pairs` puts a new
+    query string in the url and leaves every other byte of it alone.
+
+    """
+
+    __slots__ = ["text", "scheme", "host", "port", "path", "query",
+                 "fragment", "target", "base", "pairs", "raw", "sent"]
+
+    def __init__(self, text):
+        self.text = text
+        scheme, sep, rest = text.partition("://")
+        if not sep:
+            scheme, rest = "", text
+        end = len(rest)
+        for c in "/?#":
+            i = rest.find(c)
+            if i != -1 and i < end:
+                end = i
+        netloc, target = rest[:end], rest[end:]
+        self.scheme = scheme.lower()
+        host, port = netloc.rpartition("@")[2], None
+        if host.startswith("["): # an IPv6 address
+            host, _, port = host[1:].partition("]")
+            port = port[1:]
+        elif ":" in host:
+            host, _, port = host.partition(":")
+        self.host = host.lower()
+        self.port = port and port.isdigit() and int(port) or \
+                    DEFAULT_PORTS.get(self.scheme)
+        self.target = target.startswith("/") and target or "/" + target
+        rest, sep, fragment = target.partition("#")
+        self.fragment = fragment if sep else None
+        self.path, sep, query = rest.partition("?")
+        self.query = query if sep else None
+        self.base = text[:len(text) - len(target)] + self.path
+        self.raw = [pair for pair in (query or "").split("&") if pair]
+        self.pairs = [tuple(pair.split("=", 1)) if "=" in pair else (pair, "")
+                      for pair in self.raw]
+        self.sent = None # the queryString pairs the url was last synced to
+
+    def __repr__(self):
+        return "<_Url {0}>".format(self.text)
+
+    def with_pairs(self, pairs):
+        """Return the url text with `pairs` as its query string. A pair
+        already in the url, as it is there or decoded, keeps its bytes,
+        any other is percent-encoded."""
+        found = {} # pair -> the indexes of the raw pairs it could be
+        for i, (name, value) in enumerate(self.pairs):
+            decoded = _unquote_query(name), _unquote_query(value)
+            for pair in set([(name, value), decoded]):
+                found.setdefault(pair, []).append(i)
+        used = set()
+        pieces = []
+        for name, value in pairs:
+            for i in found.get((name, value), ()):
+                if i not in used:
+                    used.add(i)
+                    pieces.append(self.raw[i])
+                    break
+            else:
+                pieces.append(_quote_query(name) +
+                              (value and "=" + _quote_query(value)))
+        query = "&".join(pieces)
+        return "{0}{1}{2}".format(
+            self.base, query and "?" + query or "",
+            self.fragment is not None and "#" + self.fragment or "")
+
+
 ###############################################################################
 # HAR Meta Classes
 ###############################################################################
 
 
+class _gc_paused(object):
+    """Turn the cyclic garbage collector off while a HAR is built.
+
+    Parent links are weak references, so a HAR tree has no reference
+    cycles and the collector would only walk it, over and over, as the
+    objects are allocated. It is turned back on once the outermost
+    load is done. Set PAUSE_GC_ON_LOAD to False to leave it alone."""
+
+    def __enter__(self):
+        self.paused = PAUSE_GC_ON_LOAD and gc.isenabled()
+        if self.paused:
+            gc.disable()
+
+    def __exit__(self, *exc_info):
+        if self.paused:
+            gc.enable()
+
+
+_CHILD_TYPES = {} # type -> whether values of that type are children
+# never written out as json, nor children
+_TRANSIENT = frozenset(["_parent", "_url", "_json", "_kids", "_shared"])
+
+
+def _is_child(value):
+    """Return whether `value` is a child of the object holding it,
+    that is another HAR object, a list, a dict, a string or an int.
+    The answer is cached by type so each field costs one lookup."""
+    kind = type(value)
+    try:
+        return _CHILD_TYPES[kind]
+    except KeyError:
+        child = issubclass(kind, (_MetaHar, list, unicode, dict, int, str))
+        _CHILD_TYPES[kind] = child
+        return child
+
+
+def _touched(obj):
+    """Call _touch unless `obj` is not part of anything and has nothing
+    memoized, as while it is being built."""
+    d = obj.__dict__
+    if d.get("_parent") is not None or "_json" in d or "_kids" in d:
+        _touch(obj)
+
+
+def _touch(obj):
+    """Forget what is memoized for `obj` and the json of everything it
+    is part of."""
+    d = obj.__dict__
+    d.pop("_kids", None)
+    while True:
+        d.pop("_json", None)
+        parent = d.get("_parent")
+        obj = parent and parent()
+        if obj is None:
+            return
+        d = obj.__dict__
+
+
+_JSON_KINDS = {} # type -> how _MetaHar._json_pieces treats its values
+_VALUE, _OBJECT, _LIST, _OPAQUE = range(1, 5) # all true
+
+
+def _json_kind(kind):
+    try:
+        return _JSON_KINDS[kind]
+    except KeyError:
+        if issubclass(kind, _MetaHar):
+            found = _OBJECT
+        elif kind is _HarList:
+            found = _LIST
+        elif issubclass(kind, (list, dict, _JsonBody)):
+            found = _OPAQUE # changes to it cannot be seen, or too large
+        else:
+            found = _VALUE
+        _JSON_KINDS[kind] = found
+        return found
+
+
+def _merged(pieces):
+    """Return `pieces` as one string in a list if they are short, so
+    small objects are not held as a lot of little strings."""
+    if len(pieces) > 1 and sum(map(len, pieces)) < MERGE_SIZE:
+        return ["".join(pieces)]
+    return pieces
+
+
+class _NotLeaves(Exception):
+    pass
+
+
+def _leaf_default(obj):
+    if isinstance(obj, datetime):
+        return _localize_datetime(obj).isoformat()
+    raise _NotLeaves() # a child, or a body too large to memoize
+
+
+# the types of the fields of an object with no children, _parent,
+# _json, _kids and _shared included
+_LEAF_TYPES = frozenset([str, unicode, int, long, float, bool, type(None),
+                         datetime, weakref.ref, tuple])
+_LEAVES = c_make_encoder and c_make_encoder(
+    None, _leaf_default, encode_basestring_ascii, None, ": ", ", ", False,
+    False, True)
+
+
+def _leaf_pieces(items, inline_bodies):
+    """Return the json of a list of objects without children of their
+    own, encoded in one go, or None if that is not what it is."""
+    dicts = []
+    leaf = _LEAF_TYPES.issuperset
+    for item in items:
+        if _json_kind(type(item)) is not _OBJECT or \
+           not leaf(map(type, item.__dict__.itervalues())) or \
+           "_shared" in item.__dict__:
+            return None
+        dicts.append(item._to_dict(inline_bodies))
+    try:
+        return ["".join(_LEAVES(dicts, 0))]
+    except _NotLeaves:
+        return None
+
+
+def _list_pieces(items, inline_bodies):
+    """Return the json of a _HarList as a list of strings, and whether
+    it may be memoized. The objects in it are only memoized one by one
+    if they have children."""
+    pieces = _LEAVES and _leaf_pieces(items, inline_bodies)
+    if pieces:
+        return pieces, True
+    pieces = ["["]
+    keep = True
+    for item in items:
+        if len(pieces) > 1:
+            pieces.append(", ")
+        kind = _json_kind(type(item))
+        if kind is _OBJECT:
+            more, kept = item._json_pieces(inline_bodies)
+            pieces.extend(more)
+            keep = keep and kept
+        else:
+            pieces.append(_ENCODERS[inline_bodies](item))
+            keep = keep and kind is _VALUE
+    pieces.append("]")
+    return _merged(pieces), keep
+
+
+def _adopt(owner, value, ref=None):
+    """Make `value` a child of `owner`. A child taken from another
+    object that still holds it is marked _shared: changes to it only
+    reach its last owner, so no object holding it memoizes its json."""
+    if isinstance(value, _MetaHar):
+        d = value.__dict__
+        old = d.get("_parent")
+        old = old and old()
+        if old is not None and old is not owner and _holds(old, value):
+            d["_shared"] = True
+            _touch(old)
+        d["_parent"] = ref or weakref.ref(owner)
+
+
+def _holds(owner, value):
+    for field in owner.__dict__.itervalues():
+        if field is value or type(field) is _HarList and \
+           any(item is value for item in field):
+            return True
+    return False
+
+
+class _HarList(list):
+    """A list of the children of a HAR object. Changing it counts as a
+    change to the object that owns it, and HAR objects put in it
+    become children of that object."""
+
+    __slots__ = ["_owner"]
+
+    def __init__(self, owner, items=()):
+        list.__init__(self, items)
+        self._owner = ref = weakref.ref(owner)
+        for item in self:
+            if isinstance(item, _MetaHar):
+                if item.__dict__.get("_parent") is None:
+                    item.__dict__["_parent"] = ref # freshly built
+                else:
+                    _adopt(owner, item, ref)
+
+    def _changed(self, items=()):
+        owner = self._owner()
+        if owner is not None:
+            for item in items:
+                _adopt(owner, item)
+            _touch(owner)
+
+    def __reduce__(self):
+        return list, (list(self),)
+
+    def append(self, item):
+        list.append(self, item)
+        self._changed((item,))
+
+    def extend(self, items):
+        items = list(items)
+        list.extend(self, items)
+        self._changed(items)
+
+    def insert(self, index, item):
+        list.insert(self, index, item)
+        self._changed((item,))
+
+    def __setitem__(self, index, value):
+        list.__setitem__(self, index, value)
+        self._changed(isinstance(index, slice) and value or (value,))
+
+    def __setslice__(self, i, j, items):
+        items = list(items)
+        list.__setslice__(self, i, j, items)
+        self._changed(items)
+
+    def __iadd__(self, items):
+        self.extend(items)
+        return self
+
+    def __imul__(self, n):
+        list.__imul__(self, n)
+        self._changed()
+        return self
+
+    def __delitem__(self, index):
+        list.__delitem__(self, index)
+        self._changed()
+
+    def __delslice__(self, i, j):
+        list.__delslice__(self, i, j)
+        self._changed()
+
+    def pop(self, *index):
+        item = list.pop(self, *index)
+        self._changed()
+        return item
+
+    def remove(self, item):
+        list.remove(self, item)
+        self._changed()
+
+    def reverse(self):
+        list.reverse(self)
+        self._changed()
+
+    def sort(self, *args, **kwargs):
+        list.sort(self, *args, **kwargs)
+        self._changed()
+
+
+
 class _MetaHar(object):
     """This is the base class that all HAR objects use. It defines
-    default methods and objects."""
+    default methods and objects.
+
+    Objects keep track of changes to themselves. Setting or deleting an
+    attribute, or changing a list held by one, forgets the memoized
+    json of the object and of every object above it, so to_json only
+    encodes again what changed since it last ran and takes the rest
+    from the memo. Lists set on an object become _HarLists for that,
+    and HAR objects set on one become its children. An object is the
+    child of the one it was last put in, put copies from `replace` in
+    to other trees rather than the object itself. An object put in a
+    second one while the first still holds it is shared, and the json
+    of neither is memoized from then on. Changes made to
+    __dict__, or inside a dict, are not seen, so objects holding dicts
+    or plain lists are encoded every time.
+
+    """
     # this needs to be a tree so child objects can validate that they
     # are uniq children
 
@@ -105,39 +1075,62 @@ class _MetaHar(object):
         for other objects. It should never be instantiated directly.
 
         """
-        assert not self.__class__ in [_MetaHar, _KeyValueHar], (
+        assert not self.__class__ in [_MetaHar, _KeyValueHar, _BodyHar], (
             "This is a meta class used to type other classes. "
             "To use this class create a new object that extends it")
-        self._parent = parent
+        # a weak reference, so the tree has no cycles for the gc to walk
+        self.__dict__["_parent"] = parent is not None and \
+                                   weakref.ref(parent) or None
         if init_from:
             #!!! there might be a better way to do this
             assert type(init_from) in [unicode, str, file, dict], (
                 "A har can only be initialized from a string, file "
                 "object, dict")
-            if type(init_from) in [unicode, str, file]:
-                if type(init_from) is unicode or type(init_from) is str:
-                    fd = StringIO(init_from)
+            with _gc_paused():
+                if type(init_from) in [unicode, str, file]:
+                    if type(init_from) is unicode or type(init_from) is str:
+                        fd = StringIO(init_from)
+                    else:
+                        fd = init_from
+                    self.from_json(fd.read())
+                    fd.close()
                 else:
-                    fd = init_from
-                self.from_json(fd.read())
-                fd.close()
-            else:
-                self.from_dict(init_from)
+                    self.from_dict(init_from)
         elif not empty:
             self.set_defaults()
 
+    @property
+    def parent(self):
+        """The object this one was built as a child of, or None."""
+        return self.__dict__.get("_parent") and self._parent()
+
     def __iter__(self):
         return (v for k, v in self.__dict__.iteritems()
-                 if k != "_parent" and
-                 (isinstance(v, _MetaHar)
-                  or isinstance(v, list)
-                  or isinstance(v, unicode)
-                  or isinstance(v, dict)
-                  or isinstance(v, int)
-                  or isinstance(v, str)))
+                if not k in _TRANSIENT and _is_child(v))
 
     def __contains__(self, obj):
-        return obj in self._get_printable_kids()
+        try:
+            value = self.__dict__[obj]
+        except (KeyError, TypeError):
+            return False
+        return not obj in _TRANSIENT and _is_child(value)
+
+    def __setattr__(self, name, value):
+        if type(value) is list or \
+           type(value) is _HarList and value._owner() is not self:
+            value = _HarList(self, value)
+        else:
+            _adopt(self, value)
+        object.__setattr__(self, name, value)
+        if name == "_blob": # a body in BODY_STORE, held while this is
+            BODY_STORE.hold(self, value)
+        _touched(self)
+
+    def __delattr__(self, name):
+        object.__delattr__(self, name)
+        if name == "_blob":
+            BODY_STORE.drop(self)
+        _touched(self)
 
     def __str__(self):
         return self.to_json()
@@ -161,14 +1154,12 @@ class _MetaHar(object):
         object on which the method is called.
 
         """
-        return tuple(str(k) for k, v in self.__dict__.iteritems()
-                 if (str(k) != "_parent" and
-                     (isinstance(v, _MetaHar) # !!! this is aweful
-                      or isinstance(v, list)  # all of this
-                      or isinstance(v, unicode)
-                      or isinstance(v, dict)  # needs to go
-                      or isinstance(v, int)
-                      or isinstance(v, str)))) or '(empty)'
+        kids = self.__dict__.get("_kids")
+        if kids is None:
+            kids = self.__dict__["_kids"] = tuple(
+                str(k) for k, v in self.__dict__.iteritems()
+                if not k in _TRANSIENT and _is_child(v)) or '(empty)'
+        return kids
 
     def replace(self, **kwarg):
         """Return a copy of the object with a varabile set to a value.
@@ -192,9 +1183,9 @@ class _MetaHar(object):
         request and modifying it to observe different results.
         """
         #I imagine this will get really confusing at some point
-        new_req = Request(self.to_json())
+        new_req = self.__class__(self.to_json())
         for key, value in kwarg.iteritems():
-            new_req.__dict__[key] = value
+            setattr(new_req, key, value)
         return new_req
 
     def get_children(self):
@@ -205,15 +1196,27 @@ class _MetaHar(object):
         return [kid for kid in self] # this comes from
                                        # _get_printable_kids()
 
+    def _to_dict(self, inline_bodies=True):
+        """Return the dictionary HarEncoder writes out for this
+        object."""
+        har = self.__dict__.copy()
+        for key in _TRANSIENT:
+            har.pop(key, None)
+        return har
+
     def from_json(self, json_data):
         json_data = json.loads(json_data)
         self.from_dict(json_data) #get first element
 
+    # dates are parsed through here so stats can time them
+    _parse_date = staticmethod(parser.parse)
+
     def from_dict(self, json_dict):
         assert type(json_dict) is dict, "from_dict must be passed a dictionary"
         self.__dict__.update(json_dict)
         self.validate_input()
         self._construct()
+        _touched(self)
 
     def _construct(self):
         #when constructing child objects, pass self so parent hierachy
@@ -226,11 +1229,81 @@ class _MetaHar(object):
         also be used to reset a har to a default state."""
         pass
 
-    def to_json(self):
+    def to_json(self, inline_bodies=True):
+        """Return the object as json. Bodies held in the body store are
+        written out in full unless `inline_bodies` is False, in which
+        case only their digest is written as "_blob"."""
         #return json.dumps(self, indent=4, cls=HarEncoder)
         ## for now we're going to use line return as a deleniator
         ## later we'll write a json stream parser
-        return json.dumps(self, indent=None, cls=HarEncoder)
+        with _gc_paused(): # the memo is a lot of lists, see _gc_paused
+            return "".join(self._json_pieces(bool(inline_bodies))[0])
+
+    def _json_pieces(self, inline_bodies):
+        """Return the json of the object as a list of strings, and
+        whether it may be memoized.
+
+        The fields of the object are encoded in one go, with each child
+        standing in as a marker that is then cut out and replaced by
+        the pieces of the child. The list is kept as "_json" until the
+        object changes.
+
+        """
+        d = self.__dict__
+        memo = d.get("_json")
+        if memo is not None and memo[0] is inline_bodies:
+            return memo[1], not "_shared" in d
+        har = self._to_dict(inline_bodies)
+        children = []
+        keep = True
+        kinds = _JSON_KINDS
+        for key, value in har.iteritems():
+            kind = kinds.get(type(value)) or _json_kind(type(value))
+            if kind is _VALUE:
+                continue
+            elif kind is _OBJECT:
+                pieces, kept = value._json_pieces(inline_bodies)
+            elif kind is _LIST:
+                pieces, kept = _list_pieces(value, inline_bodies)
+            else:
+                keep = False
+                continue
+            keep = keep and kept
+            children.append(pieces)
+            har[key] = "\0{0}".format(len(children) - 1)
+        text = _ENCODERS[inline_bodies](har)
+        if not children:
+            pieces = [text]
+        else:
+            parts = CHILD_MARKER.split(text)
+            if parts[1::2] != [str(i) for i in xrange(len(children))]:
+                # a value of the object looked like a marker
+                return [json.dumps(self, cls=HarEncoder,
+                                   inline_bodies=inline_bodies)], False
+            pieces = [parts[0]]
+            for child, after in zip(children, parts[2::2]):
+                pieces.extend(child)
+                pieces.append(after)
+            pieces = _merged(pieces)
+        if keep:
+            d["_json"] = (inline_bodies, pieces)
+        return pieces, keep and not "_shared" in d
+
+    def dump(self, fd, inline_bodies=True):
+        """Write the object as json to the file like object `fd`. This is
+        the same as writing out to_json() except that bodies spilled to
+        disk are streamed in to `fd` instead of being read in to
+        memory."""
+        encoder = HarEncoder(inline_bodies=inline_bodies, stream_bodies=True)
+        for chunk in encoder.iterencode(self):
+            body = encoder.streamed.pop(chunk, None)
+            if body is None:
+                fd.write(chunk)
+                continue
+            fd.write('"')
+            for text in body.chunks():
+                fd.write(encode_basestring_ascii(text)[1:-1])
+            fd.write('"')
 
     def validate_input(self): #default behavior
         # change this to a couple of class vars
@@ -244,7 +1317,7 @@ class _MetaHar(object):
     def _has_fields(self, *fields):
         for field in fields:
             if not field in self.__dict__:
-                raise MissingValueException(field, self.__class__.__name__)
+                raise MissingValue(field, self.__class__.__name__)
 
     def _check_field_types(self, field_defs):
         for fname, ftype in field_defs.iteritems():
@@ -253,6 +1326,10 @@ class _MetaHar(object):
                     assert type(self.__dict__[fname]) in ftype, (
                         "{0} failed '{1}' must be one of types: {2}"
                         .format(self.__class__.__name__, fname, ftype))
+                elif ftype is list: # a _HarList once the object is built
+                    assert isinstance(self.__dict__[fname], list), (
+                        "{0} failed '{1}' must be of type: {2}"
+                        .format(self.__class__.__name__, fname, ftype))
                 else:
                     assert type(self.__dict__[fname]) is ftype, (
                         "{0} failed '{1}' must be of type: {2}"
@@ -294,3 +1371,215 @@ class _KeyValueHar(_MetaHar):
 
 
 #------------------------------------------------------------------------------
+
+
+class _BodyHar(_MetaHar):
+    """Meta class for objects that carry a message body as "text"
+    (Content and PostData).
+
+    The body is handed to BODY_STORE and only its digest is kept as
+    "_blob". A body devoured from a raw message is stored as the raw
+    bytes, usually a buffer in to the original message, and is only
+    turned in to utf8 text or base64 when it is written out as json.
+    Text loaded from json is kept exactly as it was loaded.
+
+    """
+
+    def _construct(self):
+        if "text" in self.__dict__:
+            self._blob = BODY_STORE.put(self.__dict__.pop("text"))
+        elif "_blob" in self.__dict__: # loaded from json that refers to it
+            BODY_STORE.hold(self, self._blob)
+
+    def _validate_blob(self):
+        if "_blob" in self.__dict__ and not "text" in self.__dict__ \
+           and not self._blob in BODY_STORE:
+            raise ValidationError("{0} body {1} is not in the body "
+                                  "store".format(self.__class__.__name__,
+                                                 self._blob))
+
+    def _get_text(self):
+        if not "_blob" in self.__dict__:
+            raise AttributeError("'{0}' object has no attribute "
+                                 "'text'".format(self.__class__.__name__))
+        return BODY_STORE.get(self._blob)
+
+    def _set_text(self, text):
+        self._blob = BODY_STORE.put(text)
+
+    def _del_text(self):
+        del self._blob
+
+    text = property(_get_text, _set_text, _del_text)
+
+    @property
+    def body(self):
+        """The body as raw bytes, the way it goes over the wire. Large
+        bodies are returned as a FileBody."""
+        body = self._get("text", "")
+        if self._get("encoding", None) == "base64":
+            if isinstance(body, FileBody):
+                return body.b64decoded()
+            return b64decode(body)
+        if isinstance(body, unicode):
+            return body.encode('utf8')
+        return body
+
+    def _to_dict(self, inline_bodies=True):
+        har = _MetaHar._to_dict(self)
+        if inline_bodies and "_blob" in har:
+            _inline_body(har, "text")
+        return har
+
+
+#------------------------------------------------------------------------------
+
+
+###############################################################################
+# Stats
+###############################################################################
+
+# Counters are only kept while stats are enabled. Enabling swaps
+# instrumented versions of from_json, from_dict, devour and date
+# parsing in to the classes and disabling swaps the originals back, so
+# there is no cost at all when stats are off.
+
+_STATS = {}
+_STACK = [] # time spent building children, so construct time is exclusive
+_ORIGINALS = {}
+
+
+def _counter(obj):
+    name = obj.__class__.__name__
+    try:
+        return _STATS[name]
+    except KeyError:
+        _STATS[name] = counter = {"instances": 0,
+                                  "bytes": 0,
+                                  "decode": 0.0,
+                                  "validate": 0.0,
+                                  "construct": 0.0,
+                                  "devour": 0.0}
+        return counter
+
+
+def _charge_parent(seconds):
+    if _STACK:
+        _STACK[-1] += seconds
+
+
+def _counted_from_json(self, json_data):
+    counter = _counter(self)
+    counter["bytes"] += len(json_data)
+    start = _clock()
+    json_data = json.loads(json_data)
+    counter["decode"] += _clock() - start
+    self.from_dict(json_data)
+
+
+def _counted_from_dict(self, json_dict):
+    assert type(json_dict) is dict, "from_dict must be passed a dictionary"
+    counter = _counter(self)
+    counter["instances"] += 1
+    self.__dict__.update(json_dict)
+    start = _clock()
+    self.validate_input()
+    validated = _clock()
+    _STACK.append(0.0)
+    try:
+        self._construct()
+    finally:
+        children = _STACK.pop()
+    end = _clock()
+    counter["validate"] += validated - start
+    counter["construct"] += end - validated - children
+    _charge_parent(end - start)
+    _touched(self)
+
+
+def _counted_parse_date(value):
+    start = _clock()
+    try:
+        return parser.parse(value)
+    finally:
+        seconds = _clock() - start
+        _STATS.setdefault("dates", {"count": 0, "seconds": 0.0})
+        _STATS["dates"]["count"] += 1
+        _STATS["dates"]["seconds"] += seconds
+        _charge_parent(seconds)
+
+
+def _counted_devour(devour):
+    def counted(self, raw, *args, **kwargs):
+        counter = _counter(self)
+        counter["bytes"] += len(raw)
+        start = _clock()
+        try:
+            return devour(self, raw, *args, **kwargs)
+        finally:
+            seconds = _clock() - start
+            counter["devour"] += seconds
+            _charge_parent(seconds)
+    counted.__doc__ = devour.__doc__
+    return counted
+
+
+def _subclasses(cls):
+    for sub in cls.__subclasses__():
+        yield sub
+        for subsub in _subclasses(sub):
+            yield subsub
+
+
+def enable_stats():
+    """Start counting, per class, the objects built and the time spent
+    decoding json, validating, constructing, parsing dates and
+    devouring. See `stats`."""
+    if _ORIGINALS:
+        return
+    _ORIGINALS[(_MetaHar, "from_json")] = _MetaHar.__dict__["from_json"]
+    _ORIGINALS[(_MetaHar, "from_dict")] = _MetaHar.__dict__["from_dict"]
+    _ORIGINALS[(_MetaHar, "_parse_date")] = _MetaHar.__dict__["_parse_date"]
+    _MetaHar.from_json = _counted_from_json
+    _MetaHar.from_dict = _counted_from_dict
+    _MetaHar._parse_date = staticmethod(_counted_parse_date)
+    for cls in _subclasses(_MetaHar):
+        if "devour" in cls.__dict__:
+            _ORIGINALS[(cls, "devour")] = cls.__dict__["devour"]
+            cls.devour = _counted_devour(cls.__dict__["devour"])
+
+
+def disable_stats():
+    """Stop counting. The counts so far are kept."""
+    for (cls, name), original in _ORIGINALS.iteritems():
+        setattr(cls, name, original)
+    _ORIGINALS.clear()
+
+
+def reset_stats():
+    _STATS.clear()
+
+
+def stats():
+    """Return a snapshot of the counters as a dictionary keyed by class
+    name. Times are in seconds and construct times do not include the
+    time spent building child objects::
+
+        In [0]: enable_stats()
+
+        In [1]: hc = HarContainer(open('google.har'))
+
+        In [2]: stats()['Entry']
+        Out[2]: {'instances': 104, 'bytes': 0, 'decode': 0.0,
+                 'validate': 0.0013, 'construct': 0.0009,
+                 'devour': 0.0}
+
+    Date parsing is counted once for all classes under 'dates'. Stats
+    can also be turned on for a whole run by setting HARPY_STATS in the
+    environment.
+    """
+    return dict((name, dict(counter)) for name, counter in _STATS.iteritems())
+
+
+if os.environ.get("HARPY_STATS"):
+    enable_stats()
@@ -164,6 +164,8 @@ bug report.
 """
 
 from StringIO import StringIO
+from base64 import b64decode
+from cStringIO import StringIO as _BytesIO
 from socket import inet_pton, AF_INET6, AF_INET #used to validate ip addresses
 from socket import error as socket_error #used to validate ip addresses
 from urllib2 import urlopen #this should be removed
@@ -176,6 +178,11 @@ except ImportError:
     raise
 
 from _internal import _MetaHar, _KeyValueHar, _localize_datetime, MissingValue, ValidationError, InvalidChild, now
+from _internal import MissingValueException
+from _internal import _BodyHar, HarEncoder, BlobStore, BODY_STORE, FileBody
+from _internal import _write_body, _Url, _inline_body, _HarList
+from _internal import _boundary, _parse_multipart, _MultipartBody
+from _internal import stats, enable_stats, disable_stats, reset_stats
 
 ##############################################################################
 # Constants
@@ -233,8 +240,26 @@ class Log(_MetaHar):
         if "browser" in self.__dict__:
             self.browser = Browser(self.browser)
         if "pages" in self.__dict__:
-            self.pages = [Page(page) for page in self.pages]
-        self.entries = [Entry(entry) for entry in self.entries]
+            self.pages = [Page(page, self) for page in self.pages]
+        self.entries = [Entry(entry, self) for entry in self.entries]
+
+    def timings_frame(self):
+        """Return a utils.timings.TimingsFrame of the entries, for
+        percentiles and rankings of their timings. Needs NumPy."""
+        try:
+            from .utils.timings import TimingsFrame
+        except ValueError: # not imported as part of a package
+            from utils.timings import TimingsFrame
+        return TimingsFrame(self.entries)
+
+    def waterfall(self):
+        """Return a utils.waterfall.Waterfall of the entries, to look at
+        how each page loaded."""
+        try:
+            from .utils.waterfall import Waterfall
+        except ValueError: # not imported as part of a package
+            from utils.waterfall import Waterfall
+        return Waterfall(self.entries, self._get("pages", None))
 
     def set_defaults(self):
         """This method sets defaults for objects not instantiated via
@@ -310,13 +335,13 @@ class Page(_MetaHar):
                       "id": [unicode, str],
                       "title": [unicode, str]}
         if "comment" in self.__dict__:
-            field_types["comment"] = [unicode, str]
+            field_defs["comment"] = [unicode, str]
         self._check_field_types(field_defs)
         #make sure id is uniq
 
     def _construct(self):
         try:
-            self.startedDateTime = parser.parse(self.startedDateTime)
+            self.startedDateTime = self._parse_date(self.startedDateTime)
         except Exception, err:
             raise ValidationError("Failed to parse date: {0}".format(err))
         self.pageTimings = PageTimings(self.pageTimings)
@@ -380,8 +405,8 @@ class Entry(_MetaHar):
         if "connection" in self:
             field_defs["connection"] = [unicode, str]
         self._check_field_types(field_defs)
-        if "pageref" in self and "_parent" in self and self._parent:
-            for entry in self._parent.entries: #write a test case for this
+        if "pageref" in self and "_parent" in self and self.parent:
+            for entry in self.parent.entries: #write a test case for this
                 if entry.pageref == self.pageref:
                     raise ValidationError("Entry pageref {0} must be uniq, "
                                           "but it is not".format(self.pageref))
@@ -441,6 +466,13 @@ class Request(_MetaHar):
         self._check_field_types(field_defs)
 
     def _construct(self):
+        self.__dict__.pop("_url", None)
+        if "queryString" in self.__dict__:
+            query = [ QueryString(param)
+                      for param in self.__dict__["queryString"] ]
+            if all('_sequence' in param for param in query):
+                query.sort(key=lambda i: i._sequence)
+            self.__dict__["queryString"] = _HarList(self, query)
         if "postData" in self.__dict__:
             self.postData = PostData(self.postData)
         if "headers" in self.__dict__:
@@ -503,6 +535,93 @@ class Request(_MetaHar):
             self._get("url"),
             self._get_printable_kids())
 
+    def _sync_url(self):
+        """Bring url and queryString in line with each other and return
+        the parsed url, or None if there is no url.
+
+        The url is parsed once and kept with the queryString pairs it
+        matches. If the url has been set since, queryString is parsed
+        from it again. If queryString has been changed instead, the
+        query string of the url is written from it, pairs that were
+        already in the url keeping their bytes and new values being
+        percent-encoded. A url loaded with a queryString of its own,
+        even an empty one, keeps that queryString as it is.
+
+        """
+        d = self.__dict__
+        url = d.get("url")
+        if url is None:
+            return None
+        parsed = d.get("_url")
+        query = d.get("queryString")
+        if parsed is None or parsed.text != url:
+            fresh = _Url(url)
+            if parsed is not None or query is None:
+                query = d["queryString"] = _HarList(self, [
+                    QueryString({"name": name, "value": value,
+                                 "_sequence": seq})
+                    for seq, (name, value) in enumerate(fresh.pairs) ])
+            parsed = d["_url"] = fresh
+        else:
+            sent = [ (q.name, q.value) for q in query or [] ]
+            if sent == parsed.sent:
+                return parsed
+            parsed = d["_url"] = _Url(parsed.with_pairs(sent))
+            d["url"] = parsed.text
+        parsed.sent = [ (q.name, q.value) for q in query or [] ]
+        return parsed
+
+    def _get_url(self):
+        if not "url" in self.__dict__:
+            raise AttributeError("'Request' object has no attribute 'url'")
+        return self._sync_url().text
+
+    def _set_url(self, url):
+        self.__dict__["url"] = url
+
+    def _del_url(self):
+        del self.__dict__["url"]
+
+    url = property(_get_url, _set_url, _del_url)
+
+    def _get_query_string(self):
+        self._sync_url()
+        try:
+            return self.__dict__["queryString"]
+        except KeyError:
+            raise AttributeError("'Request' object has no attribute "
+                                 "'queryString'")
+
+    def _set_query_string(self, query):
+        self.__dict__["queryString"] = query # a _HarList by __setattr__
+
+    def _del_query_string(self):
+        del self.__dict__["queryString"]
+
+    queryString = property(_get_query_string, _set_query_string,
+                           _del_query_string)
+
+    @property
+    def parsed_url(self):
+        """The url split in to scheme, host, port, path, query,
+        fragment and the target of the request line. It is parsed
+        once and again only after url or queryString change."""
+        return self._sync_url()
+
+    def _to_dict(self, inline_bodies=True):
+        self._sync_url()
+        return _MetaHar._to_dict(self, inline_bodies)
+
+    def replace(self, **kwarg):
+        """See _MetaHar.replace. The copy's url is parsed before
+        anything is set on it, so a new url is seen as a change and
+        queryString follows it."""
+        new_req = _MetaHar.replace(self)
+        new_req._sync_url()
+        for key, value in kwarg.iteritems():
+            setattr(new_req, key, value)
+        return new_req
+
     def devour(self, req, proto='http', comment='', keep_b64_raw=False):
         # Raw request does not have proto info
         assert len(req.strip()), "Empty request cannot be devoured"
@@ -518,6 +637,7 @@ class Request(_MetaHar):
                                                      #
                                                      #This is not default
         req = StringIO(req)
+        self.__dict__.pop("_url", None)
         #!!! this doesn't always happen
         method, path, httpVersion = req.next().strip().split()
         #some people ignore the spec, this needs to be handled.
@@ -525,12 +645,14 @@ class Request(_MetaHar):
         self.httpVersion = httpVersion
         self.bodySize = 0
         self.headers = []
+        self.__dict__.pop("queryString", None) # filled in from the url
         postData = None
         if method == "POST":
             postData = {"params": [],
                         "mimeType": "",
                         "text": ""}
         seq = 0
+        placed = [] # the body headers taken out, to be put back by puke
         for header in req: #make these the same for request and
                            #response... this is stupid
             header = header.strip()
@@ -540,39 +662,71 @@ class Request(_MetaHar):
             #length should be calculated for each request unless
             #explicitly set.
             #!!! remember to note this in docs so it's no suprise.
-            if header["name"] == "Content-Length":
-                self.bodySize = header["value"]
+            if header["name"].lower() == "content-length":
+                self.bodySize = int(header["value"])
+                placed.append([header["name"], seq])
                 continue
-            if header["name"] == "Content-Type":
+            if header["name"].lower() == "content-type" and postData:
                 postData["mimeType"] = header["value"]
+                placed.append([header["name"], seq])
                 continue
             if header["name"] == "Host":
                 self.url = '{0}://{1}{2}'.format(proto, header["value"], path)
             header["_sequence"] = seq
             self.headers.append(Header(header))
             seq += 1
-        headerSize = req.tell()
-        seq = 0
+        if "://" in path.split("?")[0]: #absolute form, as sent to proxies
+            self.url = path
+        self._body_headers = placed
+        if self._sync_url() is None: # no url to fill queryString in from
+            self.queryString = []
+        self.headersSize = req.tell()
         if postData:
-            body = req.read(int(self.bodySize))
-            if postData["mimeType"] == "application/x-www-form-urlencoded":
-                seq = 0
-                for param in body.split('&'):
-                    if "=" in param:
-                        name, value = param.split('=', 1) #= is a valid
-                                                          #character in
-                                                          #values
-                    else:
-                        name = param
-                        value = ""
-                    param = {"name": name, "value": value}
-                    # build unit test for empty values
-                    param["_sequence"] = seq
-                    postData["params"].append(param)
-                    seq += 1
-            else:
-                postData["text"] = body
             self.postData = PostData(postData)
+            self.set_body(_body_slice(req.getvalue(), self.headersSize,
+                                      self.bodySize))
+
+    def set_body(self, body):
+        """Set the body of the request from raw bytes. Form encoded
+        and multipart/form-data bodies are split in to params, anything
+        else is kept as the postData text. File parts of a multipart
+        body go to the body store, without being copied."""
+        if not "postData" in self:
+            self.postData = PostData({"params": [],
+                                      "mimeType": "",
+                                      "text": ""})
+        self.postData.params = []
+        boundary = _boundary(self.postData.mimeType)
+        if self.postData.mimeType == "application/x-www-form-urlencoded":
+            seq = 0
+            for param in str(body).split('&'):
+                if "=" in param:
+                    name, value = param.split('=', 1) #= is a valid
+                                                      #character in
+                                                      #values
+                else:
+                    name = param
+                    value = ""
+                param = {"name": name, "value": value}
+                # build unit test for empty values
+                param["_sequence"] = seq
+                self.postData.params.append(Param(param))
+                seq += 1
+        elif boundary:
+            for seq, (name, fileName, contentType, headers, content) in \
+                    enumerate(_parse_multipart(body, boundary) or []):
+                param = {"name": name, "_sequence": seq}
+                if fileName is None:
+                    param["value"] = str(content)
+                else:
+                    param["fileName"] = fileName
+                    param["_blob"] = BODY_STORE.put(content)
+                if contentType is not None:
+                    param["contentType"] = contentType
+                if headers:
+                    param["_headers"] = headers
+                self.postData.params.append(Param(param))
+        self.postData.text = not self.postData.params and body or ""
 
     def render(self):
         """Return a string that should be exactly equal to the
@@ -587,33 +741,49 @@ class Request(_MetaHar):
         if you think your boss might yell at you.
 
         """
+        fd = _BytesIO()
+        self.puke_to(fd)
+        return fd.getvalue()
+
+    def puke_to(self, fd):
+        """Write the raw request to the file like object `fd`. The body
+        is written straight from the body store without being copied.
+
+        """
+        d = self.__dict__
         for node in ["url", "httpVersion", "headers"]:
-            assert node in self, \
+            assert node in d, \
                    "Cannot render request with unspecified {0}".format(node)
-        path = '/' + '/'.join(self.url.split("/")[3:]) #this kind of sucks....
-        #this really sucks... do this smarter
-        r = "{0} {1} {2}\r\n".format(self.method, path, self.httpVersion)
-        #!!! not always clear in code where to use self vs self.__dict__
-        #!!! need to fix things so always use one or the other, or is clear
-        if self.headers: #this should be header.puke()
-            #these may need to be capitalized. should be fixed in spec.
-            r += "\r\n".join( h.name + ": " + h.value
-                              for h in self.headers)
-            r += "\r\n"
+        # the url is only parsed again if it or queryString changed
+        lines = ["{0} {1} {2}".format(self.method, self._sync_url().target,
+                                      self.httpVersion)]
         body = ''
-        if 'postData' in self and self.postData:
-            if not "Content-Type" in self.headers:
-                r += "Content-Type: {0}\r\n".format(self.postData.mimeType)
-            joined_params = "&".join( p.name + (p.value and ("=" + p.value))
-                                      for p in self.postData.params)
-            body = self.postData.text or joined_params
-            if not "Content-Length" in self.headers:
-                r += "Content-Length: {0}\r\n".format(len(body))
-        r += "\r\n"
-        r += body
+        postData = d.get("postData")
+        header_names = set(h.name.lower() for h in d["headers"])
+        framing = []
+        if postData:
+            if not "content-type" in header_names:
+                framing.append(("Content-Type", postData.mimeType))
+            body = postData.body
+            if not body:
+                boundary = _boundary(postData.mimeType)
+                if boundary and postData.params:
+                    body = _MultipartBody(postData.params, boundary)
+                else:
+                    body = "&".join( p.name + (p.value and ("=" + p.value))
+                                     for p in postData.params)
+        if not "content-length" in header_names and \
+           (postData or _placed(d.get("_body_headers"), "Content-Length")):
+            framing.append(("Content-Length", str(len(body))))
+        #these may need to be capitalized. should be fixed in spec.
+        lines.extend(_header_lines(d["headers"], d.get("_body_headers"),
+                                   framing))
+        lines.append("\r\n")
+        r = "\r\n".join(lines)
+        fd.write(r)
         if body:
-            r += "\r\n"
-        return r
+            _write_body(fd, body)
+            fd.write("\r\n")
 
 
 #------------------------------------------------------------------------------
@@ -658,6 +828,8 @@ class Response(_MetaHar):
             self.headers = [ Header(header) for header in self.headers]
         if "cookies" in self:
             self.cookies = [ Cookie(cookie) for cookie in self.cookies]
+        if "content" in self:
+            self.content = Content(self.content)
 
     def devour(self, res, proto='http', comment='', keep_b64_raw=False):
         # Raw response does not have proto info
@@ -672,7 +844,7 @@ class Response(_MetaHar):
         res = StringIO(res)
         line = res.next().strip().split()
         httpVersion = line[0]
-        status = line[1]
+        status = int(line[1])
         statusText = " ".join(line[2:])
         self.status = status
         self.statusText = statusText
@@ -680,7 +852,9 @@ class Response(_MetaHar):
         self.bodySize = 0
         self.headers = []
         self.cookies = []
+        self.redirectURL = ""
         seq = 0
+        placed = [] # the body headers taken out, to be put back by puke
         encoding = None
         content = {"size": 0,
                    "mimeType": ""}
@@ -689,12 +863,14 @@ class Response(_MetaHar):
             if not ( line and ": " in line):
                 break
             header = dict(zip(["name", "value"], line.strip().split(': ')))
-            if header["name"] == "Content-Length":
-                self.bodySize = header["value"]
+            if header["name"].lower() == "content-length":
+                self.bodySize = int(header["value"])
+                placed.append([header["name"], seq])
                 continue
-            elif header["name"] == "Content-Type":
+            elif header["name"].lower() == "content-type":
                 # will need to keep an eye out for content type and encoding
                 content["mimeType"] = header["value"]
+                placed.append([header["name"], seq])
                 continue
             elif header["name"] == "Host":
                 self.url = '{0}://{1}{2}'.format(proto, header["value"], path)
@@ -707,14 +883,19 @@ class Response(_MetaHar):
             header["_sequence"] = seq
             self.headers.append(Header(header))
             seq += 1
-        self.headerSize = res.tell()
-        content["text"] = res.read(int(self.bodySize))
-        try:
-            content["text"] = content["text"].encode('utf8')
-        except UnicodeDecodeError:
-            content["text"] = content["text"].encode('base64')
-            content["encoding"] = "base64"
+        self._body_headers = placed
+        self.headersSize = res.tell()
         self.content = Content(content)
+        self.set_body(_body_slice(res.getvalue(), self.headersSize,
+                                  self.bodySize))
+
+    def set_body(self, body):
+        """Set the body of the response from raw bytes. The body is kept
+        as it is, it is only encoded when written out as json."""
+        if not "content" in self:
+            self.content = Content({"size": 0, "mimeType": ""})
+        self.content.text = body
+        self.content.size = len(body)
 
     def render(self):
         """Return a string that should be exactly equal to the
@@ -728,6 +909,15 @@ class Response(_MetaHar):
         The 'render' method calls this method, it can be used instead
         if you think your boss might yell at you.
 
+        """
+        fd = _BytesIO()
+        self.puke_to(fd)
+        return fd.getvalue()
+
+    def puke_to(self, fd):
+        """Write the raw response to the file like object `fd`. The body
+        is written straight from the body store without being copied.
+
         """
         for node in ["httpVersion", "status", "statusText"]:
             assert node in self, \
@@ -735,23 +925,26 @@ class Response(_MetaHar):
         r = "{0} {1} {2}\r\n".format(self.httpVersion,
                                      self.status,
                                      self.statusText)
-        if self.headers: #this should be header.puke()
-            r += "\r\n".join( h.name + ": " + h.value
-                            for h in self.headers)
-            if self.content and self.content["size"] and \
-               not "Content-Length" in [ h.name for
-                                         h in self.headers ]:
-                r += "Content-Length: %d\r\n" % self.content["size"]
-            r += "\r\n"
-            r += "\r\n"
-        if "content" in self and self.content:
-            encoding = self.content.get('encoding')
-            body = self.content.get('text')
-            if body:
-                if encoding:
-                    body = body.decode(encoding)
-                r += body.decode('latin1')
-        return r
+        body = ''
+        if "content" in self:
+            body = self.content.body
+        headers = self._get("headers", [])
+        placed = self._get("_body_headers", None)
+        header_names = set(h.name.lower() for h in headers)
+        framing = []
+        if "content" in self and self.content._get("mimeType", None) and \
+           not "content-type" in header_names:
+            framing.append(("Content-Type", self.content.mimeType))
+        if not "content-length" in header_names and \
+           (_placed(placed, "Content-Length") or
+            body and not "transfer-encoding" in header_names):
+            framing.append(("Content-Length", str(len(body))))
+        for line in _header_lines(headers, placed, framing):
+            r += line + "\r\n" #this should be header.puke()
+        r += "\r\n"
+        fd.write(r)
+        if body:
+            _write_body(fd, body)
 
 #------------------------------------------------------------------------------
 
@@ -777,7 +970,7 @@ class Cookie(_MetaHar):
     def _construct(self):
         if "expires" in self:
             try:
-                self.expires = parser.parse(self.expires)
+                self.expires = self._parse_date(self.expires)
             except Exception, err:
                 raise ValidationError("Failed to parse date: {0}".format(err))
 
@@ -824,18 +1017,22 @@ class QueryString(_KeyValueHar):
 #------------------------------------------------------------------------------
 
 
-class PostData(_MetaHar):
+class PostData(_BodyHar):
 
     def validate_input(self):
         field_types = {"mimeType": [unicode, str],
-                       "params": list,
-                       "text": [unicode, str]}
+                       "params": list}
         self._has_fields(*field_types.keys())
-        if "comment" in self.__dict__:
-            field_types["comment"] = [unicode, str]
+        if not "_blob" in self.__dict__:
+            self._has_fields("text")
+        for field in ["text", "encoding", "comment", "_blob"]:
+            if field in self.__dict__:
+                field_types[field] = [unicode, str]
         self._check_field_types(field_types)
+        self._validate_blob()
 
     def _construct(self):
+        _BodyHar._construct(self)
         if "params" in self.__dict__:
             self.params = [ Param(param) for param in self.params]
             if all('_sequence' in param for param in self.params):
@@ -850,14 +1047,41 @@ class Param(_KeyValueHar):
     def validate_input(self): #default behavior
         field_types = {"name": [unicode, str]}
         self._has_fields(*field_types.keys())
-        for field in ["value", "fileName", "contentType", "comment"]:
+        for field in ["value", "fileName", "contentType", "comment",
+                      "encoding", "_blob"]:
             if field in self.__dict__:
                 field_types[field] = [unicode, str]
+        if "value" in field_types: # _construct sets a missing value to None
+            field_types["value"].append(type(None))
         self._check_field_types(field_types)
+        if "_blob" in self.__dict__ and not self._blob in BODY_STORE:
+            raise ValidationError("Param file {0} is not in the body "
+                                  "store".format(self._blob))
 
     def _construct(self):
         if not "value" in self:
             self.value = None
+        if "_blob" in self.__dict__:
+            BODY_STORE.hold(self, self._blob)
+
+    @property
+    def body(self):
+        """The value, or the contents of the file of a file part, as
+        raw bytes. Large files are returned as a FileBody."""
+        if "_blob" in self.__dict__:
+            return BODY_STORE.get(self._blob)
+        value = self.value or ""
+        if self._get("encoding", None) == "base64":
+            return b64decode(value)
+        if isinstance(value, unicode):
+            return value.encode('utf8')
+        return value
+
+    def _to_dict(self, inline_bodies=True):
+        har = _MetaHar._to_dict(self)
+        if inline_bodies and "_blob" in har:
+            _inline_body(har, "value")
+        return har
 
     def __repr__(self):
         return "<{0} {1}: {2}>".format(
@@ -869,7 +1093,7 @@ class Param(_KeyValueHar):
 #------------------------------------------------------------------------------
 
 
-class Content(_MetaHar):
+class Content(_BodyHar):
 
     def validate_input(self):
         self._has_fields("size",
@@ -878,10 +1102,11 @@ class Content(_MetaHar):
                       "mimeType": [unicode, str]}
         if "compression" in self.__dict__:
             field_types["compression"] = int
-        for field in ["text", "encoding", "comment"]:
+        for field in ["text", "encoding", "comment", "_blob"]:
             if field in self.__dict__:
                 field_types[field] = [unicode, str]
         self._check_field_types(field_types)
+        self._validate_blob()
 
     def __repr__(self):
         return "<Content {0}>".format(self.mimeType)
@@ -948,6 +1173,42 @@ class Timings(_MetaHar):
 ###############################################################################
 
 
+def _placed(placed, name):
+    """Return the [name, position] devour took the header `name` out
+    of the headers at, or None."""
+    for spot in placed or []:
+        if spot[0].lower() == name.lower():
+            return spot
+    return None
+
+
+def _header_lines(headers, placed, framing):
+    """Return the header lines for `headers`, with the (name, value)
+    pairs in `framing` put back where devour took them out, as listed
+    in `placed`. Those devour did not see go after the rest."""
+    placed = placed or []
+    lines = [h.name + ": " + h.value for h in headers]
+    spots = []
+    for i, (name, value) in enumerate(framing):
+        spot = _placed(placed, name)
+        if spot is None:
+            spots.append((len(headers), len(placed) + i, name, value))
+        else:
+            spots.append((min(spot[1], len(headers)), placed.index(spot),
+                          spot[0], value))
+    for at, _, name, value in sorted(spots, reverse=True):
+        lines.insert(at, name + ": " + value)
+    return lines
+
+
+def _body_slice(raw, offset, size):
+    """Return `size` bytes of `raw` starting at `offset` without copying
+    them."""
+    if isinstance(raw, unicode):
+        return raw[offset:offset + size]
+    return buffer(raw, offset, size)
+
+
 def test():
     for i in ['http://demo.ajaxperformance.com/har/espn.har',
               'http://demo.ajaxperformance.com/har/google.har']:
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+import unittest
+
+from sys import path
+
+path.append('./')
+path.append('../')
+import har
+from utils.cookie_jar import CookieJar, _registrable
+
+NOW = 1356998400000.0 # 2013-01-01
+
+
+def _response(*set_cookies):
+    response = har.Response(empty=True)
+    response.devour("HTTP/1.1 200 OK\r\n" +
+                    "".join("Set-Cookie: {0}\r\n".format(c)
+                            for c in set_cookies) +
+                    "Content-Length: 0\r\n\r\n")
+    return response
+
+
+def _names(cookies):
+    return [cookie.name for cookie in cookies]
+
+
+class TestCookieJar(unittest.TestCase):
+
+    def setUp(self):
+        self.jar = CookieJar()
+
+    def ingest(self, url, *set_cookies):
+        return self.jar.ingest(_response(*set_cookies), url, NOW)
+
+    def test_registrable(self):
+        self.assertEqual("example.com", _registrable("a.b.example.com"))
+        self.assertEqual("example.co.uk", _registrable("www.example.co.uk"))
+        self.assertEqual("10.0.0.1", _registrable("10.0.0.1"))
+
+    def test_domains(self):
+        self.assertEqual(2, self.ingest("http://www.example.com/",
+                                        "host=1",
+                                        "wide=1; Domain=.example.com",
+                                        "other=1; Domain=other.com",
+                                        "tld=1; Domain=com"))
+        self.assertEqual(["host", "wide"], sorted(_names(
+            self.jar.cookies_for("http://www.example.com/", now=NOW))))
+        self.assertEqual(["wide"], _names(
+            self.jar.cookies_for("http://api.example.com/", now=NOW)))
+        self.assertEqual([], self.jar.cookies_for("http://example.org/"))
+
+    def test_paths(self):
+        self.ingest("http://a.com/shop/cart", "dir=1", "root=1; Path=/",
+                    "deep=1; Path=/shop/cart/items")
+        self.assertEqual(["dir", "root"], _names(
+            self.jar.cookies_for("http://a.com/shop/list", now=NOW)))
+        self.assertEqual(["deep", "dir", "root"], _names(
+            self.jar.cookies_for("http://a.com/shop/cart/items/1", now=NOW)))
+        self.assertEqual(["root"], _names(
+            self.jar.cookies_for("http://a.com/shopping", now=NOW)))
+
+    def test_flags(self):
+        self.ingest("https://a.com/", "s=1; Secure", "h=1; HttpOnly")
+        self.assertEqual(["h"], _names(
+            self.jar.cookies_for("http://a.com/", now=NOW)))
+        self.assertEqual(["s"], _names(
+            self.jar.cookies_for("https://a.com/", http=False, now=NOW)))
+
+    def test_expiry(self):
+        self.ingest("http://a.com/",
+                    "past=1; Expires=Tue, 01 Jan 2002 00:00:00 GMT",
+                    "future=1; Expires=Fri, 01 Jan 2100 00:00:00 GMT",
+                    "short=1; Max-Age=60")
+        self.assertEqual(2, len(self.jar))
+        self.assertEqual(["future"], _names(
+            self.jar.cookies_for("http://a.com/", now=NOW + 61000)))
+        self.assertEqual(1, len(self.jar))
+        self.ingest("http://a.com/", "future=; Max-Age=0")
+        self.assertEqual(0, len(self.jar))
+
+    def test_replace(self):
+        self.ingest("http://a.com/", "sid=old")
+        self.ingest("http://a.com/", "sid=new")
+        self.assertEqual(1, len(self.jar))
+        self.assertEqual("new", self.jar.cookies_for("http://a.com/",
+                                                     now=NOW)[0].value)
+
+    def test_apply(self):
+        self.ingest("http://a.com/login", "sid=abc; Path=/", "lang=en")
+        request = har.Request(empty=True)
+        request.devour("GET /index HTTP/1.1\r\nHost: a.com\r\n"
+                       "Cookie: sid=stale\r\nAccept: */*\r\n\r\n")
+        self.jar.apply(request, NOW)
+        self.assertEqual(["sid", "lang"], _names(request.cookies))
+        self.assertEqual("GET /index HTTP/1.1\r\nHost: a.com\r\n"
+                         "Cookie: sid=abc; lang=en\r\nAccept: */*\r\n\r\n",
+                         request.puke())
+        self.jar.clear()
+        self.jar.apply(request, NOW)
+        self.assertFalse("Cookie:" in request.puke())
+
+    def test_apply_first(self):
+        self.ingest("http://a.com/", "sid=abc")
+        request = har.Request(empty=True)
+        request.devour("GET / HTTP/1.1\r\nCookie: sid=stale\r\n"
+                       "Host: a.com\r\n\r\n")
+        self.jar.apply(request, NOW)
+        self.assertEqual("GET / HTTP/1.1\r\nCookie: sid=abc\r\n"
+                         "Host: a.com\r\n\r\n", request.puke())
+
+
+if __name__ == '__main__':
+    unittest.main()
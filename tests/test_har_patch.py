@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from sys import path
+
+path.append('./')
+path.append('../')
+import har
+from utils import synth
+from utils.har_patch import HarFile, append, replace, JOURNAL_SUFFIX
+from utils.har_stream import HarWriter
+
+
+class TestHarFile(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix="harpy-test-")
+        self.path = os.path.join(self.dir, "capture.har")
+        with open(self.path, 'wb') as fd:
+            synth.Corpus(seed=4).write_har(fd, 5)
+        self.extra = list(synth.Corpus(seed=5).entries(3))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, True)
+
+    def entries(self):
+        with open(self.path, 'rb') as fd:
+            return json.load(fd)["log"]["entries"]
+
+    def test_append(self):
+        before = self.entries()
+        self.assertEqual(2, append(self.path, [har.Entry(json.dumps(
+            self.extra[0])), json.dumps(self.extra[1])]))
+        self.assertEqual(before + self.extra[:2], self.entries())
+        capture = HarFile(self.path)
+        self.assertEqual(7, len(capture))
+        capture.append([self.extra[2]])
+        self.assertEqual(self.extra[2], capture.read(7))
+        self.assertEqual(before[4], capture.read(4))
+        self.assertEqual(8, len(self.entries()))
+        har.HarContainer(open(self.path).read()) # still a valid HAR
+
+    def test_replace(self):
+        before = self.entries()
+        capture = HarFile(self.path)
+        small = {"startedDateTime": before[1]["startedDateTime"]}
+        size = os.path.getsize(self.path)
+        capture.replace(1, small) # fits, so nothing moves
+        self.assertEqual(size, os.path.getsize(self.path))
+        self.assertEqual(before[:1] + [small] + before[2:], self.entries())
+        big = dict(before[2], comment="x" * 10000)
+        capture.replace(1, big)
+        self.assertEqual(before[:1] + [big] + before[2:], self.entries())
+        self.assertEqual(before[4], capture.read(4))
+        replace(self.path, 4, small)
+        self.assertEqual(small, HarFile(self.path).read(4))
+
+    def test_index(self):
+        HarFile(self.path)
+        self.assertTrue(os.path.exists(self.path + ".idx"))
+        with open(self.path, 'wb') as fd: # changed behind its back
+            synth.Corpus(seed=4).write_har(fd, 2)
+        self.assertEqual(2, len(HarFile(self.path)))
+
+    def test_late_pages_and_empty(self):
+        with open(self.path, 'wb') as fd:
+            with HarWriter(fd) as writer:
+                writer.write_page(json.dumps({
+                    "id": "page_0", "title": "", "pageTimings": {},
+                    "startedDateTime": "2013-01-01T00:00:00Z"}))
+        capture = HarFile(self.path)
+        self.assertEqual(0, len(capture))
+        capture.append(self.extra)
+        with open(self.path, 'rb') as fd:
+            log = json.load(fd)["log"]
+        self.assertEqual(self.extra, log["entries"])
+        self.assertEqual("page_0", log["pages"][0]["id"])
+        with open(self.path, 'wb') as fd:
+            fd.write('{"log": {"version": "1.2"}}')
+        self.assertRaises(ValueError, HarFile, self.path)
+
+    def test_recover(self):
+        before = open(self.path, 'rb').read()
+        capture = HarFile(self.path)
+        journal = capture._patch(capture.end, capture.end, ", {")
+        self.assertTrue(os.path.exists(self.path + JOURNAL_SUFFIX))
+        self.assertNotEqual(before, open(self.path, 'rb').read())
+        # as if the process died here
+        self.assertEqual(5, len(HarFile(self.path)))
+        self.assertEqual(before, open(self.path, 'rb').read())
+        self.assertFalse(os.path.exists(journal))
+
+
+if __name__ == '__main__':
+    unittest.main()
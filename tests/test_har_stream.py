@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+
+import json
+import unittest
+from StringIO import StringIO
+
+from sys import path
+
+path.append('./')
+path.append('../')
+import har
+from utils import synth
+from utils.har_stream import HarReader, HarWriter, merge, split
+
+
+def _har(entries, pages=None, pages_last=False):
+    log = {"version": "1.2", "creator": {"name": "test", "version": "1"}}
+    if pages is not None and not pages_last:
+        log["pages"] = pages
+    text = json.dumps({"log": log})[:-2] + ', "entries": '
+    text += json.dumps(entries)
+    if pages is not None and pages_last:
+        text += ', "pages": ' + json.dumps(pages)
+    return StringIO(text + "}}")
+
+
+def _entry(second, page="page_0", host="a.com"):
+    return {"pageref": page,
+            "startedDateTime": "2013-01-01T00:{0:02d}:{1:02d}Z".format(
+                second // 60, second % 60),
+            "request": {"url": "http://{0}/{1}".format(host, second)}}
+
+
+def _page(page_id):
+    return {"id": page_id, "title": page_id,
+            "startedDateTime": "2013-01-01T00:00:00Z", "pageTimings": {}}
+
+
+class TestHarReader(unittest.TestCase):
+
+    def test_read(self):
+        fd = StringIO()
+        synth.Corpus(seed=3).write_har(fd, 60)
+        fd.seek(0)
+        reader = HarReader(fd)
+        self.assertEqual(2, len(reader.pages))
+        entries = list(reader)
+        self.assertEqual(60, len(entries))
+        self.assertEqual(json.loads(fd.getvalue())["log"]["entries"], entries)
+
+    def test_small_reads(self):
+        reader = HarReader(_har([_entry(1), _entry(2)], [_page("page_0")]))
+        reader._stream.size = 3
+        self.assertEqual(2, len(list(reader)))
+        self.assertEqual("test", reader.log["creator"]["name"])
+
+    def test_pages_after_entries(self):
+        reader = HarReader(_har([_entry(1)], [_page("page_0")], True))
+        self.assertEqual(None, reader.pages)
+        self.assertEqual(1, len(list(reader)))
+        self.assertEqual("page_0", reader.pages[0]["id"])
+
+    def test_spans(self):
+        fd = _har([_entry(1), _entry(2)], [_page("page_0")])
+        reader = HarReader(fd)
+        reader._stream.size = 3
+        text = fd.getvalue()
+        spans = list(reader.spans())
+        self.assertEqual([_entry(1), _entry(2)],
+                         [json.loads(text[s:t]) for s, t in spans])
+        self.assertEqual([",", "]"], [text[t] for _, t in spans])
+        self.assertEqual(spans[1][1], reader.entries_end)
+
+    def test_raw_not_decoded(self):
+        entries = [{"a": "}]\\\"{["}, {"b": [1, {"c": []}]}, 5]
+        reader = HarReader(_har(entries))
+        reader._stream.size = 3
+        self.assertEqual(entries, [json.loads(raw) for raw in reader.raw()])
+        reader = HarReader(StringIO('{"log": {"entries": [{"a": [}]}}'))
+        self.assertRaises(ValueError, list, reader.raw())
+
+    def test_bounded(self):
+        text = '{"log": {"entries": [{"a": [1,, ' + "2, " * 10000 + "3]}]}}"
+        for read in "__iter__", "raw":
+            fd = StringIO(text)
+            reader = HarReader(fd, 100)
+            reader._stream.max_value = 1000
+            self.assertRaises(ValueError, list, getattr(reader, read)())
+            self.assertTrue(fd.tell() < 5000)
+
+    def test_not_a_har(self):
+        self.assertRaises(ValueError, HarReader, StringIO('{"foo": {}}'))
+        reader = HarReader(StringIO('{"log": {"entries": [{"a": 1}'))
+        self.assertRaises(ValueError, list, reader)
+
+
+class TestHarWriter(unittest.TestCase):
+
+    def test_late_pages(self):
+        fd = StringIO()
+        with HarWriter(fd) as writer:
+            writer.write(har.Entry(json.dumps(next(
+                synth.Corpus(seed=1).entries(1)))))
+            writer.write_page(json.dumps(_page("page_0")))
+        hc = har.HarContainer(fd.getvalue())
+        self.assertEqual("page_0", hc.log.pages[0].id)
+        self.assertRaises(AssertionError,
+                          HarWriter(StringIO(), pages=[]).write_page, "{}")
+
+
+class TestMerge(unittest.TestCase):
+
+    def test_merge(self):
+        first = _har([_entry(1), _entry(5), _entry(9)], [_page("page_0")])
+        second = _har([_entry(2, "page_1"), _entry(6, "page_1")],
+                      [_page("page_1")], True)
+        out = StringIO()
+        self.assertEqual(5, merge([first, second], out))
+        log = json.loads(out.getvalue())["log"]
+        self.assertEqual(["http://a.com/{0}".format(s) for s in 1, 2, 5, 6, 9],
+                         [e["request"]["url"] for e in log["entries"]])
+        self.assertEqual(["0_page_0", "1_page_1"],
+                         [p["id"] for p in log["pages"]])
+        self.assertEqual(["0_page_0", "1_page_1", "0_page_0", "1_page_1",
+                          "0_page_0"],
+                         [e["pageref"] for e in log["entries"]])
+
+    def test_single(self):
+        out = StringIO()
+        merge([_har([_entry(1)], [_page("page_0")])], out)
+        self.assertEqual("page_0", json.loads(
+            out.getvalue())["log"]["entries"][0]["pageref"])
+
+
+class _Part(StringIO):
+
+    def close(self):
+        self.value = self.getvalue()
+        StringIO.close(self)
+
+
+class TestSplit(unittest.TestCase):
+
+    def setUp(self):
+        self.fd = _har([_entry(10, "p0"), _entry(70, "p0", "b.com"),
+                        _entry(80, "p1"), _entry(130, "p1")],
+                       [_page("p0"), _page("p1")])
+        self.parts = {}
+        self.opened = []
+
+    def open_part(self, key, mode="w"):
+        part = _Part(mode == "a" and self.parts[key].value or "")
+        part.seek(0, 2)
+        self.parts[key] = part
+        self.opened.append((key, mode))
+        return part
+
+    def logs(self):
+        return dict((key, json.loads(fd.value)["log"])
+                    for key, fd in self.parts.iteritems())
+
+    def test_window(self):
+        split(self.fd, self.open_part, "window", 60)
+        logs = self.logs()
+        start = 1356998400
+        self.assertEqual([start, start + 60, start + 120], sorted(logs))
+        self.assertEqual(["p0", "p1"],
+                         [p["id"] for p in logs[start + 60]["pages"]])
+        self.assertEqual(["p1"], [p["id"] for p in logs[start + 120]["pages"]])
+
+    def test_count(self):
+        parts = split(self.fd, self.open_part, "count", 3)
+        self.assertEqual({0: 3, 1: 1},
+                         dict((k, w.entries) for k, w in parts.iteritems()))
+
+    def test_count_written(self):
+        fd = StringIO()
+        with HarWriter(fd) as writer:
+            for second, page in (10, "p0"), (20, "p0"), (30, "p1"):
+                writer.write_raw(json.dumps(_entry(second, page)))
+            writer.write_page(json.dumps(_page("p0")))
+            writer.write_page(json.dumps(_page("p1")))
+        split(StringIO(fd.getvalue()), self.open_part, "count", 2)
+        logs = self.logs()
+        self.assertEqual([2, 1], [len(logs[key]["entries"]) for key in 0, 1])
+        self.assertEqual(["p0"], [p["id"] for p in logs[0]["pages"]])
+        self.assertEqual(["p1"], [p["id"] for p in logs[1]["pages"]])
+
+    def test_host(self):
+        split(self.fd, self.open_part, "host")
+        logs = self.logs()
+        self.assertEqual(["a.com", "b.com"], sorted(logs))
+        self.assertEqual(3, len(logs["a.com"]["entries"]))
+        self.assertEqual("test", logs["b.com"]["creator"]["name"])
+
+    def test_open_bounded(self):
+        parts = split(self.fd, self.open_part, "count", 1, max_open=1)
+        self.assertEqual(range(4), [key for key, _ in self.opened])
+        self.assertEqual(4, len(self.logs()))
+        self.assertTrue(all(part.closed for part in self.parts.values()))
+        fd = _har([_entry(i, "p0", "h%d.com" % (i % 3)) for i in range(9)],
+                  [_page("p0")], True)
+        self.opened = []
+        split(fd, self.open_part, "host", max_open=2)
+        logs = self.logs()
+        self.assertEqual([3, 3, 3], [len(logs["h%d.com" % i]["entries"])
+                                     for i in range(3)])
+        self.assertEqual(["p0"], [p["id"] for p in logs["h2.com"]["pages"]])
+        self.assertTrue(("h0.com", "a") in self.opened)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+
+import unittest
+
+from sys import path
+
+path.append('./')
+path.append('../')
+import har
+from utils import http_stream
+
+
+class TestRequestParser(unittest.TestCase):
+
+    raw = ("POST /login HTTP/1.1\r\nHost: example.com\r\n"
+           "Content-Type: application/x-www-form-urlencoded\r\n"
+           "Content-Length: 13\r\n\r\nuser=a&pass=b")
+
+    def test_headers_before_body(self):
+        parser = http_stream.RequestParser()
+        events = parser.feed(self.raw[:-5])
+        self.assertEqual([http_stream.HEADERS, http_stream.BODY],
+                         [e[0] for e in events])
+        self.assertEqual("http://example.com/login", events[0][1].url)
+        events = parser.feed(self.raw[-5:])
+        self.assertEqual(http_stream.COMPLETE, events[-1][0])
+        request = events[-1][1]
+        self.assertEqual(["user", "pass"],
+                         [p.name for p in request.postData.params])
+
+    def test_byte_at_a_time(self):
+        parser = http_stream.RequestParser()
+        events = []
+        for c in self.raw:
+            events.extend(parser.feed(c))
+        self.assertEqual(http_stream.COMPLETE, events[-1][0])
+        self.assertEqual(13, events[-1][1].bodySize)
+
+    def test_pipelined(self):
+        parser = http_stream.RequestParser()
+        raw = "GET /a HTTP/1.1\r\nHost: h\r\n\r\n" + self.raw
+        done = [e[1] for e in parser.feed(raw)
+                if e[0] == http_stream.COMPLETE]
+        self.assertEqual(["http://h/a", "http://example.com/login"],
+                         [r.url for r in done])
+
+    def test_length_any_case(self):
+        for name in "content-length", "CONTENT-length":
+            parser = http_stream.RequestParser()
+            raw = self.raw.replace("Content-Length", name)
+            done = [e[1] for e in parser.feed(raw + "GET /a HTTP/1.1\r\n"
+                                              "Host: h\r\n\r\n")
+                    if e[0] == http_stream.COMPLETE]
+            self.assertEqual(["POST", "GET"], [r.method for r in done])
+            self.assertEqual(13, done[0].bodySize)
+
+
+class TestResponseParser(unittest.TestCase):
+
+    def test_chunked(self):
+        raw = ("HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n"
+               "4\r\nWiki\r\n5\r\npedia\r\n0\r\n\r\n")
+        parser = http_stream.ResponseParser()
+        events = parser.feed(raw)
+        self.assertEqual(http_stream.COMPLETE, events[-1][0])
+        self.assertEqual(raw, events[-1][1].puke())
+
+    def test_dechunk(self):
+        raw = ("HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n"
+               "4\r\nWiki\r\n5\r\npedia\r\n0\r\n\r\n")
+        parser = http_stream.ResponseParser(dechunk=True)
+        events = parser.feed(raw)
+        self.assertEqual(raw[raw.index("4"):],
+                         "".join(e[2] for e in events
+                                 if e[0] == http_stream.BODY))
+        self.assertEqual("Wikipedia", str(events[-1][1].content.body))
+        self.assertEqual(24, events[-1][1].bodySize)
+        self.assertRaises(http_stream.ParseError,
+                          http_stream.ResponseParser().feed,
+                          raw.replace("Wiki", "Wikip"))
+
+    def test_until_close(self):
+        parser = http_stream.ResponseParser()
+        self.assertEqual(http_stream.HEADERS,
+                         parser.feed("HTTP/1.0 200 OK\r\n\r\nab")[0][0])
+        parser.feed("cd")
+        events = parser.close()
+        self.assertEqual("abcd", str(events[0][1].content.body))
+
+    def test_head(self):
+        parser = http_stream.ResponseParser()
+        parser.expect("HEAD")
+        events = parser.feed("HTTP/1.1 200 OK\r\nContent-Length: 10\r\n\r\n")
+        self.assertEqual(http_stream.COMPLETE, events[-1][0])
+
+    def test_spill(self):
+        parser = http_stream.ResponseParser(spill_threshold=4)
+        events = parser.feed("HTTP/1.1 200 OK\r\nContent-Length: 8\r\n\r\n"
+                             "abcdefgh")
+        self.assertTrue(isinstance(events[-1][1].content.text, har.FileBody))
+        self.assertEqual("abcdefgh", str(events[-1][1].content.body))
+
+    def test_close_mid_message(self):
+        parser = http_stream.ResponseParser()
+        parser.feed("HTTP/1.1 200 OK\r\nContent-Length: 8\r\n\r\nab")
+        self.assertRaises(http_stream.ParseError, parser.close)
+
+    def test_length_any_case(self):
+        for name in "content-length", "Content-length":
+            parser = http_stream.ResponseParser()
+            done = [e[1] for e in parser.feed(
+                        "HTTP/1.1 200 OK\r\n{0}: 5\r\n\r\nhello"
+                        "HTTP/1.1 204 No Content\r\n\r\n".format(name))
+                    if e[0] == http_stream.COMPLETE]
+            self.assertEqual([200, 204], [r.status for r in done])
+            self.assertEqual("HTTP/1.1", done[1].httpVersion)
+            self.assertEqual("hello", str(done[0].content.body))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+
+import unittest
+
+from sys import path
+
+path.append('./')
+path.append('../')
+import har
+from utils.macro import Macro, MacroError
+
+
+def _entry(raw_request, raw_response):
+    entry = har.Entry(empty=True)
+    entry.request = har.Request(empty=True)
+    entry.request.devour(raw_request)
+    entry.response = har.Response(empty=True)
+    entry.response.devour(raw_response)
+    return entry
+
+
+def _response(text, headers=""):
+    return ("HTTP/1.1 200 OK\r\n" + headers +
+            "Content-Length: {0}\r\n\r\n{1}".format(len(text), text))
+
+
+FORM = "user=alice&csrf=t%2Fk1"
+LOGIN = [
+    _entry("GET /login HTTP/1.1\r\nHost: a.com\r\n\r\n",
+           _response('<input name="csrf" value="t/k1">',
+                     "Set-Cookie: sid=s1; Path=/\r\n")),
+    _entry("POST /login HTTP/1.1\r\nHost: a.com\r\nCookie: sid=s1\r\n"
+           "Content-Type: application/x-www-form-urlencoded\r\n"
+           "Content-Length: {0}\r\n\r\n{1}".format(len(FORM), FORM),
+           _response("ok", "X-Auth-Token: tok1\r\n")),
+    _entry("GET /api/me?token=tok1 HTTP/1.1\r\nHost: a.com\r\n"
+           "Authorization: Bearer tok1\r\nCookie: sid=s1\r\n\r\n",
+           _response("{}"))]
+
+
+class TestMacro(unittest.TestCase):
+
+    def setUp(self):
+        macro = Macro(LOGIN)
+        macro.parameter("user", "alice")
+        macro.extract("csrf", 0, r'name="csrf" value="([^"]+)"')
+        macro.extract("token", 1, header="X-Auth-Token")
+        self.plan = macro.compile()
+        self.sent = []
+
+    def send(self, raw, url):
+        self.sent.append(raw)
+        return [_response('<input name="csrf" value="new csrf">',
+                          "Set-Cookie: sid=s2; Path=/\r\n"),
+                _response("ok", "X-Auth-Token: tok2\r\n"),
+                _response("{}")][len(self.sent) - 1]
+
+    def test_run(self):
+        session = self.plan.run(self.send, user="bob")
+        form = "user=bob&csrf=new+csrf"
+        self.assertEqual(
+            ["GET /login HTTP/1.1\r\nHost: a.com\r\n\r\n",
+             "POST /login HTTP/1.1\r\nHost: a.com\r\nCookie: sid=s2\r\n"
+             "Content-Type: application/x-www-form-urlencoded\r\n"
+             "Content-Length: {0}\r\n\r\n{1}\r\n".format(len(form), form),
+             "GET /api/me?token=tok2 HTTP/1.1\r\nHost: a.com\r\n"
+             "Authorization: Bearer tok2\r\nCookie: sid=s2\r\n\r\n"],
+            self.sent)
+        self.assertEqual({"user": "bob", "csrf": "new csrf",
+                          "token": "tok2"}, session.values)
+        self.assertEqual(1, len(session.jar))
+
+    def test_unchanged(self):
+        session = self.plan.session(user="alice")
+        url, raw = session.render(self.plan.steps[0])
+        self.assertEqual(LOGIN[0].request.puke(), raw)
+        self.assertEqual("http://a.com/login", url)
+
+    def test_delimited(self):
+        form = "n=1&m=11"
+        head = ("POST /v1/a?n={0} HTTP/1.1\r\nHost: a.com\r\nX-N: {0}\r\n"
+                "Content-Type: application/x-www-form-urlencoded\r\n"
+                "Content-Length: {1}\r\n\r\n")
+        entry = _entry(head.format("1", len(form)) + form, _response("ok"))
+        macro = Macro([entry])
+        macro.parameter("n", "1")
+        plan = macro.compile()
+        url, raw = plan.session(n="22").render(plan.steps[0])
+        self.assertEqual("http://a.com/v1/a?n=22", url)
+        form = "n=22&m=11"
+        self.assertEqual(head.format("22", len(form)) + form + "\r\n", raw)
+
+    def test_errors(self):
+        self.assertRaises(MacroError, self.plan.run, self.send)
+        macro = Macro(LOGIN)
+        macro.extract("missing", 0, cookie="nope")
+        self.assertRaises(MacroError, macro.compile)
+        session = self.plan.session(user="bob")
+        self.assertRaises(MacroError, session.feed, self.plan.steps[0],
+                          "http://a.com/", _response(""))
+
+
+if __name__ == '__main__':
+    unittest.main()
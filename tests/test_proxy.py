@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+
+import unittest
+import asyncore
+import socket
+import threading
+import json
+from StringIO import StringIO
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+from urlparse import urlparse
+
+from sys import path
+
+path.append('./')
+path.append('../')
+import har
+from utils import proxy
+from utils.har_stream import HarWriter
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path == "/chunked":
+            self.send_response(200)
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            self.wfile.write("4\r\nWiki\r\n5\r\npedia\r\n0\r\n\r\n")
+            return
+        if self.path.startswith("/echo"):
+            body = self.requestline + "\r\n" + str(self.headers)
+        else:
+            body = "hello " + urlparse(self.path).path
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.send_response(201)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def read_response(sock, count=1):
+    parser = proxy.ResponseParser()
+    done = []
+    while len(done) < count:
+        data = sock.recv(65536)
+        if not data:
+            break
+        done.extend(e[1] for e in parser.feed(data) if e[0] == proxy.COMPLETE)
+    return done
+
+
+class TestProxyServer(unittest.TestCase):
+
+    def setUp(self):
+        self.upstream = StubServer(('127.0.0.1', 0), StubHandler)
+        threading.Thread(target=self.upstream.serve_forever).start()
+        self.entries = []
+        self.proxy = proxy.ProxyServer(port=0, on_entry=self.entries.append)
+        self.thread = threading.Thread(target=self.proxy.serve_forever,
+                                       args=(0.05,))
+        self.thread.start()
+        self.base = "http://127.0.0.1:%d" % self.upstream.server_address[1]
+
+    def tearDown(self):
+        self.proxy.shutdown()
+        self.thread.join()
+        self.upstream.shutdown()
+        self.upstream.server_close()
+
+    def connect(self):
+        return socket.create_connection(self.proxy.address)
+
+    def get(self, path):
+        return ("GET %s%s HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n" %
+                (self.base, path))
+
+    def test_records_entry(self):
+        sock = self.connect()
+        sock.sendall(self.get("/a"))
+        response = read_response(sock)[0]
+        sock.close()
+        self.assertEqual("hello /a", str(response.content.body))
+        self.proxy.shutdown()
+        self.thread.join()
+        self.assertEqual(1, len(self.entries))
+        entry = self.entries[0]
+        self.assertEqual(self.base + "/a", entry.request.url)
+        self.assertEqual(200, entry.response.status)
+        self.assertEqual("127.0.0.1", entry.serverIPAddress)
+        self.assertTrue(entry.timings.wait >= 0)
+        # entries must make a valid har
+        fd = StringIO()
+        with HarWriter(fd) as writer:
+            writer.write(entry)
+        self.assertEqual(1, len(har.HarContainer(fd.getvalue()).log.entries))
+
+    def test_pipelined(self):
+        sock = self.connect()
+        post = ("POST %s/p HTTP/1.1\r\nHost: 127.0.0.1\r\n"
+                "content-length: 4\r\n\r\nbody" % self.base)
+        sock.sendall(self.get("/1") + post + self.get("/2"))
+        responses = read_response(sock, 3)
+        sock.close()
+        self.assertEqual(["hello /1", "body", "hello /2"],
+                         [str(r.content.body) for r in responses])
+
+    def test_concurrent(self):
+        socks = [self.connect() for i in range(50)]
+        for i, sock in enumerate(socks):
+            sock.sendall(self.get("/%d" % i))
+        for i, sock in enumerate(socks):
+            self.assertEqual("hello /%d" % i,
+                             str(read_response(sock)[0].content.body))
+            sock.close()
+
+    def test_upstream_head(self):
+        sock = self.connect()
+        sock.sendall("GET %s/echo?a=1 HTTP/1.1\r\nHost: 127.0.0.1\r\n"
+                     "Proxy-Connection: keep-alive\r\nConnection: X-Hop\r\n"
+                     "X-Hop: 1\r\nX-Kept: 1\r\n\r\n" % self.base)
+        echo = str(read_response(sock)[0].content.body)
+        sock.close()
+        self.assertTrue(echo.startswith("GET /echo?a=1 HTTP/1.1\r\n"))
+        self.assertTrue("X-Kept: 1" in echo)
+        self.assertFalse("Proxy-Connection" in echo)
+        self.assertFalse("X-Hop:" in echo)
+        self.proxy.shutdown()
+        self.thread.join()
+        request = self.entries[0].request
+        self.assertEqual(self.base + "/echo?a=1", request.url)
+        self.assertTrue("Proxy-Connection" in
+                        [header.name for header in request.headers])
+
+    def test_chunked(self):
+        sock = self.connect()
+        sock.sendall(self.get("/chunked") + self.get("/a"))
+        responses = read_response(sock, 2)
+        sock.close()
+        self.assertEqual("4\r\nWiki\r\n", str(responses[0].content.body)[:9])
+        self.assertEqual("hello /a", str(responses[1].content.body))
+        self.proxy.shutdown()
+        self.thread.join()
+        response = self.entries[0].response
+        self.assertEqual("Wikipedia", str(response.content.body))
+        self.assertEqual(24, response.bodySize)
+
+    def test_bad_gateway(self):
+        sock = self.connect()
+        sock.sendall("GET http://127.0.0.1:1/ HTTP/1.1\r\nHost: x\r\n\r\n")
+        self.assertEqual(502, read_response(sock)[0].status)
+        sock.close()
+
+    def test_host_switch(self):
+        sock = self.connect()
+        other = self.base.replace("127.0.0.1", "localhost")
+        sock.sendall(self.get("/a"))
+        self.assertEqual("hello /a", str(read_response(sock)[0].content.body))
+        for path in "/b", "/c":
+            sock.sendall(self.get(path).replace(self.base, other))
+            self.assertEqual("hello " + path,
+                             str(read_response(sock)[0].content.body))
+        # the upstream to 127.0.0.1 is let go without taking the client
+        upstreams = [c for c in self.proxy._map.values()
+                     if isinstance(c, proxy._ServerSide)]
+        self.assertEqual([("localhost", self.upstream.server_address[1])],
+                         [c.address for c in upstreams])
+        sock.close()
+
+
+class TestResolver(unittest.TestCase):
+
+    def test_resolve(self):
+        resolver = proxy._Resolver({}, threads=2)
+        answers = []
+        resolver.resolve("localhost", 80, answers.append)
+        resolver.resolve("localhost", 80, answers.append)
+        while len(answers) < 2:
+            asyncore.loop(0.05, True, resolver.map, 1)
+        self.assertEqual(answers[0], answers[1])
+        self.assertEqual(80, answers[0][4][1])
+        resolver.resolve("localhost", 80, answers.append) # cached
+        self.assertEqual(3, len(answers))
+        resolver.resolve("no-such-host.invalid", 80, answers.append)
+        while len(answers) < 4:
+            asyncore.loop(0.05, True, resolver.map, 1)
+        self.assertTrue(isinstance(answers[3], socket.error))
+        resolver.close()
+        asyncore.close_all(resolver.map)
+
+
+if __name__ == '__main__':
+    unittest.main()
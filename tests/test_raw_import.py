@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+import os
+import json
+import tempfile
+import unittest
+from StringIO import StringIO
+
+from sys import path
+
+path.append('./')
+path.append('../')
+import har
+from utils import synth
+from utils.http_stream import ParseError
+from utils.raw_import import import_log, messages, pairs
+
+GET = "GET /{0} HTTP/1.1\r\nHost: a.com\r\n\r\n"
+HEAD = "HEAD /h HTTP/1.1\r\nHost: a.com\r\n\r\n"
+OK = "HTTP/1.1 200 OK\r\nContent-Length: {0}\r\n\r\n{1}"
+CHUNKED = ("HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n"
+           "4\r\nabcd\r\n0\r\n\r\n")
+
+
+class TestFraming(unittest.TestCase):
+
+    def test_messages(self):
+        log = GET.format(1) + OK.format(2, "hi") + "\r\n" + HEAD + \
+              OK.format(10, "") + GET.format(2) + CHUNKED
+        spans = [(response, log[start:end]) for response, (start, _, end), _
+                 in messages(log)]
+        self.assertEqual([(False, GET.format(1)), (True, OK.format(2, "hi")),
+                          (False, HEAD), (True, OK.format(10, "")),
+                          (False, GET.format(2)), (True, CHUNKED)], spans)
+
+    def test_pipelined(self):
+        log = GET.format(1) + GET.format(2) + OK.format(1, "1") + \
+              OK.format(1, "2") + GET.format(3)
+        self.assertEqual([(GET.format(1), OK.format(1, "1")),
+                          (GET.format(2), OK.format(1, "2")),
+                          (GET.format(3), None)],
+                         [(log[q[0]:q[2]], s and log[s[0]:s[2]])
+                          for q, s in pairs(log)])
+
+    def test_cut_short(self):
+        self.assertRaises(ParseError, list,
+                          messages(GET.format(1) + OK.format(5, "hi")))
+        self.assertRaises(ParseError, list, messages("GET / HTTP/1.1\r\n"))
+
+    def test_bad_length(self):
+        log = GET.format(1) + OK.format(2, "hi") + GET.format(2) + \
+              OK.format("2x", "hi")
+        try:
+            list(messages(log))
+        except ParseError, err:
+            self.assertTrue(str(err).endswith(" at {0}".format(
+                log.rindex("HTTP/1.1 200"))))
+        else:
+            self.fail("No ParseError")
+        self.assertRaises(ParseError, list, messages(OK.format(-1, "")))
+
+
+class TestImportLog(unittest.TestCase):
+
+    def setUp(self):
+        self.paths = []
+
+    def tearDown(self):
+        for log in self.paths:
+            os.remove(log)
+
+    def log(self, data):
+        fd, log = tempfile.mkstemp(prefix="harpy-test-")
+        with os.fdopen(fd, 'wb') as out:
+            out.write(data)
+        self.paths.append(log)
+        return log
+
+    def test_lossless(self):
+        fd = StringIO()
+        synth.Corpus(seed=1).write_raw(fd, 40)
+        out = StringIO()
+        self.assertEqual((40, 0), import_log(self.log(fd.getvalue()), out,
+                                             processes=1))
+        hc = har.HarContainer(out.getvalue())
+        for entry, (request, response) in zip(
+                hc.log.entries, synth.Corpus(seed=1).raw_pairs(40)):
+            self.assertTrue(entry.request.puke() in (request,
+                                                     request + "\r\n"))
+            self.assertTrue(entry.response.puke() in (response,
+                                                      response + "\r\n"))
+
+    def test_workers(self):
+        logs = [self.log(GET.format(1) + OK.format(2, "hi")),
+                self.log(OK.format(0, "") + GET.format(2) + CHUNKED +
+                         GET.format(3)),
+                self.log("")]
+        out = StringIO()
+        self.assertEqual((2, 2), import_log(logs, out, processes=2,
+                                            keep_b64_raw=True))
+        entries = json.loads(out.getvalue())["log"]["entries"]
+        self.assertEqual(["0", "1"], [e["connection"] for e in entries])
+        self.assertEqual(CHUNKED, har.Response(
+            json.dumps(entries[1]["response"])).puke())
+        self.assertEqual(GET.format(2), entries[1]["request"][
+            "_b64_raw_req"].decode('base64'))
+
+    def test_broken(self):
+        bad = CHUNKED.replace("\r\n\r\n", "\r\n\r\nzz\r\n", 1)
+        log = self.log(GET.format(1) + OK.format(2, "hi") + GET.format(2) +
+                       bad)
+        for processes in 1, 2:
+            out = StringIO()
+            self.assertRaises(ParseError, import_log, log, out,
+                              processes=processes)
+            entries = json.loads(out.getvalue())["log"]["entries"]
+            self.assertEqual(["http://a.com/1"],
+                             [e["request"]["url"] for e in entries])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from sys import path
+
+path.append('./')
+path.append('../')
+import har
+from utils.response_cache import ResponseCache, fingerprint
+
+NOW = 1500000000000.0 # ms
+OK = ("HTTP/1.1 200 OK\r\n{0}Content-Length: 5\r\n\r\nhello")
+NOT_MODIFIED = "HTTP/1.1 304 Not Modified\r\n{0}\r\n"
+
+
+def _request(url="http://a.com/p?b=2&a=1", method="GET", headers=()):
+    request = har.Request()
+    request.url = url
+    request.method = method
+    for name, value in headers:
+        request.headers.append(har.Header({"name": name, "value": value}))
+    return request
+
+
+def _response(raw, *headers):
+    response = har.Response(empty=True)
+    response.devour(raw.format("".join(h + "\r\n" for h in headers)))
+    return response
+
+
+class TestFingerprint(unittest.TestCase):
+
+    def test_normalized(self):
+        self.assertEqual(fingerprint(_request()), fingerprint(_request(
+            "HTTP://A.com:80/p?a=1&b=2#top")))
+        self.assertNotEqual(fingerprint(_request()),
+                            fingerprint(_request(method="HEAD")))
+        self.assertNotEqual(fingerprint(_request()), fingerprint(_request(
+            headers=[("Authorization", "Basic eA==")])))
+        self.assertNotEqual(fingerprint(_request(
+            headers=[("Cookie", "session=a")])), fingerprint(_request(
+            headers=[("Cookie", "session=b")])))
+        self.assertEqual(fingerprint(_request()), fingerprint(_request(
+            headers=[("X-Trace", "1")])))
+
+    def test_body(self):
+        one, two = _request(method="POST"), _request(method="POST")
+        one.set_body("a=1")
+        two.set_body("a=2")
+        self.assertNotEqual(fingerprint(one), fingerprint(two))
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix="harpy-test-")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, True)
+
+    def fetch(self, cache, response, now=NOW, request=None):
+        lookup = cache.lookup(request or _request(), now)
+        if lookup.fresh:
+            return lookup, cache.respond(lookup, now)
+        return lookup, cache.store(lookup, response, now=now)
+
+    def test_fresh_hit(self):
+        cache = ResponseCache()
+        ok = _response(OK, "Cache-Control: max-age=60", 'ETag: "v1"')
+        lookup, _ = self.fetch(cache, ok)
+        self.assertFalse(lookup.fresh)
+        self.assertFalse("beforeRequest" in lookup.cache)
+        self.assertEqual(0, lookup.cache.afterRequest.hitCount)
+        lookup, response = self.fetch(cache, None, NOW + 59000)
+        self.assertTrue(lookup.fresh)
+        self.assertEqual("memory", lookup.source)
+        self.assertEqual("hello", str(response.content.text))
+        self.assertEqual('"v1"', lookup.cache.beforeRequest.eTag)
+        self.assertEqual(1, lookup.cache.afterRequest.hitCount)
+        har.Cache(lookup.cache.to_json()) # valid HAR
+        self.assertFalse(cache.lookup(_request(), NOW + 61000).fresh)
+
+    def test_revalidate(self):
+        cache = ResponseCache()
+        self.fetch(cache, _response(OK, "Cache-Control: no-cache",
+                                    'ETag: "v1"'))
+        lookup = cache.lookup(_request(), NOW + 1000)
+        self.assertFalse(lookup.fresh)
+        self.assertEqual(['"v1"'], [h.value for h in lookup.request.headers
+                                    if h.name == "If-None-Match"])
+        response = cache.store(lookup, _response(NOT_MODIFIED, 'ETag: "v1"',
+                                                 "X-New: 1"), now=NOW + 1000)
+        self.assertEqual(200, response.status)
+        self.assertEqual("hello", str(response.content.text))
+        self.assertTrue("X-New" in [h.name for h in response.headers])
+        self.assertEqual(1, cache.revalidated)
+
+    def test_not_kept(self):
+        cache = ResponseCache()
+        self.fetch(cache, _response(OK, "Cache-Control: no-store"))
+        self.fetch(cache, _response(OK)) # nothing to go on
+        self.fetch(cache, _response(OK, "Cache-Control: max-age=60",
+                                    "Vary: *"))
+        self.fetch(cache, _response(OK, "Cache-Control: max-age=60"),
+                   request=_request(method="POST"))
+        self.assertEqual(0, len(cache))
+
+    def test_expires_and_heuristic(self):
+        cache = ResponseCache()
+        self.fetch(cache, _response(
+            OK, "Date: Fri, 14 Jul 2017 02:40:00 GMT",
+            "Expires: Fri, 14 Jul 2017 02:41:00 GMT"))
+        self.assertTrue(cache.lookup(_request(), NOW + 59000).fresh)
+        self.assertFalse(cache.lookup(_request(), NOW + 61000).fresh)
+        cache = ResponseCache()
+        self.fetch(cache, _response(
+            OK, "Date: Fri, 14 Jul 2017 02:40:00 GMT",
+            "Last-Modified: Fri, 14 Jul 2017 02:30:00 GMT"))
+        self.assertTrue(cache.lookup(_request(), NOW + 59000).fresh)
+        self.assertFalse(cache.lookup(_request(), NOW + 61000).fresh)
+
+    def test_vary(self):
+        cache = ResponseCache()
+        english = _request(headers=[("X-Lang", "en")])
+        self.fetch(cache, _response(OK, "Cache-Control: max-age=60",
+                                    "Vary: X-Lang"), request=english)
+        self.assertTrue(cache.lookup(english, NOW).fresh)
+        self.assertEqual(None, cache.lookup(_request(
+            headers=[("X-Lang", "fr")]), NOW).cached)
+
+    def test_lru(self):
+        cache = ResponseCache(max_entries=2)
+        ok = _response(OK, "Cache-Control: max-age=60")
+        for page in "abc":
+            self.fetch(cache, ok, request=_request("http://a.com/" + page))
+            cache.lookup(_request("http://a.com/a"), NOW)
+        self.assertEqual(2, len(cache))
+        self.assertTrue(cache.lookup(_request("http://a.com/a"), NOW).fresh)
+        self.assertFalse(cache.lookup(_request("http://a.com/b"), NOW).fresh)
+
+    def test_disk(self):
+        cache = ResponseCache(self.dir)
+        self.fetch(cache, _response(OK, "Cache-Control: max-age=60"))
+        cache = ResponseCache(self.dir)
+        self.assertEqual(0, len(cache))
+        lookup, response = self.fetch(cache, None, NOW + 1000)
+        self.assertEqual("disk", lookup.source)
+        self.assertEqual("hello", str(response.content.text))
+        cache = ResponseCache(self.dir, max_disk_bytes=10)
+        self.assertEqual([], os.listdir(self.dir))
+
+    def test_disk_hits(self):
+        cache = ResponseCache(self.dir)
+        ok = _response(OK, "Cache-Control: max-age=60")
+        for page in "ab":
+            self.fetch(cache, ok, request=_request("http://a.com/" + page))
+        for i in 1, 2:
+            self.fetch(cache, None, NOW + i * 1000, _request("http://a.com/a"))
+        key = fingerprint(_request("http://a.com/a"))
+        size = os.path.getsize(os.path.join(self.dir, key))
+        cache = ResponseCache(self.dir, max_disk_bytes=size)
+        self.assertEqual([key], os.listdir(self.dir))
+        lookup = cache.lookup(_request("http://a.com/a"), NOW + 3000)
+        self.assertEqual((2, NOW + 2000),
+                         (lookup.cached.hits, lookup.cached.access))
+
+
+if __name__ == '__main__':
+    unittest.main()
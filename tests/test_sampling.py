@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+
+import unittest
+from random import Random
+from StringIO import StringIO
+
+from sys import path
+
+path.append('./')
+path.append('../')
+import har
+from utils import synth
+from utils.sampling import (Reservoir, Stratified, TopK, SpaceSaving,
+                            CountMin, Summary, summarize)
+
+
+class TestSketches(unittest.TestCase):
+
+    def test_reservoir(self):
+        reservoir = Reservoir(10, Random(1))
+        for i in xrange(5):
+            reservoir.add(i)
+        self.assertEqual(range(5), reservoir.items)
+        kept = [0] * 100
+        for seed in xrange(1000):
+            reservoir = Reservoir(10, Random(seed))
+            for i in xrange(100):
+                reservoir.add(i)
+            self.assertEqual(10, len(set(reservoir.items)))
+            for i in reservoir.items:
+                kept[i] += 1
+        # each is kept a tenth of the time, 100 times in 1000
+        self.assertTrue(min(kept) > 60 and max(kept) < 140, kept)
+
+    def test_stratified(self):
+        stratified = Stratified(5, 0.5, Random(2))
+        for i in xrange(1000):
+            stratified.add(i % 2 and "odd" or "even", i)
+            if i < 4:
+                stratified.add("rare", i)
+        self.assertEqual({"odd": 500, "even": 500, "rare": 4},
+                         stratified.seen)
+        self.assertEqual(5, len(stratified.strata["odd"]))
+        self.assertTrue(all(i % 2 for i in stratified.strata["odd"].items))
+        self.assertTrue(len(stratified.strata.get("rare", ())) <= 4)
+
+    def test_top_k(self):
+        top = TopK(3)
+        for i in [5, 1, 9, 7, 3, 9]:
+            top.add(i, str(i))
+        self.assertEqual([9, 9, 7], [v for v, _ in top.items()])
+
+    def test_space_saving(self):
+        counter = SpaceSaving(5)
+        rand = Random(3)
+        for i in xrange(5000):
+            counter.add(i % 3 and "hot{0}".format(i % 3) or
+                        "cold{0}".format(rand.randrange(1000)))
+        top = counter.top(2)
+        self.assertEqual(["hot1", "hot2"], sorted(k for k, _, _ in top))
+        for key, count, error in top:
+            real = {"hot1": 1667, "hot2": 1666}[key]
+            self.assertTrue(count - error <= real <= count)
+        self.assertEqual(5, len(counter.counts))
+
+    def test_count_min(self):
+        counts = CountMin(64, 4)
+        for i in xrange(1000):
+            counts.add(i % 100)
+        counts.add("many", 500)
+        self.assertTrue(all(counts.estimate(i) >= 10 for i in xrange(100)))
+        self.assertTrue(500 <= counts.estimate("many") < 600)
+
+
+class TestSummary(unittest.TestCase):
+
+    def setUp(self):
+        self.fd = StringIO()
+        synth.Corpus(seed=6).write_har(self.fd, 300)
+        self.fd.seek(0)
+        self.entries = har.HarContainer(self.fd.getvalue()).log.entries
+
+    def test_summarize(self):
+        summary = summarize(self.fd, size=20, seed=1)
+        stats = summary.stats(3)
+        self.assertEqual(300, stats["entries"])
+        self.assertEqual(20, stats["sampled"])
+        times = sorted(e.time for e in self.entries)
+        self.assertEqual(times[-1], stats["slowest"][0][0])
+        self.assertEqual(times[-10:][::-1], [t for t, _ in stats["slowest"]])
+        self.assertEqual(sum(e.time for e in self.entries), stats["time"])
+        statuses = [e.response.status for e in self.entries]
+        self.assertEqual(statuses.count(200), stats["statuses"][0][1])
+        self.assertTrue(summary.estimate("status", 200) >= statuses.count(200))
+        hc = summary.sample()
+        self.assertEqual(20, len(hc.log.entries))
+        starts = [e.startedDateTime for e in hc.log.entries]
+        self.assertEqual(sorted(starts), starts)
+        pages = set(p.id for p in hc.log.pages)
+        self.assertTrue(set(e.pageref for e in hc.log.entries) <= pages)
+
+    def test_same_for_objects(self):
+        summary = Summary(size=20, seed=1).update(self.entries)
+        self.assertEqual(summarize(self.fd, size=20, seed=1).stats(),
+                         summary.stats())
+        self.assertEqual(20, len(summary.sample().log.entries))
+
+    def test_by_host(self):
+        summary = Summary(size=2, by="host", seed=1).update(self.entries)
+        strata = summary.stats()["strata"]
+        hosts = set(e.request.url.split("/")[2] for e in self.entries)
+        self.assertEqual(hosts, set(strata))
+        self.assertEqual(300, sum(seen for seen, _ in strata.itervalues()))
+        self.assertTrue(all(kept == min(seen, 2)
+                            for seen, kept in strata.itervalues()))
+        by_status = Summary(size=2, by=lambda e: e.response.status)
+        strata = by_status.update(self.entries).stats()["strata"]
+        statuses = [e.response.status for e in self.entries]
+        self.assertEqual((statuses.count(200), 2), strata[200])
+
+
+if __name__ == '__main__':
+    unittest.main()
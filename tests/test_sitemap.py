@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+
+import json
+import unittest
+from StringIO import StringIO
+
+from sys import path
+
+path.append('./')
+path.append('../')
+import har
+from utils import synth
+from utils.sitemap import Sitemap, build
+
+
+def _entry(url, method="GET", status=200, size=100):
+    return {"request": {"url": url, "method": method},
+            "response": {"status": status, "bodySize": size}}
+
+
+class TestSitemap(unittest.TestCase):
+
+    def setUp(self):
+        self.sitemap = Sitemap().update([
+            _entry("http://a.com/api/v1/users/42?expand=1&page=2"),
+            _entry("http://a.com/api/v1/users/43", "PUT", 404),
+            _entry("http://a.com/api/v1/search?q=x", size=-1),
+            _entry("https://A.com:443/", status=301)])
+
+    def test_trie(self):
+        self.assertEqual(["a.com"], self.sitemap.hosts.keys())
+        users = self.sitemap.find("a.com/api/v1/users/7")
+        self.assertEqual(("users", "{id}"), users.label)
+        self.assertEqual(2, users.count)
+        self.assertEqual({"GET": 1, "PUT": 1}, users.methods)
+        self.assertEqual({200: 1, 404: 1}, users.statuses)
+        self.assertEqual({"expand": 1, "page": 1}, users.params)
+        self.assertEqual(200, users.size)
+        self.assertEqual(("api", "v1"), self.sitemap.find("a.com/api/v1").label)
+        self.assertEqual(None, self.sitemap.find("a.com/api"))
+        self.assertEqual(4, self.sitemap.find("a.com").total())
+        self.assertEqual(["a.com", "a.com/api/v1", "a.com/api/v1/search",
+                          "a.com/api/v1/users/{id}"],
+                         [p for p, _ in self.sitemap.walk()])
+
+    def test_split(self):
+        self.sitemap.add(_entry("http://a.com/api"))
+        self.assertEqual(1, self.sitemap.find("a.com/api").count)
+        self.assertEqual(("v1",), self.sitemap.find("a.com/api/v1").label)
+        self.assertEqual(5, self.sitemap.nodes)
+
+    def test_ipv6(self):
+        self.sitemap.add(_entry("http://[::1]:8080/api?x=1"))
+        self.assertEqual(1, self.sitemap.find("[::1]/api").count)
+
+    def test_export(self):
+        self.assertEqual(
+            "a.com (4) GET 1; 301 1; 100 B\n"
+            "  /api/v1 (3)\n"
+            "    /search (1) GET 1; 200 1; 0 B ?q\n"
+            "    /users/{id} (2) GET 1, PUT 1; 200 1, 404 1; 200 B "
+            "?expand,page", str(self.sitemap))
+        hosts = json.loads(self.sitemap.to_json())["hosts"]
+        self.assertEqual(4, hosts[0]["total"])
+        self.assertEqual({"404": 1, "200": 1},
+                         hosts[0]["children"][0]["children"][1]["statuses"])
+
+    def test_bounded(self):
+        entries = list(synth.Corpus(seed=2).entries(300))
+        sitemap = Sitemap(max_nodes=40, max_children=5,
+                          max_params=3).update(entries)
+        self.assertEqual(300, sitemap.entries)
+        self.assertTrue(sitemap.nodes <= 40)
+        self.assertEqual(300, sum(node.count for _, node in sitemap.walk()))
+        self.assertTrue(all(len(node.children) <= 6 and
+                            len(node.params) <= 4
+                            for _, node in sitemap.walk()))
+
+    def test_build(self):
+        fd = StringIO()
+        synth.Corpus(seed=2).write_har(fd, 50)
+        fd.seek(0)
+        built = build(fd)
+        hc = har.HarContainer(fd.getvalue())
+        self.assertEqual(str(Sitemap().update(hc.log.entries)), str(built))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+
+import unittest
+from StringIO import StringIO
+
+from sys import path
+
+path.append('./')
+path.append('../')
+import har
+from utils import synth
+
+
+class TestCorpus(unittest.TestCase):
+
+    def setUp(self):
+        self.corpus = synth.Corpus(seed=7, max_body=64 * 1024)
+
+    def test_deterministic(self):
+        first, second = StringIO(), StringIO()
+        self.corpus.write_har(first, 50)
+        synth.Corpus(seed=7, max_body=64 * 1024).write_har(second, 50)
+        self.assertEqual(first.getvalue(), second.getvalue())
+
+    def test_seeds_differ(self):
+        self.assertNotEqual(next(self.corpus.entries(1)),
+                            next(synth.Corpus(seed=8).entries(1)))
+
+    def test_valid_har(self):
+        fd = StringIO()
+        self.corpus.write_har(fd, 200)
+        hc = har.HarContainer(fd.getvalue())
+        self.assertEqual(200, len(hc.log.entries))
+        self.assertEqual(5, len(hc.log.pages))
+
+    def test_raw_round_trip(self):
+        for raw_request, raw_response in self.corpus.raw_pairs(50):
+            response = har.Response(empty=True)
+            response.devour(raw_response)
+            self.assertEqual(raw_response, response.puke())
+            request = har.Request(empty=True)
+            request.devour(raw_request)
+            self.assertEqual(raw_request.split("\r\n")[0],
+                             request.puke().split("\r\n")[0])
+
+    def test_fixed_sizes(self):
+        corpus = synth.Corpus(headers=3, body_size=100)
+        for exchange in corpus.exchanges(50):
+            self.assertEqual(3, len(exchange["response_headers"]))
+            if exchange["kind"] in ("text", "binary") and \
+               exchange["response_body"]:
+                self.assertEqual(100, len(exchange["response_body"]))
+
+    def test_small_max_body(self):
+        corpus = synth.Corpus(max_body=200000, large_body_ratio=1)
+        sizes = [len(exchange["response_body"])
+                 for exchange in corpus.exchanges(20)
+                 if exchange["kind"] in ("text", "binary")]
+        self.assertTrue(sizes and max(sizes) <= 200000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+import unittest
+from urllib import quote
+
+from sys import path
+
+path.append('./')
+path.append('../')
+import har
+from utils.template import RequestTemplate
+
+RAW = ("POST /api/v1/items?id=5&x=1 HTTP/1.1\r\nHost: a.com\r\n"
+       "User-Agent: ua\r\nCookie: sid=abc; t=1\r\n"
+       "Content-Type: application/x-www-form-urlencoded\r\n"
+       "Content-Length: 15\r\n\r\nuser=bob&pass=x")
+
+
+class TestRequestTemplate(unittest.TestCase):
+
+    def setUp(self):
+        self.request = har.Request(empty=True)
+        self.request.devour(RAW)
+        self.template = RequestTemplate(self.request)
+
+    def test_unchanged(self):
+        self.template.mark_query("id")
+        self.template.mark_param("user")
+        compiled = self.template.compile()
+        self.assertEqual(self.request.puke(), compiled.render())
+        self.assertTrue(isinstance(compiled.render(), str))
+
+    def test_places(self):
+        names = [self.template.mark_path(2),
+                 self.template.mark_query("id"),
+                 self.template.mark_header("User-Agent"),
+                 self.template.mark_cookie("sid"),
+                 self.template.mark_param("user")]
+        self.assertEqual(["path:2", "query:id", "header:User-Agent",
+                          "cookie:sid", "param:user"], names)
+        self.assertEqual(
+            "POST /api/v1/P?id=P&x=1 HTTP/1.1\r\nHost: a.com\r\n"
+            "User-Agent: P\r\nCookie: sid=P; t=1\r\n"
+            "Content-Type: application/x-www-form-urlencoded\r\n"
+            "Content-Length: 13\r\n\r\nuser=P&pass=x\r\n",
+            self.template.compile().render("P"))
+        self.assertEqual(RAW + "\r\n", self.request.puke())
+
+    def test_values(self):
+        self.template.mark_query("id")
+        self.template.mark_param("user", quote)
+        compiled = self.template.compile()
+        raw = compiled.render(values={"param:user": "a b&c"})
+        self.assertTrue("?id=5&x=1 " in raw)
+        self.assertTrue("Content-Length: 21\r\n\r\nuser=a%20b%26c&pass=x" in raw)
+        raw = compiled.render("1", {"param:user": "2"})
+        self.assertTrue("?id=1&x=1 " in raw and "user=2&" in raw)
+
+    def test_added(self):
+        self.template.mark_query("new")
+        self.template.mark_header("X-Fuzz")
+        raw = self.template.compile().render("P")
+        self.assertTrue("?id=5&x=1&new=P " in raw)
+        self.assertTrue("\r\nX-Fuzz: P\r\n" in raw)
+        self.assertRaises(ValueError, self.template.mark_cookie, "nope")
+        self.assertRaises(ValueError, self.template.mark_param, "nope")
+
+    def test_body(self):
+        request = har.Request(empty=True)
+        request.devour("POST /x HTTP/1.1\r\nHost: a.com\r\n"
+                       "Content-Type: text/plain\r\n"
+                       "Content-Length: 11\r\n\r\nhello world")
+        template = RequestTemplate(request)
+        template.mark_body(6, 11)
+        self.assertEqual(
+            ["Content-Length: 15\r\n\r\nhello everyone!\r\n",
+             "Content-Length: 7\r\n\r\nhello !\r\n"],
+            [raw[raw.index("Content-Length"):] for raw in
+             template.compile().render_many(["everyone!", "!"])])
+
+    def test_unicode(self):
+        self.template.mark_param("user")
+        raw = self.template.compile().render(u"\u00e9t\u00e9")
+        self.assertTrue(isinstance(raw, str))
+        self.assertTrue(raw.endswith("Content-Length: 17\r\n\r\n"
+                                     "user=\xc3\xa9t\xc3\xa9&pass=x\r\n"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+import json
+import unittest
+
+from sys import path
+
+path.append('./')
+path.append('../')
+import har
+from utils import synth
+
+try:
+    import numpy
+    from utils import timings
+except ImportError:
+    numpy = None
+
+
+def _entry(url, wait, page="page_0", dns=-1):
+    return {"pageref": page,
+            "time": wait + 10,
+            "request": {"url": url, "headersSize": 100, "bodySize": 0},
+            "response": {"status": 200, "headersSize": 80, "bodySize": 5,
+                         "content": {"size": 5}},
+            "timings": {"blocked": -1, "dns": dns, "connect": -1,
+                        "send": 2, "wait": wait, "receive": 8}}
+
+
+@unittest.skipIf(numpy is None, "NumPy is not installed")
+class TestTimingsFrame(unittest.TestCase):
+
+    def setUp(self):
+        self.frame = timings.TimingsFrame(
+            [_entry("http://a.com/api/x?q=1", 10),
+             _entry("http://a.com/api/y", 30, dns=4),
+             _entry("https://B.com:8443/img/z.png", 100, "page_1"),
+             _entry("http://b.com", 50, "page_1")])
+
+    def test_columns(self):
+        self.assertEqual(4, len(self.frame))
+        self.assertEqual([10, 30, 100, 50], list(self.frame["wait"]))
+        self.assertTrue(numpy.isnan(self.frame["dns"][0]))
+        self.assertEqual([12, 36, 102, 52], list(self.frame["ttfb"]))
+
+    def test_unknown(self):
+        entry = _entry("http://[::1]:8080/api/x", -1)
+        entry["timings"]["send"] = -1
+        frame = timings.TimingsFrame([entry, _entry("http://[::1]/a", 0)])
+        self.assertTrue(numpy.isnan(frame["ttfb"][0]))
+        self.assertEqual(2, frame["ttfb"][1])
+        self.assertEqual({"::1": 2}, frame.counts("host"))
+        self.assertEqual({"/api": 1, "/a": 1}, frame.counts("path"))
+
+    def test_percentiles(self):
+        self.assertEqual(40, self.frame.percentiles("wait", 50))
+        by_host = self.frame.percentiles("wait", (0, 100), by="host")
+        self.assertEqual([10, 30], list(by_host["a.com"]))
+        self.assertEqual([50, 100], list(by_host["b.com"]))
+        self.assertTrue(numpy.isnan(
+            self.frame.percentiles("dns", 50, by="host")["b.com"]))
+
+    def test_paths(self):
+        self.assertEqual({"/api": 2, "/img": 1, "/": 1},
+                         self.frame.counts("path"))
+        self.assertEqual({"/api/x": 1, "/api/y": 1, "/img/z.png": 1, "/": 1},
+                         self.frame.counts("path", depth=2))
+
+    def test_slowest(self):
+        self.assertEqual([("page_1", 170.0), ("page_0", 60.0)],
+                         self.frame.slowest("time", by="page"))
+        self.assertEqual({"a.com": 4.0, "b.com": 0.0},
+                         self.frame.totals("dns"))
+
+    def test_log(self):
+        corpus = synth.Corpus(seed=1, body_size=16)
+        hc = har.HarContainer(json.dumps(corpus.har(30)))
+        frame = hc.log.timings_frame()
+        plain = timings.TimingsFrame(corpus.entries(30))
+        self.assertEqual(30, len(frame))
+        self.assertEqual(list(plain["wait"]), list(frame["wait"]))
+        self.assertEqual(plain.counts("page"), frame.counts("page"))
+
+
+if __name__ == '__main__':
+    unittest.main()
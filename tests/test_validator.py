@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+import os
+import json
+import tempfile
+import unittest
+from StringIO import StringIO
+
+from sys import path
+
+path.append('./')
+path.append('../')
+import har
+from utils import synth
+from utils.har_stream import HarReader
+from utils.validator import validate, check, main
+
+
+def _har(count=6, seed=3):
+    return synth.Corpus(seed=seed).har(count)
+
+
+def _errors(log, processes=1):
+    return list(validate(StringIO(json.dumps(log)), processes))
+
+
+class TestCheck(unittest.TestCase):
+
+    def test_clean(self):
+        entry = next(synth.Corpus(seed=3).entries(1))
+        self.assertEqual([], check(har.Entry, entry, "e", []))
+
+    def test_all_problems(self):
+        entry = next(synth.Corpus(seed=3).entries(1))
+        del entry["request"]["url"]
+        entry["response"]["status"] = "200"
+        entry["startedDateTime"] = "yesterday"
+        paths = [p for p, _ in check(har.Entry, entry, "e", [])]
+        self.assertEqual(["e.request.url", "e.response.status",
+                          "e.startedDateTime"], sorted(paths))
+
+    def test_not_an_object(self):
+        self.assertEqual([("e", "must be an object, not list")],
+                         check(har.Entry, [], "e", []))
+
+
+class TestValidate(unittest.TestCase):
+
+    def test_clean(self):
+        self.assertEqual([], _errors(_har()))
+        fd = StringIO()
+        synth.Corpus(seed=3).write_har(fd, 6)
+        self.assertEqual([], list(validate(StringIO(fd.getvalue()), 1)))
+
+    def test_in_entry_order(self):
+        log = _har()
+        entries = log["log"]["entries"]
+        del entries[4]["response"]["headers"][0]["value"]
+        entries[1]["connection"] = 443
+        entries[5]["pageref"] = "page_9"
+        self.assertEqual([
+            (1, "log.entries[1].connection"),
+            (4, "log.entries[4].response.headers[0].value"),
+            (5, "log.entries[5].pageref")],
+            [(i, p) for i, p, _ in _errors(log)])
+
+    def test_log(self):
+        log = _har()
+        del log["log"]["creator"]
+        log["log"]["pages"][0]["comment"] = 1
+        log["log"]["pages"].append(dict(log["log"]["pages"][0]))
+        self.assertEqual([(None, "log.creator"),
+                          (None, "log.pages[0].comment"),
+                          (None, "log.pages[1].comment"),
+                          (None, "log.pages")],
+                         [(i, p) for i, p, _ in _errors(log)])
+
+    def test_broken_json(self):
+        errors = list(validate(StringIO('{"log": {"entries": [{}, {'), 1))
+        self.assertEqual((1, "log.entries"), errors[-1][:2])
+        self.assertEqual([(None, "log")],
+                         [e[:2] for e in validate(StringIO("[]"), 1)])
+
+    def test_broken_in_workers(self):
+        text = json.dumps(_har(12))
+        spans = list(HarReader(StringIO(text)).spans())
+        stray = text[:spans[1][0] + 1] + "]" + text[spans[1][0] + 1:]
+        cut = text[:spans[11][0] + 10]
+        for broken, index in (stray, 1), (cut, 11):
+            errors = list(validate(StringIO(broken), processes=2))
+            self.assertEqual([(index, "log.entries")],
+                             [e[:2] for e in errors])
+        self.assertEqual("Unexpected ']' at byte {0}".format(
+            spans[1][0] + 1), list(validate(StringIO(stray), 1))[0][2])
+
+    def test_processes(self):
+        log = _har(12)
+        log["log"]["entries"][9]["request"]["method"] = None
+        self.assertEqual(_errors(log), _errors(log, processes=2))
+        self.assertEqual([9], [i for i, _, _ in _errors(log, processes=2)])
+
+    def test_main(self):
+        fd, name = tempfile.mkstemp(prefix="harpy-test-")
+        try:
+            with os.fdopen(fd, 'w') as out:
+                json.dump(_har(), out)
+            self.assertEqual(0, main(["validator", name]))
+            self.assertEqual(2, main(["validator"]))
+        finally:
+            os.remove(name)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+import json
+import unittest
+
+from sys import path
+
+path.append('./')
+path.append('../')
+import har
+from utils import synth
+from utils.waterfall import Waterfall, _epoch_ms
+
+
+def _entry(url, start, time, page="page_0", blocked=-1):
+    return {"pageref": page,
+            "startedDateTime": "2013-01-01T00:00:{0:06.3f}Z".format(start),
+            "time": time,
+            "request": {"url": url},
+            "timings": {"blocked": blocked, "send": 0, "wait": time,
+                        "receive": 0}}
+
+
+class TestEpoch(unittest.TestCase):
+
+    def test_formats(self):
+        expected = 1239880045123.0
+        self.assertEqual(expected, _epoch_ms("2009-04-16T12:07:25.123+01:00"))
+        self.assertEqual(expected, _epoch_ms("2009-04-16T11:07:25.123Z"))
+        self.assertEqual(expected, _epoch_ms("2009-04-16T11:07:25.123+0000"))
+        self.assertEqual(expected, _epoch_ms("Thu, 16 Apr 2009 11:07:25.123 "
+                                             "GMT"))
+        page = har.Page('{"startedDateTime": "2009-04-16T12:07:25.123+01:00",'
+                        ' "id": "p", "title": "", "pageTimings": {}}')
+        self.assertEqual(expected, _epoch_ms(page.startedDateTime))
+
+
+class TestWaterfall(unittest.TestCase):
+
+    def setUp(self):
+        # html, then css and js in parallel, then an image the js loads
+        entries = [_entry("http://a.com/", 0, 100),
+                   _entry("http://a.com/app.js", 0.1, 300, blocked=20),
+                   _entry("http://a.com/style.css", 0.1, 100),
+                   _entry("http://a.com/logo.png", 0.5, 200),
+                   _entry("http://b.com/", 5, 10, page="page_1")]
+        pages = [{"id": "page_0", "title": "",
+                  "startedDateTime": "2013-01-01T00:00:00Z",
+                  "pageTimings": {"onLoad": 750}}]
+        self.waterfall = Waterfall(entries, pages)
+        self.load = self.waterfall["page_0"]
+
+    def urls(self, entries):
+        return [entry["request"]["url"] for entry in entries]
+
+    def test_index(self):
+        self.assertEqual(["page_0", "page_1"], list(self.waterfall))
+        self.assertEqual(["http://a.com/", "http://a.com/app.js",
+                          "http://a.com/style.css", "http://a.com/logo.png"],
+                         self.urls(self.load.entries))
+        self.assertEqual(1, len(self.waterfall["page_1"]))
+        self.assertEqual(0, self.waterfall["page_1"].bars[0][0])
+
+    def test_critical_path(self):
+        self.assertEqual(["http://a.com/", "http://a.com/app.js",
+                          "http://a.com/logo.png"],
+                         self.urls(bar[2] for bar in
+                                   self.load.critical_path()))
+        self.assertEqual(["http://a.com/app.js", "http://a.com/logo.png"],
+                         self.urls(self.load.dominant(2)))
+
+    def test_summary(self):
+        summary = self.load.summary()
+        self.assertEqual(700, summary["span"])
+        self.assertEqual(750, summary["onLoad"])
+        self.assertEqual(2, summary["max_parallel"])
+        self.assertEqual(20, summary["blocked"])
+        self.assertEqual(100, round(summary["idle"]))
+
+    def test_log(self):
+        hc = har.HarContainer(json.dumps(synth.Corpus(seed=1).har(90)))
+        waterfall = hc.log.waterfall()
+        self.assertEqual(["page_0", "page_1", "page_2"], list(waterfall))
+        self.assertEqual(90, sum(len(waterfall[ref]) for ref in waterfall))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,281 @@
+#!/usr/bin/env python
+# offline benchmarks for the hot paths
+"""Benchmarks for loading, validating, devouring, puking, replacing
+and serializing HARs.
+
+Everything runs offline against synthetic data from utils.synth, so a
+run is the same from one machine and one commit to the next. From the top of the
+source tree::
+
+    $ python -m utils.bench
+    $ python -m utils.bench --entries 10000 --headers 20 --body 65536
+    $ python -m utils.bench --compare old_bench_output.txt
+
+Each benchmark runs in a forked child, so the peak memory reported is
+that benchmark's own. It is run --repeat times (3 by default) and the
+fastest run is kept. Results are printed and also written, one json
+record per line, to bench_output.txt (see --output). With --compare,
+each result is shown next to the matching one from an earlier output
+file, so a regression between two commits shows up as a ratio.
+
+"""
+
+import os
+import sys
+import json
+import time
+import subprocess
+
+try:
+    from ..har import HarContainer, Entry, Request, Response
+    from .synth import Corpus
+except (ValueError, ImportError):
+    from har import HarContainer, Entry, Request, Response
+    from utils.synth import Corpus
+
+
+###############################################################################
+# Constants
+###############################################################################
+OUTPUT = "bench_output.txt"
+
+
+###############################################################################
+# Synthetic data
+###############################################################################
+
+
+def _corpus(params):
+    return Corpus(seed=params["seed"], headers=params["headers"],
+                  body_size=params["body_size"])
+
+
+def synthetic_har(entries=1000, headers=10, body_size=1024, seed=0):
+    """Return a HAR, as a dictionary, of `entries` entries with
+    `headers` extra headers in each request and response and bodies of
+    `body_size` bytes."""
+    return Corpus(seed=seed, headers=headers,
+                  body_size=body_size).har(entries)
+
+
+###############################################################################
+# Benchmarks
+###############################################################################
+
+
+def _walk_validate(cls, data):
+    obj = cls(empty=True)
+    obj.__dict__.update(data)
+    obj.validate_input()
+
+
+def bench_load(params):
+    data = json.dumps(synthetic_har(**params))
+    start = time.time()
+    HarContainer(data)
+    return time.time() - start, len(data)
+
+
+def bench_validate(params):
+    entries = synthetic_har(**params)["log"]["entries"]
+    start = time.time()
+    for entry in entries:
+        _walk_validate(Entry, entry)
+        _walk_validate(Request, entry["request"])
+        _walk_validate(Response, entry["response"])
+    return time.time() - start, len(json.dumps(entries))
+
+
+def _raw(params, kind):
+    pairs = _corpus(params).raw_pairs(params["entries"])
+    return [pair[kind is Response] for pair in pairs]
+
+
+def _devour(raws, kind):
+    messages = []
+    for raw in raws:
+        message = kind(empty=True)
+        message.devour(raw)
+        messages.append(message)
+    return messages
+
+
+def bench_devour_request(params):
+    raws = _raw(params, Request)
+    start = time.time()
+    _devour(raws, Request)
+    return time.time() - start, sum(len(r) for r in raws)
+
+
+def bench_devour_response(params):
+    raws = _raw(params, Response)
+    start = time.time()
+    _devour(raws, Response)
+    return time.time() - start, sum(len(r) for r in raws)
+
+
+def bench_puke_request(params):
+    raws = _raw(params, Request)
+    messages = _devour(raws, Request)
+    start = time.time()
+    for message in messages:
+        message.puke()
+    return time.time() - start, sum(len(r) for r in raws)
+
+
+def bench_puke_response(params):
+    raws = _raw(params, Response)
+    messages = _devour(raws, Response)
+    start = time.time()
+    for message in messages:
+        message.puke()
+    return time.time() - start, sum(len(r) for r in raws)
+
+
+def bench_replace(params):
+    request = HarContainer(synthetic_har(**dict(params, entries=1))
+                           ).log.entries[0].request
+    start = time.time()
+    for i in xrange(params["entries"]):
+        request.replace(url="http://example.com/{0}".format(i))
+    return time.time() - start, len(request.to_json()) * params["entries"]
+
+
+def bench_to_json(params):
+    hc = HarContainer(synthetic_har(**params))
+    start = time.time()
+    data = hc.to_json()
+    return time.time() - start, len(data)
+
+
+BENCHMARKS = [("load", bench_load),
+              ("validate", bench_validate),
+              ("devour_request", bench_devour_request),
+              ("devour_response", bench_devour_response),
+              ("puke_request", bench_puke_request),
+              ("puke_response", bench_puke_response),
+              ("replace", bench_replace),
+              ("to_json", bench_to_json)]
+
+
+###############################################################################
+# Running
+###############################################################################
+
+
+def _in_child(func, params):
+    """Run func(params) in a forked child and return its timing, the
+    bytes it processed and its peak memory in KB."""
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if not pid:
+        os.close(read_fd)
+        try:
+            result = func(params)
+        except Exception, err:
+            result = (None, repr(err))
+        os.write(write_fd, json.dumps(result))
+        os._exit(0)
+    os.close(write_fd)
+    data = ""
+    chunk = os.read(read_fd, 4096)
+    while chunk:
+        data += chunk
+        chunk = os.read(read_fd, 4096)
+    os.close(read_fd)
+    _, _, rusage = os.wait4(pid, 0)
+    seconds, size = json.loads(data)
+    return seconds, size, rusage.ru_maxrss
+
+
+def _commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            stderr=open(os.devnull, 'w')).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(entries=1000, headers=10, body_size=1024, seed=0, only=None,
+        repeat=3):
+    """Run the benchmarks and return a list of result dictionaries."""
+    params = {"entries": entries, "headers": headers,
+              "body_size": body_size, "seed": seed}
+    commit = _commit()
+    results = []
+    for name, func in BENCHMARKS:
+        if only and name not in only:
+            continue
+        runs = [_in_child(func, params) for _ in range(repeat)]
+        seconds, size, peak = min(runs)
+        result = dict(params, name=name, commit=commit,
+                      python=sys.version.split()[0],
+                      seconds=seconds, peak_kb=peak)
+        if seconds is None:
+            result["error"] = size
+        else:
+            result["entries_per_sec"] = entries / max(seconds, 1e-9)
+            result["mb_per_sec"] = size / max(seconds, 1e-9) / 2 ** 20
+        results.append(result)
+    return results
+
+
+def load_results(path):
+    with open(path) as fd:
+        return [json.loads(line) for line in fd if line.strip()]
+
+
+def report(results, previous=None):
+    """Return the results as a table, with the ratio to the matching
+    result in `previous` if given."""
+    old = dict((r["name"], r) for r in previous or [])
+    lines = ["{0:<16} {1:>10} {2:>12} {3:>10} {4:>10}{5}".format(
+        "benchmark", "seconds", "entries/s", "MB/s", "peak KB",
+        previous and "   vs old" or "")]
+    for r in results:
+        if "error" in r:
+            lines.append("{0:<16} failed: {1}".format(r["name"], r["error"]))
+            continue
+        line = "{0:<16} {1:>10.4f} {2:>12.0f} {3:>10.2f} {4:>10}".format(
+            r["name"], r["seconds"], r["entries_per_sec"], r["mb_per_sec"],
+            r["peak_kb"])
+        if r["name"] in old and old[r["name"]].get("seconds"):
+            line += "   {0:>5.2f}x".format(
+                old[r["name"]]["seconds"] / max(r["seconds"], 1e-9))
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def usage(progn):
+    use = ("usage: %s [--entries N] [--headers N] [--body N] [--seed N] "
+           "[--repeat N] [--only name,...] [--output path] [--compare path]"
+           "\n\n" % progn)
+    use += "Run the offline benchmarks. Benchmarks are: "
+    use += ", ".join(name for name, _ in BENCHMARKS)
+    return use
+
+
+def main(argv):
+    opts = {"--entries": "1000", "--headers": "10", "--body": "1024",
+            "--seed": "0", "--repeat": "3", "--output": OUTPUT}
+    args = argv[1:]
+    while args:
+        flag = args.pop(0)
+        if flag in ("-h", "--help") or not args:
+            print usage(argv[0])
+            return
+        opts[flag] = args.pop(0)
+    results = run(int(opts["--entries"]), int(opts["--headers"]),
+                  int(opts["--body"]), int(opts["--seed"]),
+                  "--only" in opts and opts["--only"].split(",") or None,
+                  int(opts["--repeat"]))
+    previous = "--compare" in opts and load_results(opts["--compare"])
+    print report(results, previous)
+    with open(opts["--output"], 'w') as fd:
+        for result in results:
+            fd.write(json.dumps(result, sort_keys=True) + "\n")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
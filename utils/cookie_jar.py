@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+# cookie jar for replaying sessions
+"""Keep the cookies servers set and send them back on later requests.
+
+`Response.devour` turns Set-Cookie headers in to Cookie objects but
+nothing sends them on again, so a replayed session goes out with
+whatever cookies were captured, which have usually expired. A
+CookieJar takes in the cookies of each response and puts the ones that
+apply on each request before it is sent::
+
+    In [0]: jar = CookieJar()
+
+    In [1]: jar.ingest(entry.response, entry.request.url)
+
+    In [2]: jar.apply(next_request)
+
+    In [3]: next_request.cookies
+    Out[3]: [<Cookie 'session' set to 'f00': ('name', 'value')>]
+
+Cookies are indexed by the registrable domain of the host that set
+them, then by their own domain, then by a trie of their path, so
+finding the cookies for a request is a handful of dictionary lookups
+per label of its host and segment of its path however many cookies are
+held. Expired cookies are dropped as they are found, Secure cookies
+only go over https and HttpOnly cookies are left out of
+`cookies_for(url, http=False)`, which is what a script would see.
+
+There is no public suffix list here. The registrable domain is taken
+to be the last two labels of a host, or three for hosts like
+example.co.uk, and cookies set for anything shorter are refused.
+
+"""
+
+import time
+from urlparse import urlsplit
+
+try:
+    from .._internal import _epoch_ms
+    from ..har import Cookie, Header
+except (ValueError, ImportError):
+    from _internal import _epoch_ms
+    from har import Cookie, Header
+
+
+###############################################################################
+# Constants
+###############################################################################
+SECOND_LEVEL = frozenset(["ac", "co", "com", "edu", "gov", "ltd", "me",
+                          "net", "org", "plc", "sch"])
+
+
+###############################################################################
+# Helpers
+###############################################################################
+
+
+def _now_ms():
+    return time.time() * 1000
+
+
+def _registrable(host):
+    """Return the part of `host` a cookie can be set for at most."""
+    labels = host.split(".")
+    if labels[-1].isdigit(): # an IP address
+        return host
+    if len(labels) > 2 and len(labels[-1]) == 2 and \
+       labels[-2] in SECOND_LEVEL:
+        return ".".join(labels[-3:])
+    return ".".join(labels[-2:])
+
+
+def _segments(path):
+    return [segment for segment in (path or "/").split("/") if segment]
+
+
+def _default_path(path):
+    # RFC 6265 5.1.4, the directory of the request path
+    if not path.startswith("/") or path.count("/") == 1:
+        return "/"
+    return path[:path.rfind("/")]
+
+
+class _Stored(object):
+    """A cookie as the jar keeps it."""
+
+    __slots__ = ["cookie", "domain", "path", "expires", "secure",
+                 "http_only", "host_only", "created"]
+
+    def __init__(self, cookie, domain, path, expires, host_only, created):
+        self.cookie = cookie
+        self.domain = domain
+        self.path = path
+        self.expires = expires
+        self.secure = bool(cookie._get("secure", False))
+        self.http_only = bool(cookie._get("httpOnly", False))
+        self.host_only = host_only
+        self.created = created
+
+
+class _PathNode(object):
+
+    __slots__ = ["children", "cookies"]
+
+    def __init__(self):
+        self.children = {}
+        self.cookies = {}
+
+
+###############################################################################
+# Interface Functions and Classes
+###############################################################################
+
+
+class CookieJar(object):
+    """Cookies set by responses, ready to be put on requests."""
+
+    def __init__(self):
+        self._sites = {} # registrable domain -> cookie domain -> path trie
+        self._count = 0
+        self._created = 0
+
+    def __len__(self):
+        return self._count
+
+    def __repr__(self):
+        return "<CookieJar: {0} cookies for {1} sites>".format(
+            self._count, len(self._sites))
+
+    def __iter__(self):
+        for domains in self._sites.itervalues():
+            for root in domains.itervalues():
+                nodes = [root]
+                while nodes:
+                    node = nodes.pop()
+                    for stored in node.cookies.itervalues():
+                        yield stored.cookie
+                    nodes.extend(node.children.itervalues())
+
+    def add(self, cookie, url, now=None):
+        """Add a Cookie set by a response to a request for `url`.
+        Returns False if the cookie was refused, or was a deletion."""
+        now = now is None and _now_ms() or now
+        parts = urlsplit(url)
+        host = (parts.hostname or "").lower()
+        domain = cookie._get("domain", None)
+        host_only = not domain
+        domain = (domain or host).lstrip(".").lower()
+        site = _registrable(host)
+        if not host or not (host == domain or host.endswith("." + domain)) \
+           or len(domain) < len(site):
+            return False
+        path = cookie._get("path", None)
+        if not path or not path.startswith("/"):
+            path = _default_path(parts.path or "/")
+        expires = self._expires(cookie, now)
+        node = self._node(site, domain, path, expires is None or
+                          expires > now)
+        if node is None:
+            return False
+        old = node.cookies.pop(cookie.name, None)
+        if old is not None:
+            self._count -= 1
+        if expires is not None and expires <= now:
+            return False
+        self._created += 1
+        node.cookies[cookie.name] = _Stored(
+            cookie, domain, path, expires, host_only,
+            old and old.created or self._created)
+        self._count += 1
+        return True
+
+    def _expires(self, cookie, now):
+        # Max-Age wins over Expires, no expiry at all is a session cookie
+        max_age = cookie._get("max-age", None)
+        if max_age is not None:
+            try:
+                return now + int(max_age) * 1000
+            except ValueError:
+                pass
+        expires = cookie._get("expires", None)
+        if expires:
+            try:
+                return _epoch_ms(expires)
+            except (ValueError, TypeError, OverflowError):
+                pass
+        return None
+
+    def _node(self, site, domain, path, create):
+        domains = self._sites.get(site)
+        if domains is None:
+            if not create:
+                return None
+            domains = self._sites[site] = {}
+        node = domains.get(domain)
+        if node is None:
+            if not create:
+                return None
+            node = domains[domain] = _PathNode()
+        for segment in _segments(path):
+            child = node.children.get(segment)
+            if child is None:
+                if not create:
+                    return None
+                child = node.children[segment] = _PathNode()
+            node = child
+        return node
+
+    def ingest(self, response, url, now=None):
+        """Add every cookie `response`, the answer to a request for
+        `url`, set. Returns the number kept."""
+        return sum(self.add(cookie, url, now)
+                   for cookie in response._get("cookies", []))
+
+    def ingest_entry(self, entry, now=None):
+        return self.ingest(entry.response, entry.request.url, now)
+
+    def cookies_for(self, url, http=True, now=None):
+        """Return the Cookies to send with a request for `url`, longest
+        path first. With http=False HttpOnly cookies are left out."""
+        now = now is None and _now_ms() or now
+        parts = urlsplit(url)
+        host = (parts.hostname or "").lower()
+        domains = self._sites.get(_registrable(host))
+        if not domains:
+            return []
+        secure = parts.scheme in ("https", "wss")
+        segments = _segments(parts.path)
+        found = []
+        labels = host.split(".")
+        for i in xrange(len(labels)):
+            domain = ".".join(labels[i:])
+            node = domains.get(domain)
+            depth = 0
+            while node is not None:
+                for name, stored in node.cookies.items():
+                    if stored.expires is not None and stored.expires <= now:
+                        del node.cookies[name]
+                        self._count -= 1
+                    elif (secure or not stored.secure) and \
+                         (http or not stored.http_only) and \
+                         (domain == host or not stored.host_only):
+                        found.append((-depth, stored.created, stored.cookie))
+                if depth == len(segments):
+                    break
+                node = node.children.get(segments[depth])
+                depth += 1
+        found.sort()
+        return [cookie for _, _, cookie in found]
+
+    def apply(self, request, now=None):
+        """Set the cookies of `request`, and its Cookie header, to what
+        the jar holds for its url. Returns the cookies."""
+        cookies = self.cookies_for(request.url, now=now)
+        request.cookies = [Cookie({"name": cookie.name,
+                                   "value": cookie.value})
+                           for cookie in cookies]
+        headers = request._get("headers", [])
+        place = [i for i, header in enumerate(headers)
+                 if header.name.lower() == "cookie"]
+        headers = [header for header in headers
+                   if header.name.lower() != "cookie"]
+        if cookies:
+            header = Header({"name": "Cookie", "value": "; ".join(
+                "{0}={1}".format(c.name, c.value) for c in cookies)})
+            headers.insert(place[0] if place else len(headers), header)
+        request.headers = headers
+        return request.cookies
+
+    def expire(self, now=None):
+        """Drop every cookie that has expired."""
+        now = now is None and _now_ms() or now
+        for domains in self._sites.itervalues():
+            for root in domains.itervalues():
+                nodes = [root]
+                while nodes:
+                    node = nodes.pop()
+                    for name, stored in node.cookies.items():
+                        if stored.expires is not None and \
+                           stored.expires <= now:
+                            del node.cookies[name]
+                            self._count -= 1
+                    nodes.extend(node.children.itervalues())
+
+    def clear(self):
+        self._sites = {}
+        self._count = 0
@@ -0,0 +1,319 @@
+#!/usr/bin/env python
+# patching HAR files in place
+"""Add entries to a HAR file, or replace one of them, without loading or
+rewriting the whole of it.
+
+Adding a few results to a capture of several GB would otherwise mean
+reading all of it in to a HarContainer and writing all of it out
+again. A HarFile instead keeps an index of where each entry starts and
+stops in the file, next to it as `<file>.idx`, and only writes the
+bytes that change::
+
+    In [0]: capture = HarFile('capture.har')
+
+    In [1]: capture.append([entry, another])
+
+    In [2]: capture.replace(12, fixed)
+
+    In [3]: capture.read(12)["request"]["url"]
+
+Appending rewrites the end of the file from the "]" that closes the
+entries. A replacement no bigger than the entry it replaces is written
+over it and padded with spaces, so nothing else moves. A bigger one
+moves everything after it, so that is rewritten too. The index is
+built with a HarReader the first time, and again whenever the file
+has changed size or time since.
+
+The file is never left half written. Before it is touched, the bytes
+about to be overwritten go to `<file>.journal`, which only appears,
+by rename, once it is complete. The journal is removed once the file
+is, and a HarFile opened while there is one first puts those bytes
+back, undoing the change that did not finish. From the shell::
+
+    $ python -m utils.har_patch append capture.har more.har
+    $ python -m utils.har_patch replace capture.har 12 entry.json
+
+"""
+
+import os
+import sys
+import json
+
+try:
+    from .har_stream import HarReader
+except (ValueError, ImportError):
+    from utils.har_stream import HarReader
+
+
+###############################################################################
+# Constants
+###############################################################################
+INDEX_SUFFIX = ".idx"
+JOURNAL_SUFFIX = ".journal"
+READ_SIZE = 1024 * 1024
+COPY_SIZE = 1024 * 1024
+SEPARATOR = ", "
+
+
+###############################################################################
+# Helpers
+###############################################################################
+
+
+def _entry_json(entry):
+    if isinstance(entry, unicode):
+        return entry.encode("utf-8")
+    if isinstance(entry, str):
+        return entry
+    if isinstance(entry, dict):
+        return json.dumps(entry)
+    return entry.to_json()
+
+
+def _copy(src, dst, count):
+    # copy `count` bytes, or all that is left if None, from src to dst
+    while count is None or count > 0:
+        data = src.read(COPY_SIZE if count is None
+                        else min(COPY_SIZE, count))
+        if not data:
+            break
+        dst.write(data)
+        if count is not None:
+            count -= len(data)
+
+
+def _sync(fd):
+    fd.flush()
+    os.fsync(fd.fileno())
+
+
+def _sync_dir(path):
+    # make a rename or a removal in the directory of `path` stick
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _write_atomic(path, data):
+    temp = path + ".tmp"
+    with open(temp, 'wb') as fd:
+        fd.write(data)
+        _sync(fd)
+    os.rename(temp, path)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+###############################################################################
+# Interface Functions and Classes
+###############################################################################
+
+
+class HarFile(object):
+    """A HAR file on disk, to be added to or patched an entry at a time.
+
+    `spans` holds the (start, stop) offsets in the file of each entry,
+    stop being where the "," or "]" after it is, and `end` the offset
+    of the "]" that closes the entries. Entries can be given as Entry
+    objects, as their json or as dictionaries."""
+
+    def __init__(self, path):
+        self.path = path
+        self.spans = []
+        self.end = None
+        self._stat = None
+        self._recover()
+        self._load_index()
+
+    def __repr__(self):
+        return "<HarFile: {0}, {1} entries>".format(self.path,
+                                                   len(self.spans))
+
+    def __len__(self):
+        return len(self.spans)
+
+    # -- the index -------------------------------------------------------
+
+    def _file_stat(self):
+        stat = os.stat(self.path)
+        return [stat.st_size, stat.st_mtime]
+
+    def _load_index(self):
+        try:
+            with open(self.path + INDEX_SUFFIX, 'rb') as fd:
+                index = json.load(fd)
+        except (IOError, ValueError):
+            index = None
+        if index and index.get("stat") == self._file_stat():
+            self.spans = [tuple(span) for span in index["spans"]]
+            self.end = index["end"]
+            self._stat = index["stat"]
+        else:
+            self.reindex()
+
+    def reindex(self):
+        """Build the index from the file and save it."""
+        with open(self.path, 'rb') as fd:
+            reader = HarReader(fd, READ_SIZE)
+            spans = list(reader.spans())
+        if reader.entries_end is None:
+            raise ValueError("{0} has no entries to patch".format(self.path))
+        self.spans = spans
+        self.end = reader.entries_end
+        self._save_index()
+
+    def _save_index(self):
+        self._stat = self._file_stat()
+        _write_atomic(self.path + INDEX_SUFFIX, json.dumps(
+            {"stat": self._stat, "end": self.end, "spans": self.spans}))
+
+    def _check_index(self):
+        # another writer may have been at the file since it was indexed
+        if self._file_stat() != self._stat:
+            self.reindex()
+
+    # -- the journal -----------------------------------------------------
+
+    def _recover(self):
+        journal = self.path + JOURNAL_SUFFIX
+        _remove(journal + ".tmp") # never renamed, so the file is as it was
+        if not os.path.exists(journal):
+            return
+        with open(journal, 'rb') as saved:
+            header = json.loads(saved.readline())
+            with open(self.path, 'r+b') as fd:
+                fd.seek(header["offset"])
+                _copy(saved, fd, None)
+                fd.truncate(header["size"])
+                _sync(fd)
+        _remove(self.path + INDEX_SUFFIX)
+        os.remove(journal)
+        _sync_dir(self.path)
+
+    def _patch(self, start, stop, text):
+        # put `text` where the bytes from start to stop are, moving what
+        # is after them along if it is not the same length
+        shift = len(text) - (stop - start)
+        size = os.path.getsize(self.path)
+        saved_end = shift and size or stop
+        journal = self.path + JOURNAL_SUFFIX
+        with open(self.path, 'r+b') as fd:
+            with open(journal + ".tmp", 'wb') as saved:
+                saved.write(json.dumps({"offset": start, "size": size}))
+                saved.write("\n")
+                header = saved.tell()
+                fd.seek(start)
+                _copy(fd, saved, saved_end - start)
+                _sync(saved)
+            os.rename(journal + ".tmp", journal)
+            _sync_dir(self.path)
+            fd.seek(start)
+            fd.write(text)
+            if shift:
+                with open(journal, 'rb') as saved:
+                    saved.seek(header + stop - start)
+                    _copy(saved, fd, None)
+                fd.truncate(size + shift)
+            _sync(fd)
+        if shift:
+            self.spans = [(s + shift, t + shift) if s >= stop else (s, t)
+                          for s, t in self.spans]
+            self.end += shift
+        return journal
+
+    def _commit(self, journal):
+        self._save_index()
+        os.remove(journal)
+        _sync_dir(self.path)
+
+    # -- entries ---------------------------------------------------------
+
+    def read(self, index):
+        """Return the entry at `index` as a json dictionary."""
+        self._check_index()
+        start, stop = self.spans[index]
+        with open(self.path, 'rb') as fd:
+            fd.seek(start)
+            return json.loads(fd.read(stop - start))
+
+    def append(self, entries):
+        """Add `entries` to the end of the log, returning how many there
+        were."""
+        self._check_index()
+        texts = [_entry_json(entry) for entry in entries]
+        if not texts:
+            return 0
+        text = SEPARATOR.join(texts)
+        start = self.end
+        if self.spans:
+            text = SEPARATOR + text
+            start += len(SEPARATOR)
+        journal = self._patch(self.end, self.end, text)
+        for entry in texts:
+            self.spans.append((start, start + len(entry)))
+            start += len(entry) + len(SEPARATOR)
+        self._commit(journal)
+        return len(texts)
+
+    def replace(self, index, entry):
+        """Put `entry` in the place of the entry at `index`."""
+        self._check_index()
+        start, stop = self.spans[index]
+        text = _entry_json(entry)
+        room = stop - start
+        if len(text) <= room:
+            journal = self._patch(start, stop, text.ljust(room))
+        else:
+            journal = self._patch(start, stop, text)
+            self.spans[index] = (start, start + len(text))
+        self._commit(journal)
+
+
+def append(path, entries):
+    """append(path, entries) -> int
+
+    Add `entries` to the end of the HAR file at `path`."""
+    return HarFile(path).append(entries)
+
+
+def replace(path, index, entry):
+    """replace(path, index, entry) -> None
+
+    Put `entry` in the place of the entry at `index` in the HAR file at
+    `path`."""
+    HarFile(path).replace(index, entry)
+
+
+def usage(progn):
+    use = ("usage: %s append file.har more.har [more.har ...]\n"
+           "       %s replace file.har INDEX entry.json\n\n"
+           % (progn, progn))
+    use += ("Add the entries of other HARs to a HAR, or replace one of its "
+            "entries, in place.")
+    return use
+
+
+def main(argv):
+    args = argv[1:]
+    if len(args) >= 3 and args[0] == "append":
+        capture = HarFile(args[1])
+        for path in args[2:]:
+            with open(path, 'rb') as fd:
+                capture.append(HarReader(fd, READ_SIZE).raw())
+        print "{0}: {1} entries".format(args[1], len(capture))
+    elif len(args) == 4 and args[0] == "replace":
+        with open(args[3], 'rb') as fd:
+            replace(args[1], int(args[2]), fd.read().strip())
+    else:
+        print usage(argv[0])
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,555 @@
+#!/usr/bin/env python
+# streaming HAR files
+"""Read and write HAR files an entry at a time.
+
+A HarContainer holds every entry of a log in memory. That is fine for
+a browser capture but not for a proxy that runs for days. A HarWriter
+writes the log header once and then each entry as it is handed over,
+so only one entry needs to be in memory at a time::
+
+    In [0]: with HarWriter(open('capture.har', 'w')) as writer:
+       ...:     for entry in entries:
+       ...:         writer.write(entry)
+
+The file is a normal HAR once the writer has been closed.
+
+A HarReader goes the other way. It reads the log header and then hands
+out the entries, as json dictionaries, one at a time as it reads them::
+
+    In [1]: reader = HarReader(open('capture.har'))
+
+    In [2]: for entry in reader:
+       ...:     print entry["request"]["url"]
+
+Built on those two, `merge` interleaves several HARs in to one by
+startedDateTime and `split` cuts one in to parts by entry count, time
+window or host, both without ever holding more than an entry per input
+(and the pages) in memory. From the shell::
+
+    $ python -m utils.har_stream merge all.har proxy1.har proxy2.har
+    $ python -m utils.har_stream split big.har window 3600 hourly-
+
+"""
+
+import re
+import sys
+import json
+import heapq
+from collections import OrderedDict
+from time import gmtime, strftime
+from urlparse import urlsplit
+
+try:
+    from .._internal import _epoch_ms
+    from ..har import Creator
+except (ValueError, ImportError):
+    from _internal import _epoch_ms
+    from har import Creator
+
+
+###############################################################################
+# Constants
+###############################################################################
+READ_SIZE = 65536
+MAX_OPEN_PARTS = 64 # part files split keeps open at once
+MAX_VALUE_SIZE = 512 * 1024 * 1024 # no entry is larger, it is broken json
+WHITESPACE = " \t\r\n"
+STRUCTURE = re.compile(r'["{}\[\]]')
+DECODE_POSITION = re.compile(r": line \d+ column \d+ \(char (\d+)\).*$")
+CLOSERS = {"}": "{", "]": "["}
+
+
+###############################################################################
+# Writers
+###############################################################################
+
+
+def _write_json(fd, obj):
+    if isinstance(obj, basestring):
+        fd.write(obj)
+    else:
+        obj.dump(fd)
+
+
+class HarWriter(object):
+    """Writes a HAR log to the file like object `fd` one entry at a
+    time. `pages` is a list of Page objects, or of their json, written
+    in to the log header, `creator` defaults to Harpy. Pages that are
+    not known up front can be added with `write_page` instead."""
+
+    def __init__(self, fd, creator=None, pages=None, version="1.2"):
+        self.fd = fd
+        self.entries = 0
+        self.closed = False
+        fd.write('{"log": {"version": ')
+        fd.write(json.dumps(version))
+        fd.write(', "creator": ')
+        _write_json(fd, creator or Creator())
+        if pages is not None:
+            fd.write(', "pages": [')
+            for i, page in enumerate(pages):
+                if i:
+                    fd.write(', ')
+                _write_json(fd, page)
+            fd.write(']')
+        self._late_pages = None # pages not in the header go after entries
+        if pages is None:
+            self._late_pages = []
+        fd.write(', "entries": [')
+
+    def __repr__(self):
+        return "<HarWriter: {0} entries{1}>".format(
+            self.entries, self.closed and ", closed" or "")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, entry):
+        """Append `entry` to the log."""
+        assert not self.closed, "Cannot write to a closed HarWriter"
+        if self.entries:
+            self.fd.write(', ')
+        entry.dump(self.fd)
+        self.entries += 1
+
+    def write_raw(self, entry_json):
+        """Append an entry that is already json."""
+        assert not self.closed, "Cannot write to a closed HarWriter"
+        if self.entries:
+            self.fd.write(', ')
+        self.fd.write(entry_json)
+        self.entries += 1
+
+    def write_page(self, page):
+        """Add a Page, or its json, to the log. These are written after
+        the entries, when the writer is closed."""
+        assert self._late_pages is not None, (
+            "Pages were already written in to the log header")
+        self._late_pages.append(page)
+
+    def close(self):
+        """Finish the log. The file object itself is left open."""
+        if not self.closed:
+            self.fd.write(']')
+            if self._late_pages:
+                self.fd.write(', "pages": [')
+                for i, page in enumerate(self._late_pages):
+                    if i:
+                        self.fd.write(', ')
+                    _write_json(self.fd, page)
+                self.fd.write(']')
+            self.fd.write('}}')
+            self.fd.flush()
+            self.closed = True
+
+
+###############################################################################
+# Readers
+###############################################################################
+
+
+class _JsonStream(object):
+    """Reads json values one at a time out of a file like object,
+    keeping only what has not been decoded yet in memory. A value that
+    does not end within `max_value` bytes is taken to be broken."""
+
+    _decoder = json.JSONDecoder()
+
+    def __init__(self, fd, size=READ_SIZE, max_value=MAX_VALUE_SIZE):
+        self.fd = fd
+        self.size = size
+        self.max_value = max_value
+        self.buf = ''
+        self.pos = 0
+        self.offset = 0 # of buf in the file
+        self.eof = False
+
+    def _fill(self):
+        data = self.fd.read(max(self.size, len(self.buf) - self.pos))
+        self.offset += self.pos
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        self.eof = not data
+
+    def peek(self):
+        """Return the next character that is not whitespace, or ''."""
+        while True:
+            while self.pos < len(self.buf) and \
+                  self.buf[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf) or self.eof:
+                return self.buf[self.pos:self.pos + 1]
+            self._fill()
+
+    def tell(self):
+        """Return how far in to the file has been read."""
+        return self.offset + self.pos
+
+    def _stuck(self):
+        # whether reading on cannot finish the value at pos
+        return self.eof or len(self.buf) - self.pos > self.max_value
+
+    def expect(self, chars):
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError("Expected one of {0!r} but found {1!r} at "
+                             "byte {2}".format(chars, char or
+                                               "the end of the file",
+                                               self.tell()))
+        self.pos += 1
+        return char
+
+    def value(self):
+        """Decode and return the next json value."""
+        return self._next()[0]
+
+    def raw(self):
+        """Return the text of the next json value, without decoding it.
+        Only its brackets and strings are checked, the rest is left to
+        whoever decodes it."""
+        start, end = self._extent()
+        return self.buf[start:end]
+
+    def span(self):
+        """Skip the next json value, returning the offsets in the file of
+        its start and of the first thing after it that is not
+        whitespace."""
+        start = self.offset + self._extent()[0]
+        self.peek()
+        return start, self.tell()
+
+    def _extent(self):
+        # where the next object or array ends, found by its brackets
+        if self.peek() not in CLOSERS.values():
+            _, start, end = self._next()
+            return start, end
+        while True:
+            end = self._scan()
+            if end is not None:
+                start, self.pos = self.pos, end
+                return start, end
+            if self._stuck():
+                raise ValueError("Unterminated {0!r} at byte {1}".format(
+                    self.buf[self.pos], self.tell()))
+            self._fill()
+
+    def _scan(self):
+        # the end of the object or array at pos, or None if it is not
+        # all in buf yet. Strings are skipped with find, which is much
+        # quicker than a regular expression over a long body.
+        buf, opened = self.buf, []
+        search, find = STRUCTURE.search, buf.find
+        i = self.pos
+        while True:
+            found = search(buf, i)
+            if found is None:
+                return None
+            i = found.end()
+            char = buf[i - 1]
+            if char == '"':
+                while True:
+                    end = find('"', i)
+                    if end < 0:
+                        return None
+                    i = end + 1
+                    escapes = end - 1
+                    while buf[escapes] == "\\":
+                        escapes -= 1
+                    if (end - 1 - escapes) % 2 == 0: # not escaped itself
+                        break
+            elif char in "{[":
+                opened.append(char)
+            elif not opened or opened.pop() != CLOSERS[char]:
+                raise ValueError("Unexpected {0!r} at byte {1}".format(
+                    char, self.offset + i - 1))
+            elif not opened:
+                return i
+
+    def _next(self):
+        self.peek()
+        while True:
+            try:
+                obj, end = self._decoder.raw_decode(self.buf, self.pos)
+            except ValueError, err:
+                if self._stuck():
+                    raise ValueError(self._in_file(str(err)))
+                self._fill()
+                continue
+            if end == len(self.buf) and not self.eof:
+                self._fill() # a number may carry on in the next read
+                continue
+            start, self.pos = self.pos, end
+            return obj, start, end
+
+    def _in_file(self, message):
+        # the decoder counts from the start of buf, not of the file
+        found = DECODE_POSITION.search(message)
+        if found is None:
+            return "{0} at byte {1}".format(message, self.tell())
+        return "{0} at byte {1}".format(message[:found.start()],
+                                        self.offset + int(found.group(1)))
+
+
+class HarReader(object):
+    """Reads a HAR from the file like object `fd` an entry at a time.
+
+    Everything in the log before "entries" is read straight away and is
+    in `log`. Iterating over the reader yields the entries as json
+    dictionaries, after which `log` also holds whatever came after
+    them. Most HARs have their pages before the entries, HarWriter puts
+    pages added with write_page after them. Once the entries have been
+    read `entries_end` is the offset in the file of the "]" that closes
+    them.
+
+    """
+
+    def __init__(self, fd, size=READ_SIZE):
+        self._stream = _JsonStream(fd, size)
+        self.log = {}
+        self.entries = 0
+        self.entries_end = None
+        self._state = "header"
+        self._stream.expect("{")
+        if self._stream.value() != "log":
+            raise ValueError("Not a HAR, it does not start with a log")
+        self._stream.expect(":")
+        self._stream.expect("{")
+        self._read_fields()
+
+    def __repr__(self):
+        return "<HarReader: {0} entries read{1}>".format(
+            self.entries, self._state == "done" and ", done" or "")
+
+    def _read_fields(self):
+        # read log fields up to "entries" or the end of the log
+        stream = self._stream
+        if stream.peek() == "}":
+            stream.expect("}")
+            self._state = "done"
+            return
+        while True:
+            key = stream.value()
+            stream.expect(":")
+            if key == "entries" and self._state == "header":
+                stream.expect("[")
+                self._state = "entries"
+                return
+            self.log[key] = stream.value()
+            if stream.expect(",}") == "}":
+                self._state = "done"
+                return
+
+    def __iter__(self):
+        return self._entries(self._stream.value)
+
+    def raw(self):
+        """Iterate over the entries as json text instead, to be decoded
+        elsewhere."""
+        return self._entries(self._stream.raw)
+
+    def spans(self):
+        """Iterate over the offsets in the file of each entry instead,
+        see _JsonStream.span."""
+        return self._entries(self._stream.span)
+
+    def _entries(self, read):
+        if self._state != "entries":
+            return
+        stream = self._stream
+        if stream.peek() == "]":
+            self.entries_end = stream.tell()
+            stream.expect("]")
+        else:
+            while True:
+                entry = read()
+                self.entries += 1
+                yield entry
+                if stream.expect(",]") == "]":
+                    self.entries_end = stream.tell() - 1
+                    break
+        self._state = "trailer"
+        if stream.expect(",}") == ",":
+            self._read_fields()
+        else:
+            self._state = "done"
+
+    @property
+    def pages(self):
+        """The pages of the log, if they have been read yet."""
+        return self.log.get("pages")
+
+
+###############################################################################
+# Interface Functions and Classes
+###############################################################################
+
+
+def _page_id(source, pageref, sources):
+    if sources == 1:
+        return pageref
+    return u"{0}_{1}".format(source, pageref)
+
+
+def merge(fds, out, creator=None):
+    """merge(fds, out, [creator=None]) -> int
+
+    Merges the HARs read from the file like objects `fds` in to one
+    written to `out`, returning the number of entries. Entries come out
+    in order of startedDateTime, so long as they are in order in each
+    input, as captures are. When there is more than one input, page ids
+    and pagerefs are prefixed with the position of their input to keep
+    them apart."""
+    readers = [HarReader(fd) for fd in fds]
+    sources = len(readers)
+    known = all(reader.pages is not None for reader in readers)
+    pages = []
+    if known:
+        for source, reader in enumerate(readers):
+            for page in reader.pages:
+                page["id"] = _page_id(source, page["id"], sources)
+                pages.append(json.dumps(page))
+    version = readers and readers[0].log.get("version") or "1.2"
+    writer = HarWriter(out, creator, known and pages or None, version)
+
+    def timed(source, reader):
+        for i, entry in enumerate(reader):
+            yield _epoch_ms(entry["startedDateTime"]), source, i, entry
+
+    for _, source, _, entry in heapq.merge(*[timed(source, reader)
+                                             for source, reader
+                                             in enumerate(readers)]):
+        if "pageref" in entry:
+            entry["pageref"] = _page_id(source, entry["pageref"], sources)
+        writer.write_raw(json.dumps(entry))
+    if not known:
+        for source, reader in enumerate(readers):
+            for page in reader.pages or []:
+                page["id"] = _page_id(source, page["id"], sources)
+                writer.write_page(json.dumps(page))
+    writer.close()
+    return writer.entries
+
+
+def _part(by, size, i, entry):
+    if by == "count":
+        return i // size
+    if by == "window":
+        start = _epoch_ms(entry["startedDateTime"]) / 1000
+        return int(start // size * size)
+    if by == "host":
+        return urlsplit(entry["request"]["url"]).hostname or ""
+    raise ValueError("Cannot split by {0!r}".format(by))
+
+
+def split(fd, open_part, by="count", size=1000, max_open=MAX_OPEN_PARTS):
+    """split(fd, open_part, [by="count", size=1000, max_open]) -> dict
+
+    Splits the HAR read from `fd` in to parts, calling `open_part(key)`
+    for a file like object to write each part to. Parts are by `size`
+    entries ("count", keys 0, 1, ...), by windows of `size` seconds
+    ("window", keys are the epoch second the window starts) or by host
+    ("host", keys are host names). Each part gets the pages its entries
+    refer to. Returns a dictionary of key to HarWriter.
+
+    Part files are closed by split, each as soon as its part is done.
+    No more than `max_open` are open at once: a part that has to wait,
+    a host gone quiet, a window entries come back to or a part whose
+    pages come after the entries, is closed and opened again later with
+    `open_part(key, "a")`, which must then append to it.
+
+    """
+    reader = HarReader(fd)
+    creator = reader.log.get("creator")
+    creator = creator and json.dumps(creator)
+    version = reader.log.get("version", "1.2")
+    parts = {}
+    pagerefs = {}
+    opened = OrderedDict() # key -> HarWriter, least recently used first
+    pages = None # up front, if the pages come before the entries
+    if reader.pages is not None:
+        pages = dict((page["id"], page) for page in reader.pages)
+
+    def finish(key):
+        writer = parts[key]
+        if writer.fd is None:
+            writer.fd = open_part(key, "a")
+        for page_id in sorted(pagerefs[key]):
+            if page_id in pages:
+                writer.write_page(json.dumps(pages[page_id]))
+        writer.close()
+        writer.fd.close()
+
+    def put_away(key):
+        writer = opened.pop(key)
+        if by == "count" and pages is not None:
+            finish(key) # the next part has started, this one is done
+        else:
+            writer.fd.close()
+            writer.fd = None
+
+    last = None
+    for i, entry in enumerate(reader):
+        key = _part(by, size, i, entry)
+        if key != last and last in opened and by != "host":
+            put_away(last)
+        last = key
+        writer = opened.pop(key, None)
+        if writer is None:
+            if key in parts:
+                writer = parts[key]
+                writer.fd = open_part(key, "a")
+            else:
+                writer = parts[key] = HarWriter(open_part(key), creator,
+                                                version=version)
+                pagerefs[key] = set()
+        opened[key] = writer
+        while len(opened) > max_open:
+            put_away(next(iter(opened)))
+        writer.write_raw(json.dumps(entry))
+        if "pageref" in entry:
+            pagerefs[key].add(entry["pageref"])
+    pages = dict((page["id"], page) for page in reader.pages or [])
+    for key, writer in parts.iteritems():
+        if not writer.closed:
+            finish(key)
+    return parts
+
+
+def _part_name(prefix, by, key):
+    if by == "window":
+        key = strftime("%Y%m%dT%H%M%SZ", gmtime(key))
+    return "{0}{1}.har".format(prefix, key)
+
+
+def usage(progn):
+    use = ("usage: %s merge out.har in.har [in.har ...]\n"
+           "       %s split in.har (count N|window SECONDS|host) [prefix]\n\n"
+           % (progn, progn))
+    use += ("Merge HARs in to one by start time, or split one in to parts "
+            "named prefix<part>.har, without loading them in to memory.")
+    return use
+
+
+def main(argv):
+    args = argv[1:]
+    if len(args) >= 3 and args[0] == "merge":
+        with open(args[1], 'w') as out:
+            merge([open(path) for path in args[2:]], out)
+    elif len(args) >= 3 and args[0] == "split":
+        path, by, rest = args[1], args[2], args[3:]
+        size = None
+        if by != "host":
+            size, rest = int(rest[0]), rest[1:]
+        prefix = rest and rest[0] or ""
+        with open(path) as fd:
+            split(fd, lambda key, mode='w': open(
+                _part_name(prefix, by, key), mode), by, size)
+    else:
+        print usage(argv[0])
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+# incremental parsing of raw HTTP streams
+"""Parse raw HTTP/1.x messages as they arrive instead of all at once.
+
+`Request.devour` and `Response.devour` need the whole message as one
+string. A parser is fed the stream a piece at a time, as it comes off a
+socket, and hands back events as soon as there is something to report::
+
+    In [0]: parser = RequestParser()
+
+    In [1]: parser.feed('GET / HTTP/1.1\\r\\nHost: exa')
+    Out[1]: []
+
+    In [2]: parser.feed('mple.com\\r\\n\\r\\nGET /a HTTP/1.1\\r\\n')
+    Out[2]:
+    [('headers', <Request to 'http://example.com/': ...>, 'GET / ...'),
+     ('complete', <Request to 'http://example.com/': ...>)]
+
+A message is handed out with a HEADERS event, along with its raw head,
+as soon as its headers are complete. Its body follows in BODY events,
+one per chunk read, and a COMPLETE event is sent once the whole body
+has been read and set on the message. Any bytes left over are the
+start of the next message, so pipelined messages on one connection
+come out one after the other.
+
+Bodies are framed by Content-Length or chunked Transfer-Encoding. A
+response with neither runs until the connection closes, which the
+parser is told about by calling `close`. Responses to HEAD requests
+have no body, call `expect` with the method of each request on the
+connection so the parser can tell.
+
+Bodies are kept exactly as they came off the wire, chunk framing
+included, so that the message renders back to what was read. A parser
+made with dechunk=True keeps chunked bodies without their framing
+instead, as a HAR records them, BODY events still carry the bytes as
+read. Bodies larger than SPILL_THRESHOLD are written to a temporary
+file as they arrive instead of being held in memory.
+
+"""
+
+from collections import deque
+
+try:
+    from .._internal import SPILL_THRESHOLD, _BodyBuffer
+    from ..har import Request, Response
+except (ValueError, ImportError):
+    from _internal import SPILL_THRESHOLD, _BodyBuffer
+    from har import Request, Response
+
+
+###############################################################################
+# Constants
+###############################################################################
+HEADERS = "headers"
+BODY = "body"
+COMPLETE = "complete"
+
+MAX_HEAD_SIZE = 64 * 1024 # more than this without a blank line is garbage
+
+
+###############################################################################
+# Exceptions
+###############################################################################
+
+
+class ParseError(Exception):
+
+    def __init__(self, msg):
+        self.msg = msg
+
+    def __str__(self):
+        return str(self.msg)
+
+
+###############################################################################
+# Parsers
+###############################################################################
+
+
+class MessageParser(object):
+    """Incremental parser for a stream of raw HTTP messages of type
+    `kind` (Request or Response).
+
+    `feed` takes whatever has been read so far and returns a list of
+    (HEADERS, message, head), (BODY, message, data) and (COMPLETE,
+    message) tuples. See the module documentation for the events.
+    With `dechunk` chunked bodies are kept without their framing, the
+    bodySize is still the size on the wire.
+
+    """
+
+    kind = None
+
+    def __init__(self, proto='http', spill_threshold=SPILL_THRESHOLD,
+                 dechunk=False):
+        assert self.kind, "Use RequestParser or ResponseParser"
+        self.proto = proto
+        self.spill_threshold = spill_threshold
+        self.dechunk = dechunk
+        self._methods = deque()
+        self._buf = ''
+        self._message = None
+        self._body = None
+        self._remaining = 0
+        self._framing = None
+        self._chunk_state = None
+        self._wire_size = 0
+        self.messages = 0
+
+    def __repr__(self):
+        return "<{0}: {1} messages, {2}>".format(
+            self.__class__.__name__,
+            self.messages,
+            self._message and "in body" or "waiting for headers")
+
+    def expect(self, method):
+        """Tell a response parser the method of the next request on the
+        connection, responses to HEAD have no body."""
+        self._methods.append(method)
+
+    def feed(self, data):
+        """Parse `data` and return a list of the events it caused."""
+        events = []
+        self._buf += data
+        while self._buf:
+            if self._message is None:
+                if not self._parse_head(events):
+                    break
+            elif not self._parse_body(events):
+                break
+        return events
+
+    def close(self):
+        """Tell the parser the connection has closed. A response that
+        runs until close is completed, anything else left unfinished
+        raises a ParseError."""
+        events = []
+        if self._message is not None and self._framing == "close":
+            self._complete(events)
+        elif self._message is not None or self._buf.strip():
+            raise ParseError("Connection closed in the middle of a message")
+        return events
+
+    def _parse_head(self, events):
+        self._buf = self._buf.lstrip("\r\n") # keep-alive noise
+        end = self._buf.find("\r\n\r\n")
+        if end < 0:
+            if len(self._buf) > MAX_HEAD_SIZE:
+                raise ParseError("No end of headers in {0} bytes".format(
+                    len(self._buf)))
+            return False
+        head, self._buf = self._buf[:end + 4], self._buf[end + 4:]
+        message = self.kind(empty=True)
+        message.devour(head, proto=self.proto)
+        self._message = message
+        self._body = _BodyBuffer(self.spill_threshold)
+        self._wire_size = 0
+        self._framing = self._framing_for(message, head)
+        events.append((HEADERS, message, head))
+        if self._framing == "length" and not self._remaining:
+            self._complete(events)
+        return True
+
+    def _framing_for(self, message, head):
+        method = self._methods and self._methods.popleft()
+        if self.kind is Response and (method == "HEAD" or
+                                      message.status in (204, 304) or
+                                      100 <= message.status < 200):
+            self._remaining = 0
+            return "length"
+        for header in message.headers:
+            if header.name.lower() == "transfer-encoding" and \
+               "chunked" in header.value.lower():
+                self._chunk_state = "size"
+                return "chunked"
+        if "\r\ncontent-length:" in head.lower():
+            self._remaining = message.bodySize
+            return "length"
+        if self.kind is Response:
+            return "close"
+        self._remaining = 0
+        return "length"
+
+    def _parse_body(self, events):
+        if self._framing == "length":
+            data = self._buf[:self._remaining]
+            self._buf = self._buf[self._remaining:]
+            self._remaining -= len(data)
+            self._add_body(events, data)
+            if not self._remaining:
+                self._complete(events)
+                return True
+            return False
+        if self._framing == "close":
+            data, self._buf = self._buf, ''
+            self._add_body(events, data)
+            return False
+        return self._parse_chunked(events)
+
+    def _parse_chunked(self, events):
+        # chunk framing is kept in the body so it renders back as read,
+        # unless dechunk
+        if self._chunk_state in ("size", "end", "trailer"):
+            end = self._buf.find("\r\n")
+            if end < 0:
+                return False
+            line, self._buf = self._buf[:end + 2], self._buf[end + 2:]
+            if self._chunk_state == "end" and line != "\r\n":
+                raise ParseError("Chunk runs on past its size")
+            self._add_body(events, line, framing=True)
+            if self._chunk_state == "end":
+                self._chunk_state = "size"
+                return True
+            if self._chunk_state == "trailer":
+                if line == "\r\n":
+                    self._complete(events)
+                return True
+            try:
+                size = int(line.split(";", 1)[0].strip(), 16)
+            except ValueError:
+                raise ParseError("Bad chunk size {0!r}".format(line))
+            if size:
+                self._chunk_state = "data"
+                self._remaining = size
+            else:
+                self._chunk_state = "trailer"
+            return True
+        data = self._buf[:self._remaining]
+        self._buf = self._buf[self._remaining:]
+        self._remaining -= len(data)
+        self._add_body(events, data)
+        if self._remaining:
+            return False
+        self._chunk_state = "end" # the \r\n after the chunk
+        return True
+
+    def _add_body(self, events, data, framing=False):
+        if data:
+            if not (framing and self.dechunk):
+                self._body.write(data)
+            self._wire_size += len(data)
+            events.append((BODY, self._message, data))
+
+    def _complete(self, events):
+        message = self._message
+        body = self._body.getvalue()
+        if len(body) or self._framing != "length":
+            message.set_body(body)
+            message.bodySize = self._wire_size
+        self._message = None
+        self._body = None
+        self._chunk_state = None
+        self.messages += 1
+        events.append((COMPLETE, message))
+
+
+class RequestParser(MessageParser):
+    kind = Request
+
+
+class ResponseParser(MessageParser):
+    kind = Response
+
+
+###############################################################################
+# Interface Functions and Classes
+###############################################################################
+
+
+def iter_messages(fd, kind=Request, proto='http', size=65536):
+    """iter_messages(fd, [kind=Request, proto='http']) -> g
+
+    Reads raw messages of type `kind` from the file like object `fd`
+    and yields them as they are completed."""
+    parser = (kind is Request and RequestParser or ResponseParser)(proto)
+    data = fd.read(size)
+    while data:
+        for event in parser.feed(data):
+            if event[0] == COMPLETE:
+                yield event[1]
+        data = fd.read(size)
+    for event in parser.close():
+        if event[0] == COMPLETE:
+            yield event[1]
@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+# recorded session macros
+"""Turn a recorded flow, such as a login, in to a plan that can be
+replayed for as many sessions as needed.
+
+A Macro is built from the entries of the recording. Values that change
+from one session to the next are marked: parameters are values typed
+in (a user name), extractors pull values out of responses (a CSRF
+token, an auth header, a cookie). Compiling finds every place those
+values were sent in later requests and turns each request in to static
+strings with slots between them::
+
+    In [0]: macro = Macro(hc.log.entries[:3])
+
+    In [1]: macro.parameter("user", "alice")
+
+    In [2]: macro.extract("csrf", 0, r'name="csrf" value="([^"]+)"')
+
+    In [3]: macro.extract("token", 1, header="X-Auth-Token")
+
+    In [4]: plan = macro.compile()
+
+    In [5]: session = plan.run(send, user="bob")
+
+    In [6]: session.values["token"]
+    Out[6]: 'c0ffee'
+
+`send(raw_request, url)` sends a raw request and returns the raw
+response, so a plan can run over sockets, the request engine or a
+test double. A Plan holds nothing that changes, so any number of
+Sessions can run from it at once. Each has its own values and its own
+CookieJar, fed with the cookies of every response. Rendering a request
+joins a few strings. Content-Length is worked out again from the body,
+and the Cookie header is rebuilt from the session's jar.
+
+Values are only found where a value can be: between delimiters, such
+as a parameter value after = and before &, a header value or a path
+segment. A token of 1 leaves HTTP/1.1 alone. Values are also found,
+and put back, url encoded.
+
+"""
+
+import re
+from urllib import quote_plus
+
+try:
+    from ..har import Cookie
+    from .cookie_jar import CookieJar
+    from .template import _Pieces, _identity, LENGTH, LENGTH_VALUE
+except (ValueError, ImportError):
+    from har import Cookie
+    from utils.cookie_jar import CookieJar
+    from utils.template import _Pieces, _identity, LENGTH, LENGTH_VALUE
+
+
+###############################################################################
+# Constants
+###############################################################################
+COOKIES = "__cookies__" # slot for the Cookie header line
+MARKERS = {"\0cookies\0": COOKIES, "\0length\0": LENGTH} # never in a head
+SET_COOKIE = re.compile(r"^Set-Cookie:[ \t]*(.*?)\r?$", re.M | re.I)
+COOKIE_LINE = re.compile(r"^Cookie:.*\r\n", re.M | re.I)
+# what may come right before and right after a value for it to be one
+BEFORE = r"""(?<=[\s=/:;,&?"'(\[{])"""
+AFTER = r"""(?=[\s&;,/?#"')\]}]|\Z)"""
+
+
+###############################################################################
+# Exceptions
+###############################################################################
+
+
+class MacroError(Exception):
+
+    def __init__(self, msg):
+        self.msg = msg
+
+    def __str__(self):
+        return str(self.msg)
+
+
+###############################################################################
+# Steps
+###############################################################################
+
+
+def _url_encoded(value):
+    return quote_plus(value, safe="")
+
+
+def _finder(names, whole=False, markers=()):
+    """Return a regex that finds any of the strings in `names` between
+    delimiters, also as the whole text if `whole`, and any of `markers`
+    wherever they are."""
+    if not names and not markers:
+        return None
+    values = "|".join(re.escape(value) for value in
+                      sorted(names, key=len, reverse=True))
+    found = "{0}(?:{1}){2}".format(whole and r"(?:\A|{0})".format(BEFORE)
+                                   or BEFORE, values or "(?!)", AFTER)
+    if markers:
+        found += "|" + "|".join(re.escape(marker) for marker in markers)
+    return re.compile(found)
+
+
+class Step(object):
+    """One request of a plan and the values to take from its
+    response."""
+
+    def __init__(self, url, head, body, extractors, tail=""):
+        self.url = url
+        self.head = head
+        self.body = body
+        self.extractors = extractors
+        self.tail = tail
+
+    def __repr__(self):
+        return "<Step to '{0}': {1} slots, {2} extractors>".format(
+            "".join("{}" if part is None else part
+                    for part in self.url.parts),
+            len(self.head.slots) + len(self.body.slots),
+            len(self.extractors))
+
+    def render(self, values):
+        """Return the url and the raw request for `values`."""
+        url = self.url.render(values)
+        body = self.body.render(values)
+        values[LENGTH] = str(len(body))
+        return url, self.head.render(values) + body + self.tail
+
+
+###############################################################################
+# Interface Functions and Classes
+###############################################################################
+
+
+class Macro(object):
+    """A recorded flow, as a list of Entries, to be compiled in to a
+    Plan."""
+
+    def __init__(self, entries):
+        self.entries = list(entries)
+        self.parameters = {}
+        self.extractors = [] # (name, step, compiled regex)
+
+    def parameter(self, name, recorded):
+        """Make every use of the `recorded` value in the requests a
+        slot that is filled in with the `name` argument of Plan.run."""
+        self.parameters[recorded] = name
+
+    def extract(self, name, step, pattern=None, header=None, cookie=None):
+        """Take `name` from the response of request number `step`, by
+        the first group of the regex `pattern` (over the raw response),
+        by the value of a `header` or by the value of a `cookie` it
+        sets."""
+        if header is not None:
+            pattern = r"(?im)^{0}:[ \t]*(.*?)\r?$".format(re.escape(header))
+        elif cookie is not None:
+            pattern = r"(?im)^Set-Cookie:[ \t]*{0}=([^;\r\n]*)".format(
+                re.escape(cookie))
+        assert pattern, "extract needs a pattern, a header or a cookie"
+        self.extractors.append((name, step, re.compile(pattern)))
+
+    def compile(self):
+        """Return the Plan for the recording. The recorded responses
+        must have every extracted value in them."""
+        names = {} # recorded value as sent -> (name, encoder)
+        for recorded, name in self.parameters.iteritems():
+            self._add_value(names, recorded, name)
+        steps = []
+        for i, entry in enumerate(self.entries):
+            steps.append(self._compile_step(entry, names, [
+                (name, regex) for name, step, regex in self.extractors
+                if step == i]))
+            if i + 1 < len(self.entries):
+                response = entry.response.puke()
+                for name, step, regex in self.extractors:
+                    if step != i:
+                        continue
+                    match = regex.search(response)
+                    if not match:
+                        raise MacroError("Nothing for {0} in the recorded "
+                                         "response {1}".format(name, i))
+                    self._add_value(names, match.group(1), name)
+        return Plan(steps, self.parameters.values())
+
+    def _add_value(self, names, recorded, name):
+        if not recorded:
+            raise MacroError("Cannot make a slot of an empty value for "
+                             "{0}".format(name))
+        names[recorded] = (name, _identity)
+        encoded = _url_encoded(recorded)
+        if encoded != recorded:
+            names.setdefault(encoded, (name, _url_encoded))
+
+    def _compile_step(self, entry, names, extractors):
+        raw = entry.request.puke()
+        end = raw.find("\r\n\r\n") + 4
+        head, body, tail = raw[:end], raw[end:], ""
+        if body.endswith("\r\n"): # puke ends a body with a line break
+            body, tail = body[:-2], "\r\n"
+        body = _Pieces(body, _finder(names, True), names)
+        # the Cookie header comes from the session's jar and the
+        # Content-Length is worked out again if the body can change
+        line = COOKIE_LINE.search(head)
+        if line:
+            head = head[:line.start()] + "\0cookies\0" + head[line.end():]
+        else:
+            head = head[:-2] + "\0cookies\0" + head[-2:]
+        head = LENGTH_VALUE.sub("\\1\0length\0", head, 1)
+        head_names = dict(names)
+        for marker, name in MARKERS.iteritems():
+            head_names[marker] = (name, _identity)
+        return Step(_Pieces(entry.request.url, _finder(names), names),
+                    _Pieces(head, _finder(names, markers=MARKERS),
+                            head_names),
+                    body, extractors, tail)
+
+
+class Plan(object):
+    """The compiled steps of a Macro. Run it once per session."""
+
+    def __init__(self, steps, parameters=()):
+        self.steps = steps
+        self.parameters = sorted(parameters)
+
+    def __repr__(self):
+        return "<Plan: {0} steps, parameters {1}>".format(
+            len(self.steps), ", ".join(self.parameters) or "none")
+
+    def session(self, **values):
+        missing = [name for name in self.parameters if name not in values]
+        if missing:
+            raise MacroError("Missing parameters: {0}".format(
+                ", ".join(missing)))
+        return Session(self, values)
+
+    def run(self, send, **values):
+        """Run every step with `send` and return the Session."""
+        session = self.session(**values)
+        for step in self.steps:
+            url, raw = session.render(step)
+            session.feed(step, url, send(raw, url))
+        return session
+
+
+class Session(object):
+    """The values and cookies of one run of a Plan."""
+
+    def __init__(self, plan, values):
+        self.plan = plan
+        self.values = dict(values)
+        self.jar = CookieJar()
+
+    def __repr__(self):
+        return "<Session: {0} values, {1} cookies>".format(
+            len(self.values), len(self.jar))
+
+    def render(self, step):
+        """Return the url and raw request for `step`."""
+        values = dict(self.values)
+        url = step.url.render(values)
+        cookies = self.jar.cookies_for(url)
+        values[COOKIES] = cookies and "Cookie: {0}\r\n".format("; ".join(
+            "{0}={1}".format(c.name, c.value) for c in cookies)) or ""
+        return step.render(values)
+
+    def feed(self, step, url, response):
+        """Take the cookies and extracted values out of the raw
+        `response` to `step`."""
+        for line in SET_COOKIE.findall(response):
+            cookie = Cookie(empty=True)
+            cookie.devour("Set-Cookie: " + line)
+            self.jar.add(cookie, url)
+        for name, regex in step.extractors:
+            match = regex.search(response)
+            if not match:
+                raise MacroError("Nothing for {0} in the response from "
+                                 "{1}".format(name, url))
+            self.values[name] = match.group(1)
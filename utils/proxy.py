@@ -0,0 +1,550 @@
+#!/usr/bin/env python
+# intercepting proxy listener
+"""The "Proxy Listener" black box from the pipe architecture.
+
+A ProxyServer is a plain HTTP proxy. Traffic is passed through as it
+is read, byte for byte, and a copy of it is parsed on the side. Every
+request and response pair that goes through becomes an Entry, with
+timings, and is handed to `on_entry`::
+
+    In [0]: writer = HarWriter(open('capture.har', 'w'))
+
+    In [1]: proxy = ProxyServer(port=8080, on_entry=writer.write)
+
+    In [2]: proxy.serve_forever()
+
+Point a browser at localhost:8080 and browse. Entries can just as well
+go down a pipe, one json entry per line, see `pipe_entries`. From the
+shell::
+
+    $ python proxy.py 8080 > capture.har
+    $ python proxy.py 8080 --pipe | some_filter
+
+The proxy is a single threaded asyncore loop using poll, so thousands
+of connections cost a socket and a few buffers each and not a thread.
+Only host names are looked up elsewhere, by DNS_THREADS threads, so a
+slow DNS server holds up the connections waiting on it and no others.
+Answers are kept for DNS_TTL seconds.
+Reading from one side of a connection stops while the other side has
+more than MAX_BUFFERED bytes waiting to be written to it, so a slow
+client does not make the proxy hold a whole download in memory.
+
+Requests go upstream with the request line in origin form and without
+the headers meant for the proxy, see HOP_HEADERS, and are recorded as
+the client sent them. Chunked responses are recorded without their
+chunk framing. CONNECT requests are tunnelled but not recorded, the
+traffic in them is encrypted. Pipelined requests to different hosts on one client
+connection may have their responses returned out of order.
+
+"""
+
+import os
+import time
+import socket
+import asyncore
+import threading
+from Queue import Queue
+from collections import deque
+from sys import stdout
+from urlparse import urlparse, urlsplit
+
+try:
+    from .._internal import _localize_datetime, now
+    from ..har import Entry, Cache, Timings
+    from . import mario
+    from .http_stream import RequestParser, ResponseParser, ParseError
+    from .http_stream import HEADERS, BODY, COMPLETE
+    from .har_stream import HarWriter
+except (ValueError, ImportError):
+    from _internal import _localize_datetime, now
+    from har import Entry, Cache, Timings
+    from utils import mario
+    from utils.http_stream import RequestParser, ResponseParser, ParseError
+    from utils.http_stream import HEADERS, BODY, COMPLETE
+    from utils.har_stream import HarWriter
+
+
+###############################################################################
+# Constants
+###############################################################################
+READ_SIZE = 65536
+MAX_BUFFERED = 1024 * 1024
+BAD_GATEWAY = ("HTTP/1.1 502 Bad Gateway\r\nContent-Length: 0\r\n"
+               "Connection: close\r\n\r\n")
+TUNNEL_ESTABLISHED = "HTTP/1.1 200 Connection established\r\n\r\n"
+DNS_THREADS = 4
+DNS_TTL = 60 # seconds a looked up address is kept
+# for the proxy and not passed upstream, nor are headers Connection names
+HOP_HEADERS = frozenset(["proxy-connection", "proxy-authorization",
+                         "keep-alive"])
+
+
+###############################################################################
+# Name Lookups
+###############################################################################
+
+
+class _Waker(asyncore.file_dispatcher):
+    """The read end of a pipe in the loop, written to by the lookup
+    threads when they have answers."""
+
+    def __init__(self, resolver, fd):
+        asyncore.file_dispatcher.__init__(self, fd, map=resolver.map)
+        self.resolver = resolver
+
+    def writable(self):
+        return False
+
+    def handle_read(self):
+        self.recv(4096)
+        self.resolver.deliver()
+
+
+class _Resolver(object):
+    """getaddrinfo in a few threads, for the asyncore loop of `map`.
+    `resolve` calls back in the loop with the first address found, or
+    the socket.error raised. Answers are cached for `ttl` seconds, and
+    connections waiting on the same name share one lookup."""
+
+    def __init__(self, map, threads=DNS_THREADS, ttl=DNS_TTL):
+        self.map = map
+        self.threads = threads
+        self.ttl = ttl
+        self.cache = {} # (host, port) -> (expires, address)
+        self._waiting = {} # (host, port) -> callbacks
+        self._questions = Queue()
+        self._answers = deque()
+        self._waker = None
+        self._wake = None
+        self._lock = threading.Lock() # over _wake, closed by the loop
+
+    def _start(self):
+        read, self._wake = os.pipe()
+        self._waker = _Waker(self, read)
+        os.close(read) # file_dispatcher keeps a dup of it
+        for i in xrange(self.threads):
+            thread = threading.Thread(target=self._work)
+            thread.daemon = True
+            thread.start()
+
+    def _work(self):
+        while True:
+            name = self._questions.get()
+            if name is None:
+                return
+            try:
+                answer = socket.getaddrinfo(name[0], name[1], 0,
+                                            socket.SOCK_STREAM)[0]
+            except socket.error, err:
+                answer = err
+            self._answers.append((name, answer))
+            with self._lock:
+                if self._wake is None:
+                    return
+                os.write(self._wake, "x")
+
+    def resolve(self, host, port, callback):
+        name = (host, port)
+        cached = self.cache.get(name)
+        if cached and cached[0] > time.time():
+            callback(cached[1])
+            return
+        if name in self._waiting:
+            self._waiting[name].append(callback)
+            return
+        if self._waker is None:
+            self._start()
+        self._waiting[name] = [callback]
+        self._questions.put(name)
+
+    def deliver(self):
+        """Call back those waiting on the answers in so far."""
+        while self._answers:
+            name, answer = self._answers.popleft()
+            if not isinstance(answer, socket.error):
+                self.cache[name] = (time.time() + self.ttl, answer)
+            for callback in self._waiting.pop(name, ()):
+                callback(answer)
+
+    def close(self):
+        with self._lock:
+            if self._wake is None:
+                return
+            os.close(self._wake)
+            self._wake = None
+        for i in xrange(self.threads):
+            self._questions.put(None)
+
+
+###############################################################################
+# Connections
+###############################################################################
+
+
+def _ms(start, end):
+    return int(round((end - start) * 1000))
+
+
+def _upstream_head(head):
+    """Return the raw request `head` as it is sent upstream, with the
+    request line in origin form and without the HOP_HEADERS."""
+    lines = head.split("\r\n")
+    method, target, version = lines[0].split()
+    host = None
+    if "://" in target.split("?")[0]: # absolute form
+        url = urlsplit(target)
+        host = url.netloc
+        target = (url.path or "/") + (url.query and "?" + url.query)
+    hop = set(HOP_HEADERS)
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        if name.strip().lower() == "connection":
+            hop.update(token.strip().lower() for token in value.split(","))
+        elif name.strip().lower() == "host":
+            host = None
+    kept = [line for line in lines[1:-2]
+            if not line.partition(":")[0].strip().lower() in hop]
+    if host:
+        kept.insert(0, "Host: " + host)
+    return "\r\n".join([" ".join([method, target, version])] + kept +
+                       ["", ""])
+
+
+class _Connection(asyncore.dispatcher):
+    """A non-blocking socket with a write buffer. `peer` is the
+    connection on the other side of the proxy."""
+
+    def __init__(self, proxy, sock=None):
+        asyncore.dispatcher.__init__(self, sock, map=proxy._map)
+        self.proxy = proxy
+        self.peer = None
+        self._out = deque()
+        self.buffered = 0
+        self._closing = False
+
+    def send_data(self, data):
+        if data:
+            self._out.append(data)
+            self.buffered += len(data)
+
+    def close_when_done(self):
+        self._closing = True
+        if not self._out:
+            self.close()
+
+    def readable(self):
+        return not self._closing and \
+               not (self.peer and self.peer.buffered > MAX_BUFFERED)
+
+    def writable(self):
+        return self.connecting or bool(self._out)
+
+    def handle_write(self):
+        while self._out:
+            data = self._out[0]
+            sent = self.send(data)
+            self.buffered -= sent
+            if sent < len(data):
+                self._out[0] = buffer(data, sent)
+                return
+            self._out.popleft()
+        if self._closing:
+            self.close()
+
+    def handle_read(self):
+        data = self.recv(READ_SIZE)
+        if data:
+            self.on_data(data)
+
+    def handle_error(self):
+        self.proxy.errors += 1
+        self.handle_close()
+
+    def on_data(self, data):
+        """Called with what was read, passes it on to the peer."""
+        if self.peer:
+            self.peer.send_data(data)
+
+
+class _ClientSide(_Connection):
+    """The browser's connection to the proxy."""
+
+    def __init__(self, proxy, sock):
+        _Connection.__init__(self, proxy, sock)
+        self.parser = RequestParser()
+        self.tunnel = False
+        self._target = None # the message currently being forwarded
+        self.port = sock.getpeername()[1]
+
+    def on_data(self, data):
+        if self.tunnel:
+            _Connection.on_data(self, data)
+            return
+        try:
+            events = self.parser.feed(data)
+        except ParseError:
+            self.proxy.errors += 1
+            self.send_data(BAD_GATEWAY)
+            self.close_when_done()
+            return
+        for event in events:
+            if event[0] == HEADERS:
+                self._start(event[1], event[2])
+            elif event[0] == BODY and self.peer:
+                self.peer.send_data(event[2])
+            elif event[0] == COMPLETE and self._target:
+                self._target["sent"] = time.time()
+
+    def _start(self, request, head):
+        record = {"request": request,
+                  "started": _localize_datetime(now()),
+                  "start": time.time(),
+                  "dns": -1,
+                  "connect": -1}
+        if request.method == "CONNECT":
+            host, _, port = head.split()[1].rpartition(":")
+            address = (host, int(port or 443))
+        else:
+            url = urlparse(request._get("url", ""))
+            address = (url.hostname, url.port or
+                       (url.scheme == "https" and 443 or 80))
+        if not address[0]:
+            self.send_data(BAD_GATEWAY)
+            self.close_when_done()
+            return
+        if not (self.peer and self.peer.address == address and
+                not self.peer._closing):
+            if self.peer:
+                self.peer.retire()
+            self.peer = _ServerSide(self.proxy, self, address, record)
+        if request.method == "CONNECT":
+            self.tunnel = True
+            self.peer.tunnel = True
+            self.send_data(TUNNEL_ESTABLISHED)
+            return
+        self._target = record
+        self.peer.expect(record)
+        self.peer.send_data(_upstream_head(head))
+
+    def handle_close(self):
+        if self.peer:
+            self.peer.peer = None
+            self.peer.close_when_done()
+        self.close()
+
+
+class _ServerSide(_Connection):
+    """The proxy's connection to the upstream server."""
+
+    def __init__(self, proxy, client, address, record):
+        _Connection.__init__(self, proxy)
+        self.peer = client
+        self.address = address
+        self.tunnel = False
+        self.parser = ResponseParser(dechunk=True)
+        self._pending = deque()
+        self._current = None
+        self._connect_record = record
+        self._lookup_start = time.time()
+        # no socket, and so not in the loop, until the name is looked up
+        proxy._resolver.resolve(address[0], address[1], self._resolved)
+
+    def _resolved(self, answer):
+        if self._closing:
+            return # the client went away in the meantime
+        self._connect_record["dns"] = _ms(self._lookup_start, time.time())
+        try:
+            if isinstance(answer, socket.error):
+                raise answer
+            family, socktype, _, _, sockaddr = answer
+            self._connect_start = time.time()
+            self.create_socket(family, socktype)
+            self.connect(sockaddr)
+        except socket.error:
+            self.proxy.errors += 1
+            self.handle_close()
+
+    def retire(self):
+        """Let go of the client, which now talks to another host, once
+        the responses still due from this one have been passed on."""
+        if not self._pending and not self._current:
+            self.peer = None
+            self.close_when_done()
+
+    @property
+    def retired(self):
+        return not self.peer or self.peer.peer is not self
+
+    def close(self):
+        if self.socket is None: # never got past the lookup
+            self._closing = True
+            self.connected = False
+            return
+        _Connection.close(self)
+
+    def expect(self, record):
+        self._pending.append(record)
+        self.parser.expect(record["request"].method)
+
+    def handle_connect(self):
+        self._connect_record["connect"] = _ms(self._connect_start,
+                                              time.time())
+        try:
+            self.server_ip = self.socket.getpeername()[0]
+        except socket.error:
+            self.server_ip = None
+
+    def on_data(self, data):
+        _Connection.on_data(self, data)
+        if self.tunnel:
+            return
+        try:
+            events = self.parser.feed(data)
+        except ParseError:
+            self.proxy.errors += 1
+            self.tunnel = True # stop recording, keep passing through
+            return
+        self._handle_events(events)
+
+    def _handle_events(self, events):
+        for event in events:
+            if event[0] == HEADERS and self._pending:
+                self._current = self._pending.popleft()
+                self._current["first_byte"] = time.time()
+            elif event[0] == COMPLETE and self._current:
+                self._record(self._current, event[1])
+                self._current = None
+                if not self._pending and self.retired:
+                    self.peer = None
+                    self.close_when_done()
+
+    def _record(self, record, response):
+        end = time.time()
+        sent = record.get("sent", record["start"])
+        entry = Entry()
+        entry.startedDateTime = record["started"].isoformat()
+        entry.request = record["request"]
+        entry.response = response
+        entry.cache = Cache()
+        entry.timings = Timings(empty=True)
+        entry.timings.blocked = -1
+        entry.timings.dns = record["dns"]
+        entry.timings.connect = record["connect"]
+        entry.timings.send = _ms(record["start"], sent)
+        entry.timings.wait = _ms(sent, record["first_byte"])
+        entry.timings.receive = _ms(record["first_byte"], end)
+        entry.time = sum(t for t in [entry.timings.dns,
+                                     entry.timings.connect,
+                                     entry.timings.send,
+                                     entry.timings.wait,
+                                     entry.timings.receive] if t > 0)
+        if getattr(self, "server_ip", None):
+            entry.serverIPAddress = self.server_ip
+        entry.connection = str(self.peer and self.peer.port or "")
+        self.proxy.entries += 1
+        if self.proxy.on_entry:
+            self.proxy.on_entry(entry)
+
+    def handle_close(self):
+        if not self.tunnel:
+            try:
+                self._handle_events(self.parser.close())
+            except ParseError:
+                pass
+        if not self.retired:
+            if not self.connected and self._pending:
+                self.peer.send_data(BAD_GATEWAY) # never got to upstream
+            self.peer.close_when_done()
+        self.close()
+
+
+###############################################################################
+# Server
+###############################################################################
+
+
+class ProxyServer(asyncore.dispatcher):
+    """An HTTP proxy listening on `host`:`port` that hands an Entry to
+    `on_entry` for every request and response pair it passes. Use port
+    0 to have one picked, the bound address is in `address`."""
+
+    def __init__(self, host='127.0.0.1', port=8080, on_entry=None,
+                 backlog=1024):
+        self._map = {}
+        asyncore.dispatcher.__init__(self, map=self._map)
+        self.on_entry = on_entry
+        self.entries = 0
+        self.errors = 0
+        self._running = False
+        self._resolver = _Resolver(self._map)
+        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.set_reuse_addr()
+        self.bind((host, port))
+        self.listen(backlog)
+        self.address = self.socket.getsockname()
+
+    def __repr__(self):
+        return "<ProxyServer on {0}:{1}: {2} entries, {3} connections>".format(
+            self.address[0], self.address[1], self.entries,
+            len(self._map) - 1)
+
+    def handle_accept(self):
+        pair = self.accept()
+        if pair:
+            _ClientSide(self, pair[0])
+
+    def serve_forever(self, timeout=0.5):
+        """Run until `shutdown` is called."""
+        self._running = True
+        while self._running:
+            asyncore.loop(timeout, True, self._map, 1)
+
+    def shutdown(self):
+        """Stop serving and close every connection."""
+        self._running = False
+        asyncore.close_all(self._map)
+        self._resolver.close()
+
+
+###############################################################################
+# Interface Functions and Classes
+###############################################################################
+
+
+def pipe_entries(pipe=stdout):
+    """pipe_entries([pipe=stdout]) -> f
+
+    Returns an `on_entry` function that pushes entries down a pipe as
+    json, one per line, for mario.pull(Entry) on the other end."""
+    def push(entry):
+        mario.push([entry.to_json()], pipe)
+        pipe.flush()
+    return push
+
+
+def usage(progn):
+    use = "usage: %s [port] [--pipe]\n\n" % progn
+    use += ("Run a recording proxy. Entries are written to stdout as a "
+            "HAR, or one entry per line with --pipe.")
+    return use
+
+
+if __name__ == "__main__":
+    from sys import argv
+    if "-h" in argv or "--help" in argv:
+        print usage(argv[0])
+    else:
+        ports = [a for a in argv[1:] if a.isdigit()]
+        port = ports and int(ports[0]) or 8080
+        writer = None
+        if "--pipe" in argv:
+            proxy = ProxyServer(port=port, on_entry=pipe_entries())
+        else:
+            writer = HarWriter(stdout)
+            proxy = ProxyServer(port=port, on_entry=writer.write)
+        try:
+            proxy.serve_forever()
+        except KeyboardInterrupt:
+            proxy.shutdown()
+            if writer:
+                writer.close()
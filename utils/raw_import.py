@@ -0,0 +1,336 @@
+#!/usr/bin/env python
+# bulk import of raw HTTP logs
+"""Turn logs of raw HTTP/1.1 traffic in to a HAR.
+
+A log is the bytes of one connection as they went over the wire:
+requests and responses one after the other, the way a proxy or a
+reassembled pcap stream writes them out. Each response is paired with
+the oldest request on the connection still waiting for one, so
+pipelined requests come out right, and each pair becomes an Entry::
+
+    In [0]: with open('capture.har', 'w') as out:
+       ...:     import_log(['conn1.raw', 'conn2.raw'], out)
+    Out[0]: (5120, 0)
+
+From the shell::
+
+    $ python -m utils.raw_import capture.har conn1.raw conn2.raw
+
+The work is split in two. The log is mapped in to memory and cut in to
+messages by its framing alone, finding the end of each head and
+skipping over Content-Length and chunked bodies without copying them.
+That is cheap and done in one process. Building the Request, Response
+and Entry objects and writing them out as json is not, so the pairs go
+in batches of about BATCH_SIZE bytes to a pool of worker processes,
+each of which maps the log itself, and the json comes back in order to
+be written with a HarWriter.
+
+Messages are devoured as they are, so a rendered request or response
+is the one in the log. With keep_b64_raw=True each also keeps a base64
+copy of its raw bytes. A log has no timings, every entry starts at
+`started`, the time of the import if not given, and takes no time.
+Requests that never got a response and responses without a request
+are left out and counted.
+
+"""
+
+import os
+import sys
+import mmap
+from collections import deque
+from multiprocessing import Pool, cpu_count
+
+try:
+    from .._internal import _localize_datetime, now
+    from ..har import Entry, Request, Response, Cache, Timings
+    from .http_stream import ParseError
+    from .har_stream import HarWriter
+except (ValueError, ImportError):
+    from _internal import _localize_datetime, now
+    from har import Entry, Request, Response, Cache, Timings
+    from utils.http_stream import ParseError
+    from utils.har_stream import HarWriter
+
+
+###############################################################################
+# Constants
+###############################################################################
+BATCH_SIZE = 4 * 1024 * 1024 # bytes of messages handed to a worker at once
+MAX_HEAD_SIZE = 64 * 1024 # more than this without a blank line is garbage
+QUEUED = 2 # batches waiting for each worker
+
+
+###############################################################################
+# Framing
+###############################################################################
+
+
+def _skip_chunked(data, pos):
+    """Return the end of the chunked body starting at `pos`."""
+    while True:
+        end = data.find("\r\n", pos)
+        if end < 0:
+            raise ParseError("Chunked body cut short at {0}".format(pos))
+        try:
+            size = int(data[pos:end].split(";", 1)[0].strip(), 16)
+        except ValueError:
+            raise ParseError("Bad chunk size {0!r} at {1}".format(
+                data[pos:end], pos))
+        pos = end + 2
+        if size:
+            pos += size + 2 # the chunk and its \r\n
+            continue
+        while True: # trailers, up to an empty line
+            end = data.find("\r\n", pos)
+            if end < 0:
+                raise ParseError("Chunked body cut short at {0}".format(pos))
+            if end == pos:
+                return end + 2
+            pos = end + 2
+
+
+def messages(data, start=0, end=None):
+    """Yield (is_response, (start, body, end), method) for each message
+    in `data`, a string or an mmap, between `start` and `end`. `body`
+    is where the body of the message starts and `method` the method of
+    a request, or None."""
+    end = len(data) if end is None else end
+    pos = start
+    methods = deque() # of requests waiting for a response, for HEAD
+    while pos < end:
+        while data[pos:pos + 2] == "\r\n": # keep-alive noise
+            pos += 2
+        if pos >= end:
+            break
+        head_end = data.find("\r\n\r\n", pos, min(end, pos + MAX_HEAD_SIZE))
+        if head_end < 0:
+            raise ParseError("No end of headers after {0}".format(pos))
+        head = data[pos:head_end + 2].lower()
+        body = head_end + 4
+        response = head.startswith("http/")
+        method = None
+        if response:
+            status = head[head.find(" ") + 1:head.find(" ") + 4]
+            bodiless = methods and methods.popleft() == "head" or \
+                       status[0] == "1" or status in ("204", "304")
+        else:
+            method = data[pos:pos + head.find(" ")]
+            methods.append(method.lower())
+            bodiless = False
+        length = head.find("\r\ncontent-length:")
+        coding = head.find("\r\ntransfer-encoding:")
+        if bodiless:
+            stop = body
+        elif coding >= 0 and "chunked" in head[coding:head.find("\r\n",
+                                                                coding + 2)]:
+            stop = _skip_chunked(data, body)
+        elif length >= 0:
+            value = head[length + 17:head.find("\r\n", length + 2)].strip()
+            if not value.isdigit():
+                raise ParseError("Bad Content-Length {0!r} at {1}".format(
+                    value, pos))
+            stop = body + int(value)
+        elif response:
+            stop = end # runs until the connection closes
+        else:
+            stop = body
+        if stop > end:
+            raise ParseError("Message at {0} runs past the end of the "
+                             "log".format(pos))
+        yield response, (pos, body, stop), method
+        pos = stop
+
+
+def pairs(data, start=0, end=None):
+    """Yield the spans, see `messages`, of each request in `data` and
+    of its response. A response without a request comes with None for
+    the request, a request that never got a response with None for the
+    response."""
+    waiting = deque()
+    for response, span, _ in messages(data, start, end):
+        if not response:
+            waiting.append(span)
+        elif waiting:
+            yield waiting.popleft(), span
+        else:
+            yield None, span # a response nobody asked for
+    for span in waiting:
+        yield span, None
+
+
+###############################################################################
+# Workers
+###############################################################################
+
+_LOGS = {} # path -> mmap, in each worker
+
+
+def _map(path):
+    data = _LOGS.get(path)
+    if data is None:
+        with open(path, 'rb') as fd:
+            if not os.fstat(fd.fileno()).st_size:
+                return "" # an empty file cannot be mapped
+            data = _LOGS[path] = mmap.mmap(fd.fileno(), 0,
+                                           access=mmap.ACCESS_READ)
+    return data
+
+
+def _unmap(path):
+    data = _LOGS.pop(path, None)
+    if data is not None:
+        data.close()
+
+
+def _message(message, data, span, proto, keep_b64_raw):
+    start, body, end = span
+    message.devour(data[start:end], proto, keep_b64_raw=keep_b64_raw)
+    if end > body and (message.bodySize != end - body or
+                       not ("postData" in message or "content" in message)):
+        # devour only takes Content-Length bodies, and only for POST
+        message.set_body(data[body:end])
+        message.bodySize = end - body
+    return message
+
+
+def _entry(data, request, response, started, connection, proto,
+           keep_b64_raw):
+    entry = Entry()
+    entry.startedDateTime = started
+    entry.request = _message(Request(empty=True), data, request, proto,
+                             keep_b64_raw)
+    entry.response = _message(Response(empty=True), data, response, proto,
+                              keep_b64_raw)
+    entry.cache = Cache()
+    entry.timings = Timings(empty=True)
+    entry.timings.send = entry.timings.wait = entry.timings.receive = 0
+    entry.time = 0
+    entry.connection = connection
+    return entry
+
+
+def _build(batch):
+    """Return the json of the entries of `batch`, (path, connection,
+    started, proto, keep_b64_raw, spans)."""
+    path, connection, started, proto, keep_b64_raw, spans = batch
+    data = _map(path)
+    entries = []
+    for request, response in spans:
+        entries.append(_entry(data, request, response, started, connection,
+                              proto, keep_b64_raw).to_json())
+    return entries
+
+
+def _batches(path, connection, started, proto, keep_b64_raw, counts):
+    spans, size = [], 0
+    try:
+        for request, response in pairs(_map(path)):
+            if request is None or response is None:
+                counts[1] += 1
+                continue
+            spans.append((request, response))
+            size += response[2] - request[0]
+            if size >= BATCH_SIZE:
+                yield path, connection, started, proto, keep_b64_raw, spans
+                spans, size = [], 0
+    except ParseError, err:
+        if spans: # the pairs before the broken message still count
+            yield path, connection, started, proto, keep_b64_raw, spans
+        raise err
+    if spans:
+        yield path, connection, started, proto, keep_b64_raw, spans
+
+
+###############################################################################
+# Interface Functions and Classes
+###############################################################################
+
+
+def import_log(logs, out, processes=None, keep_b64_raw=False, proto="http",
+               started=None):
+    """Write a HAR of the raw HTTP logs at the paths `logs`, one per
+    connection, to the file like object `out` and return the number of
+    entries written and the number of messages left unpaired.
+
+    `processes` defaults to the number of CPUs, 1 builds the entries in
+    this process. Entries have the index of their log as connection.
+
+    A log that cannot be parsed raises ParseError, after the entries
+    before the broken message have been written and the HAR closed.
+
+    """
+    if isinstance(logs, basestring):
+        logs = [logs]
+    started = started or _localize_datetime(now()).isoformat()
+    processes = processes or cpu_count()
+    counts = [0, 0] # entries, unpaired
+    pool = processes > 1 and Pool(processes) or None
+    writer = HarWriter(out)
+    pending = deque()
+    broken = None
+    try:
+        for i, path in enumerate(logs):
+            # batches are cut here, not in the pool's feeder thread, so
+            # that a broken log is raised rather than lost
+            batches = _batches(path, str(i), started, proto, keep_b64_raw,
+                               counts)
+            while True:
+                try:
+                    batch = next(batches, None)
+                except ParseError, err:
+                    batch, broken = None, err
+                if batch is not None:
+                    pending.append(pool and pool.apply_async(
+                        _build, (batch,)) or _build(batch))
+                while pending and (batch is None or
+                                   len(pending) > processes * QUEUED):
+                    entries = pending.popleft()
+                    if pool:
+                        entries = entries.get()
+                    for entry in entries:
+                        writer.write_raw(entry)
+                    counts[0] += len(entries)
+                if batch is None:
+                    break
+            _unmap(path)
+            if broken:
+                break
+    finally:
+        if pool:
+            pool.terminate()
+            pool.join()
+    writer.close()
+    if broken:
+        raise broken
+    return tuple(counts)
+
+
+def usage(progn):
+    use = ("usage: %s [--processes N] [--keep-raw] out.har log [log ...]\n\n"
+           % progn)
+    use += ("Write a HAR of raw HTTP logs, each the traffic of one "
+            "connection, pairing responses with requests in order.")
+    return use
+
+
+def main(argv):
+    args = argv[1:]
+    processes, keep = None, False
+    while args and args[0].startswith("--"):
+        flag = args.pop(0)
+        if flag == "--processes" and args:
+            processes = int(args.pop(0))
+        elif flag == "--keep-raw":
+            keep = True
+        else:
+            args = []
+    if len(args) < 2:
+        print usage(argv[0])
+        return
+    with open(args[0], 'w') as out:
+        entries, unpaired = import_log(args[1:], out, processes, keep)
+    print "{0} entries, {1} messages unpaired".format(entries, unpaired)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
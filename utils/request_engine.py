@@ -29,12 +29,36 @@ import sys
 from urlparse import urlparse
 from datetime import datetime
 
-def process(request, outlist=None):
+def process(request, outlist=None, jar=None, cache=None):
 
 	try:
 		entry = Entry()
+		if jar is not None:
+			# send the cookies earlier responses set, not the captured ones
+			jar.apply(request)
 		entry.request = request
 		entry.cache = Cache()
+		lookup = None
+		if cache is not None:
+			lookup = cache.lookup(request)
+			entry.cache = lookup.cache
+			if lookup.fresh:
+				# answered without going near the target
+				entry.response = cache.respond(lookup)
+				entry._fromCache = lookup.source
+				if jar is not None:
+					# cookies set by the cached response still count
+					jar.ingest(entry.response, request.url)
+				entry.timings = Timings()
+				entry.timings.send = entry.timings.wait = 0
+				entry.timings.receive = 0
+				if type(outlist) == list:
+					outlist.append(entry)
+				else:
+					print entry.response
+				return
+			# a stale response is asked for again with its validators
+			request = entry.request = lookup.request
 		# create the HTTP GET request from the URL
 		raw_request = request.puke()
 		# prepare response for late use
@@ -94,7 +118,14 @@ def process(request, outlist=None):
 		#print raw_response
 		response.devour(raw_response)
 		#print response
+		if lookup is not None:
+			stored = cache.store(lookup, response, raw_response)
+			if stored is not response: # a 304 to a revalidation
+				entry._fromCache = lookup.source
+			response = stored
 		entry.response = response
+		if jar is not None:
+			jar.ingest(response, request.url)
 		if type(outlist) == list:
 			
 			#entry = E
@@ -118,13 +149,13 @@ def get_time_delta(start):
 	return duration
 
 
-def make_requests(g):
-	return (process(request) for request in g)
+def make_requests(g, jar=None, cache=None):
+	return (process(request, jar=jar, cache=cache) for request in g)
 
 
-def entry_generator(g):
+def entry_generator(g, jar=None, cache=None):
 	outlist = []
-	run(process(request, outlist) for request in g)
+	run(process(request, outlist, jar, cache) for request in g)
 	for entry in outlist:
 		yield entry
 
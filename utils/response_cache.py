@@ -0,0 +1,459 @@
+#!/usr/bin/env python
+# response cache for replays
+"""Answer repeated requests of a replay from a cache instead of the
+target.
+
+Running the same test plan against a slow target sends the same GETs
+every time. A ResponseCache keeps the raw responses, in memory and
+optionally on disk, keyed by a fingerprint of the request: its method,
+its url with the host lowercased, the default port left out and the
+query string sorted, a few of its headers, Authorization and Cookie
+among them, and the digest of its body::
+
+    In [0]: cache = ResponseCache(path="/tmp/replay-cache")
+
+    In [1]: lookup = cache.lookup(request)
+
+    In [2]: if lookup.fresh:
+       ...:     response = cache.respond(lookup)
+       ...: else:
+       ...:     response = cache.store(lookup, send(lookup.request))
+
+    In [3]: entry.cache = lookup.cache
+
+The cache behaves like a browser's private cache. Only GET and HEAD
+responses with a cacheable status are kept, never with no-store or
+`Vary: *`, and a response is fresh for its max-age, or until Expires,
+or for a tenth of the time since Last-Modified. A stale response with
+an ETag or a Last-Modified is revalidated: `lookup.request` is then a
+copy of the request with If-None-Match and If-Modified-Since added,
+and a 304 to it is answered with the cached response, its headers
+updated. no-cache, from either side, always revalidates.
+
+`lookup.cache` is a Cache with the state of the cached response
+before the request in beforeRequest and after it in afterRequest, and
+`lookup.source` says where an answer from the cache came from,
+"memory" or "disk", which request_engine keeps as the `_fromCache` of
+the Entry, the way browsers export it.
+
+Both tiers are least recently used first out. Memory is bounded by
+`max_entries` and `max_bytes`, disk by `max_disk_bytes`. Every
+response stored goes to disk too, one file per fingerprint, so the
+disk tier outlives the process and a later run starts warm. A hit is
+written back with its hit count, and the file's modification time set
+to the time of the hit, so a later run evicts in the same order.
+
+"""
+
+import os
+import json
+import time
+import hashlib
+from datetime import datetime
+from collections import OrderedDict
+
+try:
+    from .._internal import _epoch_ms, BlobStore
+    from ..har import Response, Header, Cache, RequestCache
+except (ValueError, ImportError):
+    from _internal import _epoch_ms, BlobStore
+    from har import Response, Header, Cache, RequestCache
+
+
+###############################################################################
+# Constants
+###############################################################################
+METHODS = frozenset(["GET", "HEAD"])
+# RFC 7231 6.1, the statuses that are cacheable by default
+STATUSES = frozenset([200, 203, 204, 206, 300, 301, 404, 405, 410, 414,
+                      501])
+# who is asking is part of the key, one user is never answered with
+# another's response
+KEY_HEADERS = ("accept", "accept-encoding", "accept-language",
+               "authorization", "cookie")
+CONDITIONS = frozenset(["if-none-match", "if-modified-since"])
+MAX_ENTRIES = 10000
+MAX_BYTES = 64 * 1024 * 1024
+MAX_DISK_BYTES = 1024 * 1024 * 1024
+
+
+###############################################################################
+# Helpers
+###############################################################################
+
+
+def _now_ms():
+    return time.time() * 1000
+
+
+def _iso(ms):
+    return datetime.utcfromtimestamp(ms / 1000.0).isoformat() + "Z"
+
+
+def _date_ms(value):
+    try:
+        return _epoch_ms(value)
+    except (ValueError, TypeError, OverflowError):
+        return None
+
+
+def _headers(message):
+    """Return the headers of `message` as a dict of lowercased name to
+    value, the last one winning."""
+    return dict((h.name.lower(), h.value)
+                for h in message._get("headers", []))
+
+
+def _directives(value):
+    """Return the Cache-Control `value` as a dict of lowercased
+    directive to its argument, or None."""
+    directives = {}
+    for part in (value or "").split(","):
+        name, _, arg = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = arg.strip('" ') or None
+    return directives
+
+
+def _seconds(value):
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _body_key(request):
+    post = request._get("postData", None)
+    if not post:
+        return ""
+    params = post._get("params", [])
+    if params:
+        return BlobStore.digest("&".join(
+            p.name + "=" + (p._get("value", None) or p._get("_blob", ""))
+            for p in params))
+    return post._get("_blob", "")
+
+
+def fingerprint(request, headers=KEY_HEADERS):
+    """Return the key `request` is cached under: a digest of its
+    method, its normalized url, the values of `headers` and its
+    body."""
+    url = request.parsed_url
+    port = url.port
+    if port == {"http": 80, "https": 443}.get(url.scheme):
+        port = None
+    sent = _headers(request)
+    parts = [request.method.upper(), url.scheme, url.host, str(port or ""),
+             url.path, "&".join(sorted(name + "=" + value
+                                       for name, value in url.pairs))]
+    parts.extend(sent.get(name, "") for name in headers)
+    parts.append(_body_key(request))
+    return hashlib.sha1("\0".join(
+        part.encode('utf8') if isinstance(part, unicode) else part
+        for part in parts)).hexdigest()
+
+
+class _Cached(object):
+    """A raw response as the cache keeps it. Times are in milliseconds
+    since the epoch."""
+
+    __slots__ = ["key", "raw", "etag", "modified", "expires", "revalidate",
+                 "vary", "hits", "access"]
+
+    def __init__(self, key, raw, etag, modified, expires, revalidate, vary,
+                 hits=0, access=None):
+        self.key = key
+        self.raw = raw
+        self.etag = etag
+        self.modified = modified
+        self.expires = expires
+        self.revalidate = revalidate
+        self.vary = vary # ((header, value the request sent), ...)
+        self.hits = hits
+        self.access = access
+
+    def meta(self):
+        return json.dumps([self.etag, self.modified, self.expires,
+                           self.revalidate, self.vary, self.hits,
+                           self.access])
+
+    def request_cache(self):
+        state = {"lastAccess": _iso(self.access), "eTag": self.etag or "",
+                 "hitCount": self.hits}
+        if self.expires is not None:
+            state["expires"] = _iso(self.expires)
+        return RequestCache(state)
+
+
+class Lookup(object):
+    """What the cache holds for one request. `request` is the request
+    to send if the answer is not `fresh`."""
+
+    __slots__ = ["key", "request", "cached", "fresh", "source", "cache"]
+
+    def __init__(self, key, request, cached, fresh, source):
+        self.key = key
+        self.request = request
+        self.cached = cached
+        self.fresh = fresh
+        self.source = source # where the cached response was found
+        self.cache = Cache()
+        if cached is not None:
+            self.cache.beforeRequest = cached.request_cache()
+
+    def __repr__(self):
+        return "<Lookup {0}: {1}>".format(
+            self.key[:12], self.fresh and "fresh" or
+            self.cached and "stale" or "miss")
+
+
+###############################################################################
+# Interface Functions and Classes
+###############################################################################
+
+
+class ResponseCache(object):
+    """Raw responses by request fingerprint, in memory and, with
+    `path`, in a directory."""
+
+    def __init__(self, path=None, max_entries=MAX_ENTRIES,
+                 max_bytes=MAX_BYTES, max_disk_bytes=MAX_DISK_BYTES,
+                 headers=KEY_HEADERS):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.headers = tuple(name.lower() for name in headers)
+        self.size = 0 # bytes of raw responses in memory
+        self.disk_size = 0
+        self.hits = self.misses = self.revalidated = 0
+        self._memory = OrderedDict() # key -> _Cached, oldest first
+        self._disk = OrderedDict() # key -> file size, oldest first
+        if path:
+            self._load_index()
+
+    def __len__(self):
+        return len(self._memory)
+
+    def __repr__(self):
+        return ("<ResponseCache: {0} in memory, {1} on disk, {2} hits, "
+                "{3} misses>".format(len(self._memory), len(self._disk),
+                                     self.hits, self.misses))
+
+    def __contains__(self, key):
+        return key in self._memory or key in self._disk
+
+    # -- tiers -----------------------------------------------------------
+
+    def _load_index(self):
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        files = []
+        for name in os.listdir(self.path):
+            if len(name) != 40: # temporary files and strangers
+                continue
+            stat = os.stat(os.path.join(self.path, name))
+            files.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(files):
+            self._disk[name] = size
+            self.disk_size += size
+        self._trim_disk()
+
+    def _file(self, key):
+        return os.path.join(self.path, key)
+
+    def _get(self, key):
+        """Return the _Cached for `key` and where it was, or (None,
+        None)."""
+        cached = self._memory.pop(key, None)
+        if cached is not None:
+            self._memory[key] = cached
+            return cached, "memory"
+        if not key in self._disk:
+            return None, None
+        try:
+            with open(self._file(key), 'rb') as fd:
+                meta, raw = fd.read().split("\n", 1)
+            os.utime(self._file(key), None)
+        except (IOError, OSError, ValueError):
+            self._drop_file(key)
+            return None, None
+        self._disk[key] = self._disk.pop(key)
+        etag, modified, expires, revalidate, vary, hits, access = \
+            json.loads(meta)
+        cached = _Cached(key, raw, etag, modified, expires, revalidate,
+                         tuple(tuple(pair) for pair in vary), hits, access)
+        self._remember(cached)
+        return cached, "disk"
+
+    def _remember(self, cached):
+        old = self._memory.pop(cached.key, None)
+        if old is not None:
+            self.size -= len(old.raw)
+        self._memory[cached.key] = cached
+        self.size += len(cached.raw)
+        while self._memory and (len(self._memory) > self.max_entries or
+                                self.size > self.max_bytes):
+            _, oldest = self._memory.popitem(last=False)
+            self.size -= len(oldest.raw)
+
+    def _write(self, cached):
+        if not self.path:
+            return
+        data = cached.meta() + "\n" + cached.raw
+        temp = self._file(cached.key) + ".tmp"
+        with open(temp, 'wb') as fd:
+            fd.write(data)
+        os.rename(temp, self._file(cached.key))
+        if cached.access is not None: # the order _load_index evicts in
+            os.utime(self._file(cached.key), (cached.access / 1000.0,) * 2)
+        self.disk_size += len(data) - self._disk.pop(cached.key, 0)
+        self._disk[cached.key] = len(data)
+        self._trim_disk()
+
+    def _drop_file(self, key):
+        self.disk_size -= self._disk.pop(key, 0)
+        try:
+            os.remove(self._file(key))
+        except OSError:
+            pass
+
+    def _trim_disk(self):
+        while self._disk and self.disk_size > self.max_disk_bytes:
+            self._drop_file(next(iter(self._disk)))
+
+    # -- requests --------------------------------------------------------
+
+    def lookup(self, request, now=None):
+        """Return the Lookup for `request`."""
+        now = now is None and _now_ms() or now
+        key = fingerprint(request, self.headers)
+        asked = _directives(_headers(request).get("cache-control"))
+        cached, source = None, None
+        if request.method.upper() in METHODS and not "no-store" in asked:
+            cached, source = self._get(key)
+        if cached is not None:
+            sent = _headers(request)
+            if any(sent.get(name, "") != value for name, value in
+                   cached.vary):
+                cached, source = None, None
+        fresh = cached is not None and not cached.revalidate and \
+                not "no-cache" in asked and cached.expires is not None and \
+                cached.expires > now
+        if cached is None or fresh or not (cached.etag or cached.modified):
+            return Lookup(key, request, cached, fresh, source)
+        conditional = request.replace()
+        conditional.headers = [h for h in conditional._get("headers", [])
+                               if not h.name.lower() in CONDITIONS]
+        if cached.etag:
+            conditional.headers.append(Header({"name": "If-None-Match",
+                                               "value": cached.etag}))
+        if cached.modified:
+            conditional.headers.append(Header({"name": "If-Modified-Since",
+                                               "value": cached.modified}))
+        return Lookup(key, conditional, cached, False, source)
+
+    def respond(self, lookup, now=None):
+        """Return the cached Response for a fresh `lookup`."""
+        now = now is None and _now_ms() or now
+        cached = lookup.cached
+        cached.hits += 1
+        cached.access = now
+        self.hits += 1
+        self._write(cached)
+        lookup.cache.afterRequest = cached.request_cache()
+        response = Response(empty=True)
+        response.devour(cached.raw)
+        return response
+
+    def store(self, lookup, response, raw=None, now=None):
+        """Take in `response`, the answer to `lookup.request`, and return
+        the Response to use: the cached one if it was a 304 to a
+        revalidation, `response` otherwise. `raw` saves rendering the
+        response again."""
+        now = now is None and _now_ms() or now
+        cached = lookup.cached
+        if response.status == 304 and cached is not None:
+            self.revalidated += 1
+            raw = self._merge(cached.raw, response)
+            response = Response(empty=True)
+            response.devour(raw)
+            hits = cached.hits + 1
+        else:
+            self.misses += 1
+            hits = 0
+        stored = self._cache(lookup, response, raw, now, hits)
+        if stored is None and cached is not None:
+            self._forget(lookup.key)
+        elif stored is not None:
+            lookup.cache.afterRequest = stored.request_cache()
+        return response
+
+    def _merge(self, raw, response):
+        """Return the cached `raw` response with the headers of the 304
+        `response` in place of its own."""
+        head, _, body = raw.partition("\r\n\r\n")
+        lines = head.split("\r\n")
+        fresh = _headers(response)
+        kept = [line for line in lines[1:]
+                if not line.partition(":")[0].lower() in fresh]
+        added = [h.name + ": " + h.value for h in response.headers]
+        return "\r\n".join(lines[:1] + kept + added) + "\r\n\r\n" + body
+
+    def _cache(self, lookup, response, raw, now, hits):
+        """Keep `response` if it may be, and return the _Cached."""
+        request = lookup.request
+        if not request.method.upper() in METHODS or \
+           not response.status in STATUSES:
+            return None
+        received = _headers(response)
+        control = _directives(received.get("cache-control"))
+        asked = _directives(_headers(request).get("cache-control"))
+        if "no-store" in control or "no-store" in asked or \
+           received.get("vary", "").strip() == "*":
+            return None
+        expires = self._expires(received, control, now)
+        etag = received.get("etag")
+        modified = received.get("last-modified")
+        if expires is None and not (etag or modified):
+            return None
+        sent = _headers(request)
+        vary = tuple((name, sent.get(name, "")) for name in
+                     (v.strip().lower() for v in
+                      received.get("vary", "").split(","))
+                     if name and not name in CONDITIONS)
+        cached = _Cached(lookup.key, raw if raw is not None else
+                         response.puke(), etag, modified, expires,
+                         "no-cache" in control, vary, hits, now)
+        self._remember(cached)
+        self._write(cached)
+        return cached
+
+    def _expires(self, received, control, now):
+        age = _seconds(received.get("age")) or 0
+        max_age = _seconds(control.get("max-age"))
+        if max_age is not None:
+            return now + (max_age - age) * 1000
+        date = _date_ms(received.get("date", "")) or now
+        if "expires" in received:
+            expires = _date_ms(received["expires"])
+            # a date that cannot be read means already expired
+            return now + ((expires or date) - date) - age * 1000
+        modified = _date_ms(received.get("last-modified", ""))
+        if modified is not None and modified < date:
+            return now + (date - modified) / 10 - age * 1000
+        return None
+
+    def _forget(self, key):
+        cached = self._memory.pop(key, None)
+        if cached is not None:
+            self.size -= len(cached.raw)
+        if key in self._disk:
+            self._drop_file(key)
+
+    def clear(self):
+        """Drop every response, from disk too."""
+        for key in self._disk.keys():
+            self._drop_file(key)
+        self._memory.clear()
+        self.size = 0
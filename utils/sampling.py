@@ -0,0 +1,414 @@
+#!/usr/bin/env python
+# samples and summaries of large captures
+"""Get a feel for a capture too big to load, in one pass over it.
+
+A Summary is handed the entries one at a time, by `summarize` straight
+from a HarReader, and keeps only a bounded amount of them. It ends up
+with a sample of the entries, uniform or stratified by host, path or
+status, the slowest entries and the busiest hosts, paths and
+statuses::
+
+    In [0]: summary = summarize(open('capture.har'), size=500, by="host",
+       ...:                     fraction=0.01)
+
+    In [1]: summary.stats()["hosts"][:2]
+    Out[1]: [('a.com', 812004, 0), ('cdn.a.com', 401377, 0)]
+
+    In [2]: hc = summary.sample()
+
+    In [3]: [e["request"]["url"] for e in summary.slowest]
+
+`sample()` is a HarContainer of the kept entries and the pages they
+refer to, small enough to be looked at with everything else here.
+
+The pieces can be used on their own. A Reservoir keeps a uniform
+sample of `size` items of a stream of any length, skipping ahead
+between replacements rather than drawing a number for every item. A
+Stratified keeps a Reservoir for each key, after keeping each item
+with a chance of `fraction` ("1% by host" is fraction=0.01, by="host",
+with `size` the most kept of any one host). SpaceSaving counts the most
+frequent keys of a stream in a fixed number of counters, each count
+being at most `error` too high, and a CountMin estimates the count of
+any key, never too low. TopK keeps the items with the largest values.
+
+"""
+
+import sys
+import json
+import heapq
+from math import exp, log, floor
+from random import Random
+
+try:
+    from ..har import HarContainer, Creator
+    from .har_stream import HarReader
+except (ValueError, ImportError):
+    from har import HarContainer, Creator
+    from utils.har_stream import HarReader
+
+
+###############################################################################
+# Constants
+###############################################################################
+SAMPLE_SIZE = 1000
+SLOWEST = 10
+CAPACITY = 1000 # counters for each SpaceSaving
+WIDTH = 2048 # of a CountMin, its error is about total * e / WIDTH
+DEPTH = 4
+KEYS = ("host", "path", "status")
+PLURALS = {"host": "hosts", "path": "paths", "status": "statuses"}
+READ_SIZE = 1024 * 1024
+
+
+###############################################################################
+# Helpers
+###############################################################################
+
+
+def _fields(obj):
+    if obj is None:
+        return {}
+    if isinstance(obj, dict):
+        return obj
+    return obj.__dict__
+
+
+def _host_path(url):
+    rest = url.partition("://")[2]
+    slash = rest.find("/")
+    if slash < 0:
+        host, path = rest, "/"
+    else:
+        host, path = rest[:slash], rest[slash:].partition("?")[0]
+    return host.rpartition("@")[2].partition(":")[0].lower(), path
+
+
+def _keys(entry):
+    """Return the host, path and status of a json entry."""
+    host, path = _host_path(_fields(entry.get("request")).get("url", ""))
+    return host, path, _fields(entry.get("response")).get("status", 0)
+
+
+def _json(entry):
+    if isinstance(entry, dict):
+        return entry
+    return json.loads(entry.to_json())
+
+
+###############################################################################
+# Samplers and Sketches
+###############################################################################
+
+
+class Reservoir(object):
+    """A uniform sample of at most `size` of the items added, `items`.
+    `rand` is a random.Random, for samples that can be repeated."""
+
+    def __init__(self, size=SAMPLE_SIZE, rand=None):
+        self.size = size
+        self.rand = rand or Random()
+        self.items = []
+        self.seen = 0
+        self._weight = 1.0
+        self._next = None
+
+    def __repr__(self):
+        return "<Reservoir: {0} of {1} items>".format(len(self.items),
+                                                       self.seen)
+
+    def __len__(self):
+        return len(self.items)
+
+    def _skip(self):
+        # Li's algorithm L: the index of the next item to keep
+        rand = self.rand.random
+        self._weight *= exp(log(rand() or 1e-300) / self.size)
+        self._next = self.seen + int(floor(log(rand() or 1e-300) /
+                                           log(max(1 - self._weight,
+                                                   1e-300))))
+
+    def add(self, item):
+        """Offer `item` to the sample."""
+        index = self.seen
+        self.seen += 1
+        if index < self.size:
+            self.items.append(item)
+            if self.seen == self.size:
+                self._skip()
+        elif index == self._next:
+            self.items[self.rand.randrange(self.size)] = item
+            self._skip()
+
+
+class Stratified(object):
+    """A Reservoir of at most `size` items for each key, of the items
+    left after each is kept with a chance of `fraction`. `seen` counts
+    every item offered by key."""
+
+    def __init__(self, size=SAMPLE_SIZE, fraction=1.0, rand=None):
+        self.size = size
+        self.fraction = fraction
+        self.rand = rand or Random()
+        self.strata = {}
+        self.seen = {}
+
+    def __repr__(self):
+        return "<Stratified: {0} strata, {1} items>".format(
+            len(self.strata), len(self))
+
+    def __len__(self):
+        return sum(len(reservoir) for reservoir in self.strata.itervalues())
+
+    @property
+    def items(self):
+        return [item for key in sorted(self.strata)
+                for item in self.strata[key].items]
+
+    def add(self, key, item):
+        """Offer `item` to the sample of `key`."""
+        self.seen[key] = self.seen.get(key, 0) + 1
+        if self.fraction < 1 and self.rand.random() >= self.fraction:
+            return
+        if key not in self.strata:
+            self.strata[key] = Reservoir(self.size, self.rand)
+        self.strata[key].add(item)
+
+
+class TopK(object):
+    """The `count` items with the largest values added."""
+
+    def __init__(self, count=SLOWEST):
+        self.count = count
+        self._heap = []
+        self._added = 0
+
+    def __repr__(self):
+        return "<TopK: {0} of {1}>".format(len(self._heap), self.count)
+
+    def add(self, value, item):
+        self._added += 1 # keeps items from ever being compared
+        if len(self._heap) < self.count:
+            heapq.heappush(self._heap, (value, self._added, item))
+        elif value > self._heap[0][0]:
+            heapq.heapreplace(self._heap, (value, self._added, item))
+
+    def items(self):
+        """Return the (value, item) pairs, largest first."""
+        return [(value, item) for value, _, item in
+                sorted(self._heap, reverse=True)]
+
+
+class SpaceSaving(object):
+    """Counts of the most frequent keys added, in `capacity` counters.
+    A key that is not counted takes the counter of the least counted
+    one, and its count, which is then also its error."""
+
+    def __init__(self, capacity=CAPACITY):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self.total = 0
+        self._heap = [] # (count, key), counts can be out of date
+
+    def __repr__(self):
+        return "<SpaceSaving: {0} of {1} keys>".format(len(self.counts),
+                                                       self.capacity)
+
+    def _least(self):
+        heap = self._heap
+        while True:
+            count, key = heap[0]
+            if self.counts[key] == count:
+                return heapq.heappop(heap)
+            heapq.heapreplace(heap, (self.counts[key], key))
+
+    def add(self, key, count=1):
+        self.total += count
+        counts = self.counts
+        if key in counts:
+            counts[key] += count
+            return
+        error = 0
+        if len(counts) >= self.capacity:
+            error, least = self._least()
+            del counts[least], self.errors[least]
+        counts[key] = error + count
+        self.errors[key] = error
+        heapq.heappush(self._heap, (error + count, key))
+
+    def top(self, count=10):
+        """Return the `count` most frequent keys as (key, count, error),
+        most frequent first."""
+        return [(key, value, self.errors[key]) for key, value in
+                heapq.nlargest(count, self.counts.iteritems(),
+                               key=lambda item: item[1])]
+
+
+class CountMin(object):
+    """An estimate of the count of every key added, in `depth` rows of
+    `width` counters."""
+
+    def __init__(self, width=WIDTH, depth=DEPTH):
+        self.width = width
+        self.rows = [[0] * width for _ in xrange(depth)]
+        self.total = 0
+
+    def __repr__(self):
+        return "<CountMin: {0}x{1}, {2} counted>".format(
+            len(self.rows), self.width, self.total)
+
+    def add(self, key, count=1):
+        self.total += count
+        width = self.width
+        for i, row in enumerate(self.rows):
+            row[hash((i, key)) % width] += count
+
+    def estimate(self, key):
+        width = self.width
+        return min(row[hash((i, key)) % width]
+                   for i, row in enumerate(self.rows))
+
+
+###############################################################################
+# Interface Functions and Classes
+###############################################################################
+
+
+class Summary(object):
+    """A sample, the slowest entries and the busiest keys of the entries
+    added. The sample is uniform, or stratified when `by` is "host",
+    "path", "status" or a function of the entry, see Stratified
+    for `size` and `fraction`. `seed` makes the sample repeatable."""
+
+    def __init__(self, size=SAMPLE_SIZE, by=None, fraction=1.0,
+                 slowest=SLOWEST, capacity=CAPACITY, seed=None):
+        rand = Random(seed)
+        self.by = by
+        if by is None:
+            self._sample = Reservoir(size, rand)
+        else:
+            self._sample = Stratified(size, fraction, rand)
+        self._slowest = TopK(slowest)
+        self.heavy = dict((key, SpaceSaving(capacity)) for key in KEYS)
+        self.counts = dict((key, CountMin()) for key in KEYS)
+        self.entries = 0
+        self.time = 0.0
+        self.bytes = 0
+        self.pages = None
+
+    def __repr__(self):
+        return "<Summary: {0} entries, {1} sampled>".format(
+            self.entries, len(self._sample))
+
+    def add(self, entry):
+        """Add `entry`, an Entry or its json."""
+        fields = _fields(entry)
+        keys = _keys(fields)
+        for name, key in zip(KEYS, keys):
+            self.heavy[name].add(key)
+            self.counts[name].add(key)
+        time = fields.get("time", -1)
+        if time >= 0:
+            self.time += time
+            self._slowest.add(time, entry)
+        size = _fields(fields.get("response")).get("bodySize", -1)
+        if size > 0:
+            self.bytes += size
+        self.entries += 1
+        if self.by is None:
+            self._sample.add(entry)
+        elif callable(self.by):
+            self._sample.add(self.by(entry), entry)
+        else:
+            self._sample.add(keys[KEYS.index(self.by)], entry)
+
+    def update(self, entries):
+        """Add every one of `entries`."""
+        for entry in entries:
+            self.add(entry)
+        return self
+
+    @property
+    def slowest(self):
+        """The slowest entries, slowest first."""
+        return [entry for _, entry in self._slowest.items()]
+
+    def estimate(self, name, key):
+        """Return about how many entries had `key` as their "host",
+        "path" or "status", never fewer than did."""
+        return self.counts[name].estimate(key)
+
+    def stats(self, count=10):
+        """Return a dictionary of the number of entries, their total time
+        and response body bytes, the `count` busiest of each of KEYS as
+        (key, count, error) and, when stratified, how many entries of
+        each stratum were seen and kept."""
+        stats = {"entries": self.entries, "time": self.time,
+                 "bytes": self.bytes, "sampled": len(self._sample),
+                 "slowest": [(time, _fields(_fields(entry).get(
+                     "request")).get("url")) for time, entry
+                     in self._slowest.items()]}
+        for name in KEYS:
+            stats[PLURALS[name]] = self.heavy[name].top(count)
+        if self.by is not None:
+            stats["strata"] = dict(
+                (key, (seen, len(self._sample.strata.get(key, ()))))
+                for key, seen in self._sample.seen.iteritems())
+        return stats
+
+    def sample(self, pages=None, creator=None):
+        """Return a HarContainer of the sampled entries, in the order
+        they started, with those of `pages` (json, `pages` by default)
+        they refer to."""
+        entries = sorted((_json(entry) for entry in self._sample.items),
+                         key=lambda entry: entry.get("startedDateTime"))
+        log = {"version": "1.2", "entries": entries,
+               "creator": json.loads((creator or Creator()).to_json())}
+        pages = pages is None and self.pages or pages
+        if pages is not None:
+            used = set(entry.get("pageref") for entry in entries)
+            log["pages"] = [page for page in pages if page["id"] in used]
+        return HarContainer({"log": log})
+
+
+def summarize(fd, **options):
+    """summarize(fd, [size, by, fraction, slowest, capacity, seed])
+    -> Summary
+
+    Summarize the HAR read from the file like object `fd`, an entry at
+    a time. The pages read are kept as `pages` for Summary.sample."""
+    reader = HarReader(fd, READ_SIZE)
+    summary = Summary(**options).update(reader)
+    summary.pages = reader.pages
+    return summary
+
+
+def usage(progn):
+    use = ("usage: %s [--size N] [--by host|path|status] [--fraction F] "
+           "[--seed N] file.har [sample.har]\n\n" % progn)
+    use += ("Print a summary of a HAR, read in one pass, and write a "
+            "sample of its entries.")
+    return use
+
+
+def main(argv):
+    args = argv[1:]
+    options = {}
+    kinds = {"--size": int, "--by": str, "--fraction": float, "--seed": int}
+    while len(args) > 1 and args[0] in kinds:
+        options[args[0][2:]] = kinds[args[0]](args[1])
+        args = args[2:]
+    if not args or args[0].startswith("-"):
+        print usage(argv[0])
+        return
+    with open(args[0], 'rb') as fd:
+        summary = summarize(fd, **options)
+    print json.dumps(summary.stats(), indent=4)
+    if len(args) > 1:
+        hc = summary.sample()
+        with open(args[1], 'w') as out:
+            hc.dump(out)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
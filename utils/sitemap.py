@@ -0,0 +1,357 @@
+#!/usr/bin/env python
+# sitemaps of captures
+"""Build a sitemap of the hosts, paths and query parameters in a
+capture.
+
+Every entry's url is put in to a trie, a level per host and then per
+path segment, and each node keeps how many requests ended there, by
+which methods, with which statuses, how many bytes came back and the
+names of the query parameters sent::
+
+    In [0]: sitemap = build(open('capture.har'))
+
+    In [1]: print sitemap
+    a.com (120)
+      /api/v1 (80)
+        /users/{id} (64) GET 60, PUT 4; 200 63, 404 1; 9.1 KB ?expand,page
+        /search (16) GET 16; 200 16; 40.2 KB ?q
+
+    In [2]: sitemap.find("a.com/api/v1/users/42").statuses
+    Out[2]: {200: 63, 404: 1}
+
+The trie is compressed. A run of segments that never branches and that
+no request ended in the middle of is one node, like /api/v1 above.
+Segments that look like ids, all digits, long hex or uuids, are put
+under {id}, so /users/1 and /users/2 are the same place.
+
+Memory is bounded by the size of the site, not of the capture. Past
+`max_children` children of a node, or `max_nodes` in all, new segments
+go under a * node instead, and past `max_params` query parameter names
+on a node new ones are counted as *. Entries are read with a HarReader
+by `build`, or handed to `add` one at a time, as HAR objects or json
+dictionaries. From the shell::
+
+    $ python -m utils.sitemap capture.har
+    $ python -m utils.sitemap --json capture.har
+
+"""
+
+import re
+import sys
+import json
+
+try:
+    from .har_stream import HarReader
+except (ValueError, ImportError):
+    from utils.har_stream import HarReader
+
+
+###############################################################################
+# Constants
+###############################################################################
+ID_SEGMENT = re.compile(r"^(?:\d+|[0-9a-fA-F]{16,}|[0-9a-fA-F]{8}-"
+                        r"[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-"
+                        r"[0-9a-fA-F]{12})$")
+ID = "{id}"
+OTHER = "*"
+MAX_NODES = 1000000
+MAX_CHILDREN = 1000
+MAX_PARAMS = 100
+READ_SIZE = 1024 * 1024
+
+
+###############################################################################
+# Helpers
+###############################################################################
+
+
+def _fields(obj):
+    if obj is None:
+        return {}
+    if isinstance(obj, dict):
+        return obj
+    return obj.__dict__
+
+
+def _split_url(url):
+    """Split an absolute url in to its host, its path segments and the
+    names of its query parameters, much quicker than urlsplit."""
+    rest = url.partition("://")[2].partition("#")[0]
+    rest, _, query = rest.partition("?")
+    host, _, path = rest.partition("/")
+    host = host.rpartition("@")[2]
+    if host.startswith("["): # an IPv6 address
+        host = host[1:].partition("]")[0].lower()
+    else:
+        host = host.partition(":")[0].lower()
+    segments = [ID if ID_SEGMENT.match(segment) else segment
+                for segment in path.split("/") if segment]
+    names = [pair.partition("=")[0] for pair in query.split("&") if pair]
+    return host, segments, names
+
+
+def _size(response):
+    size = response.get("bodySize", -1)
+    if size < 0:
+        size = _fields(response.get("content")).get("size", -1)
+    return max(size, 0)
+
+
+def _count(counts, key):
+    counts[key] = counts.get(key, 0) + 1
+
+
+def _human(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            break
+        size /= 1024.0
+    return unit == "B" and "{0} B".format(size) or \
+           "{0:.1f} {1}".format(size, unit)
+
+
+def _counts_text(counts):
+    return ", ".join("{0} {1}".format(key, count) for key, count
+                     in sorted(counts.iteritems(),
+                               key=lambda i: (-i[1], i[0])))
+
+
+###############################################################################
+# Interface Functions and Classes
+###############################################################################
+
+
+class SiteNode(object):
+    """A place in a Sitemap. `label` is the host, or the path segments
+    joined with /, that lead to it from its parent. `count` is the
+    number of requests that ended here, and `methods`, `statuses` and
+    `params` count them by method, status and query parameter name.
+    `size` is the bytes of their response bodies."""
+
+    __slots__ = ("label", "children", "count", "methods", "statuses",
+                 "size", "params")
+
+    def __init__(self, label):
+        self.label = label
+        self.children = {}
+        self.count = 0
+        self.methods = {}
+        self.statuses = {}
+        self.size = 0
+        self.params = {}
+
+    def __repr__(self):
+        return "<SiteNode {0!r}: {1} requests, {2} children>".format(
+            self.name, self.count, len(self.children))
+
+    @property
+    def name(self):
+        return "/".join(self.label)
+
+    def total(self):
+        """Return the number of requests that ended here or below."""
+        return self.count + sum(child.total()
+                                for child in self.children.itervalues())
+
+    def to_dict(self):
+        children = [self.children[key].to_dict()
+                    for key in sorted(self.children)]
+        return {"name": self.name, "count": self.count,
+                "total": self.count + sum(c["total"] for c in children),
+                "size": self.size, "methods": self.methods,
+                "statuses": dict((str(status), count) for status, count
+                                 in self.statuses.iteritems()),
+                "params": self.params, "children": children}
+
+
+class Sitemap(object):
+    """A trie of the urls of the entries added to it, see the module
+    docstring. `hosts` holds a SiteNode for each host."""
+
+    def __init__(self, max_nodes=MAX_NODES, max_children=MAX_CHILDREN,
+                 max_params=MAX_PARAMS):
+        self.max_nodes = max_nodes
+        self.max_children = max_children
+        self.max_params = max_params
+        self.root = SiteNode(())
+        self.nodes = 0
+        self.entries = 0
+
+    def __repr__(self):
+        return "<Sitemap: {0} entries, {1} hosts, {2} nodes>".format(
+            self.entries, len(self.hosts), self.nodes)
+
+    def __str__(self):
+        return self.to_text()
+
+    @property
+    def hosts(self):
+        return self.root.children
+
+    def _child(self, node, key, label):
+        # the child of `node` for a new `label` starting with `key`,
+        # or the * node when there are too many already
+        if len(node.children) >= self.max_children or \
+           self.nodes >= self.max_nodes:
+            key, label = OTHER, (OTHER,)
+            if key in node.children:
+                return node.children[key], 1
+            if self.nodes >= self.max_nodes:
+                return None, 0
+        child = node.children[key] = SiteNode(label)
+        self.nodes += 1
+        return child, len(label)
+
+    def _insert(self, host, segments):
+        node = self.root
+        path = [host] + segments
+        i = 0
+        while i < len(path):
+            child = node.children.get(path[i])
+            if child is None:
+                child, used = self._child(node, path[i],
+                                          i and tuple(path[i:]) or (host,))
+                if child is None:
+                    break # out of nodes, so it ends here
+                node, i = child, i + used
+                continue
+            label = child.label
+            j = 1
+            while j < len(label) and i + j < len(path) and \
+                  label[j] == path[i + j]:
+                j += 1
+            if j < len(label): # split the edge where the paths part
+                if self.nodes >= self.max_nodes:
+                    break
+                middle = node.children[path[i]] = SiteNode(label[:j])
+                child.label = label[j:]
+                middle.children[child.label[0]] = child
+                self.nodes += 1
+                child = middle
+            node, i = child, i + j
+        return node
+
+    def add(self, entry):
+        """Add the request of `entry`, a HAR object or a dictionary."""
+        entry = _fields(entry)
+        request = _fields(entry.get("request"))
+        response = _fields(entry.get("response"))
+        host, segments, names = _split_url(request.get("url", ""))
+        node = self._insert(host, segments)
+        node.count += 1
+        _count(node.methods, request.get("method", ""))
+        _count(node.statuses, response.get("status", 0))
+        node.size += _size(response)
+        params = node.params
+        for name in names:
+            if name not in params and len(params) >= self.max_params:
+                name = OTHER
+            params[name] = params.get(name, 0) + 1
+        self.entries += 1
+        return node
+
+    def update(self, entries):
+        """Add every one of `entries`."""
+        for entry in entries:
+            self.add(entry)
+        return self
+
+    def find(self, path):
+        """Return the SiteNode for `path`, a host followed by a url path
+        like "a.com/api/v1", or None. Ids are looked up as {id}."""
+        host, segments, _ = _split_url("http://" + path)
+        node, i = self.root, 0
+        path = [host] + segments
+        while i < len(path):
+            node = node.children.get(path[i])
+            if node is None or \
+               tuple(path[i:i + len(node.label)]) != node.label:
+                return None
+            i += len(node.label)
+        return node
+
+    def walk(self):
+        """Yield (path, SiteNode) for every node, depth first, path being
+        the host and url path that lead to it."""
+        stack = [(self.hosts[key].name, self.hosts[key])
+                 for key in sorted(self.hosts, reverse=True)]
+        while stack:
+            path, node = stack.pop()
+            yield path, node
+            for key in sorted(node.children, reverse=True):
+                child = node.children[key]
+                stack.append((path + "/" + child.name, child))
+
+    def to_dict(self):
+        """Return the sitemap as a dictionary, a list of hosts each with
+        its children, for json."""
+        return {"entries": self.entries,
+                "hosts": [self.hosts[key].to_dict()
+                          for key in sorted(self.hosts)]}
+
+    def to_json(self):
+        return json.dumps(self.to_dict())
+
+    def _totals(self):
+        # the total of every node at once, rather than a walk for each
+        totals = {}
+        nodes = [node for _, node in self.walk()]
+        for node in reversed(nodes): # children before their parents
+            totals[id(node)] = node.count + sum(
+                totals[id(child)] for child in node.children.itervalues())
+        return totals
+
+    def to_text(self):
+        """Return the sitemap as an indented outline, one line a node."""
+        totals = self._totals()
+        lines = []
+        stack = [(0, self.hosts[key]) for key in sorted(self.hosts,
+                                                        reverse=True)]
+        while stack:
+            depth, node = stack.pop()
+            line = "{0}{1} ({2})".format(
+                "  " * depth, depth and "/" + node.name or node.name,
+                totals[id(node)])
+            if node.count:
+                line += " {0}; {1}; {2}".format(
+                    _counts_text(node.methods), _counts_text(node.statuses),
+                    _human(node.size))
+            if node.params:
+                line += " ?" + ",".join(sorted(node.params))
+            lines.append(line)
+            stack.extend((depth + 1, node.children[key]) for key
+                         in sorted(node.children, reverse=True))
+        return "\n".join(lines)
+
+
+def build(fd, **limits):
+    """build(fd, [max_nodes, max_children, max_params]) -> Sitemap
+
+    Build the Sitemap of the HAR read from the file like object `fd`,
+    an entry at a time."""
+    return Sitemap(**limits).update(HarReader(fd, READ_SIZE))
+
+
+def usage(progn):
+    use = "usage: %s [--json] file.har [file.har ...]\n\n" % progn
+    use += "Print the sitemap of the requests in HARs, as text or json."
+    return use
+
+
+def main(argv):
+    args = argv[1:]
+    as_json = args[:1] == ["--json"]
+    if as_json:
+        args = args[1:]
+    if not args:
+        print usage(argv[0])
+        return
+    sitemap = Sitemap()
+    for path in args:
+        with open(path, 'rb') as fd:
+            sitemap.update(HarReader(fd, READ_SIZE))
+    print as_json and sitemap.to_json() or sitemap.to_text()
+
+
+if __name__ == "__main__":
+    main(sys.argv)
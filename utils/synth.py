@@ -0,0 +1,449 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# synthetic traffic for scale testing
+"""Generate large, realistic, spec valid HARs and raw HTTP streams.
+
+Everything is generated from a seed, so the same seed always gives the
+same bytes and a stress test or a benchmark can be rerun exactly
+without keeping multi-GB captures around::
+
+    In [0]: corpus = Corpus(seed=42)
+
+    In [1]: entry = next(corpus.entries(1))
+
+    In [2]: corpus.write_har(open('big.har', 'w'), 1000000)
+
+    In [3]: corpus.write_raw(open('big.raw', 'w'), 1000)
+
+Entries are generated one at a time and written straight out, so
+writing a million entry HAR takes no more memory than writing one.
+
+The traffic is meant to look like a crawl rather than like noise. Hosts
+and paths are picked with a Zipf like skew, so a few are very popular
+and most are rare. Methods, statuses and mime types follow the sort of
+mix a browser produces, body sizes are log-normal with the occasional
+multi-MB download, and every host builds up its own cookie jar. Some
+bodies are binary (written as base64 in the HAR), some are utf8 text
+with non-ascii characters in it, some are latin1 that is not valid utf8
+and some are gzipped.
+
+`headers` and `body_size` can be given as fixed numbers instead of
+being drawn from these distributions, which is what the benchmarks do.
+
+From the shell::
+
+    $ python -m utils.synth har 1000000 --seed 1 > big.har
+    $ python -m utils.synth raw 1000 > big.raw
+
+"""
+
+import gzip
+import json
+import random
+from bisect import bisect
+from cStringIO import StringIO
+from base64 import b64encode
+from datetime import datetime, timedelta
+from urllib import quote
+
+try:
+    from .har_stream import HarWriter
+except (ValueError, ImportError):
+    from utils.har_stream import HarWriter
+
+
+###############################################################################
+# Constants
+###############################################################################
+WORDS = ["alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf",
+         "hotel", "india", "juliet", "kilo", "lima", "mike", "november",
+         "oscar", "papa", "quebec", "romeo", "sierra", "tango", "uniform",
+         "victor", "whiskey", "xray", "yankee", "zulu"]
+UNICODE_WORDS = [u"caf\xe9", u"na\xefve", u"日本", u"слово",
+                 u"stra\xdfe", u"\U0001f600"]
+START = datetime(2012, 6, 25, 22, 50, 54)
+BLOCK_SIZE = 64 * 1024
+
+METHODS = [("GET", 85), ("POST", 10), ("PUT", 2), ("DELETE", 1),
+           ("HEAD", 2)]
+STATUSES = [(200, "OK", 80), (304, "Not Modified", 7), (302, "Found", 3),
+            (301, "Moved Permanently", 1), (404, "Not Found", 5),
+            (500, "Internal Server Error", 2), (204, "No Content", 2)]
+# mime type, weight, median body size, kind of body
+MIME_TYPES = [("text/html; charset=utf-8", 20, 20000, "text"),
+              ("application/javascript", 25, 40000, "text"),
+              ("text/css", 10, 15000, "text"),
+              ("application/json", 15, 2000, "unicode"),
+              ("image/png", 15, 12000, "binary"),
+              ("image/jpeg", 10, 30000, "binary"),
+              ("text/plain; charset=iso-8859-1", 2, 4000, "latin1"),
+              ("application/octet-stream", 3, 200000, "gzip")]
+
+
+###############################################################################
+# Corpus
+###############################################################################
+
+
+class _Weighted(object):
+    """Picks from (value, weight) pairs."""
+
+    def __init__(self, pairs):
+        self.values = [pair[0] for pair in pairs]
+        self.cumulative = []
+        total = 0
+        for pair in pairs:
+            total += pair[-1]
+            self.cumulative.append(total)
+        self.total = total
+
+    def pick(self, rand):
+        return self.values[bisect(self.cumulative,
+                                  rand.random() * self.total)]
+
+
+def _zipf(count, skew=1.1):
+    return _Weighted([(i, 1.0 / (i + 1) ** skew) for i in range(count)])
+
+
+class Corpus(object):
+    """A deterministic source of synthetic traffic.
+
+    `hosts` and `paths` size the site, `max_cookies` bounds the cookie
+    jar each host builds up, `max_body` caps body sizes and
+    `large_body_ratio` is the share of responses that are multi-MB
+    downloads. `headers` and `body_size` fix the number of extra
+    headers and the body size instead of drawing them at random.
+
+    """
+
+    def __init__(self, seed=0, hosts=50, paths=500, max_cookies=40,
+                 max_body=8 * 1024 * 1024, large_body_ratio=0.001,
+                 headers=None, body_size=None, entries_per_page=40):
+        self.seed = seed
+        self.hosts = ["{0}{1}.example.com".format(WORDS[i % len(WORDS)], i)
+                      for i in range(hosts)]
+        self.paths = paths
+        self.max_cookies = max_cookies
+        self.max_body = max_body
+        self.large_body_ratio = large_body_ratio
+        self.headers = headers
+        self.body_size = body_size
+        self.entries_per_page = entries_per_page
+        self._host_pick = _zipf(hosts)
+        self._path_pick = _zipf(paths)
+        self._method_pick = _Weighted(METHODS)
+        self._status_pick = _Weighted([(s[:2], s[2]) for s in STATUSES])
+        self._mime_pick = _Weighted([(m, m[1]) for m in MIME_TYPES])
+        rand = random.Random(seed)
+        # bodies are cut from these blocks, generating a multi-MB body
+        # byte by byte would take longer than parsing it
+        self._binary = "".join(chr(rand.getrandbits(8))
+                               for _ in xrange(BLOCK_SIZE))
+        self._text = " ".join(rand.choice(WORDS)
+                              for _ in xrange(BLOCK_SIZE // 5))[:BLOCK_SIZE]
+
+    def __repr__(self):
+        return "<Corpus seed {0}: {1} hosts, {2} paths>".format(
+            self.seed, len(self.hosts), self.paths)
+
+    def _block(self, block, rand, size):
+        offset = rand.randint(0, len(block) - 1)
+        out = [block[offset:offset + size]]
+        left = size - len(out[0])
+        while left > 0:
+            out.append(block[:left])
+            left -= len(out[-1])
+        return "".join(out)
+
+    def _body(self, rand, kind, median):
+        if self.body_size is not None:
+            size = self.body_size
+        elif rand.random() < self.large_body_ratio:
+            size = rand.randint(min(1024 * 1024, self.max_body),
+                                self.max_body)
+        else:
+            size = min(int(rand.lognormvariate(0, 1) * median),
+                       self.max_body)
+        if kind == "binary":
+            return self._block(self._binary, rand, size)
+        if kind == "unicode":
+            text = self._block(self._text, rand, size).decode('ascii')
+            word = rand.choice(UNICODE_WORDS)
+            return (word + text[len(word):]).encode('utf8')
+        if kind == "latin1":
+            return "\xe9t\xe9 " + self._block(self._text, rand, size)
+        if kind == "gzip":
+            out = StringIO()
+            with gzip.GzipFile(fileobj=out, mode='wb', mtime=0) as fd:
+                fd.write(self._block(self._text, rand, size))
+            return out.getvalue()
+        return self._block(self._text, rand, size)
+
+    def _headers(self, rand):
+        count = self.headers
+        if count is None:
+            count = rand.randint(4, 16)
+        return [("X-{0}-{1}".format(rand.choice(WORDS).title(), i),
+                 " ".join(rand.choice(WORDS) for _ in range(3)))
+                for i in range(count)]
+
+    def _url(self, rand, host):
+        path = self._path_pick.pick(rand)
+        segments = [WORDS[(path * (i + 7)) % len(WORDS)]
+                    for i in range(path % 5 + 1)]
+        url = "http://{0}/{1}/{2}".format(host, "/".join(segments), path)
+        query = [(rand.choice(WORDS), quote(rand.choice(WORDS + ["a b",
+                                                                 "x&y"])))
+                 for _ in range(rand.choice([0, 0, 0, 1, 2, 4]))]
+        if query:
+            url += "?" + "&".join("=".join(q) for q in query)
+        return url, query
+
+    def exchanges(self, count):
+        """Yield `count` exchanges. An exchange is a dictionary holding
+        everything needed to build the entry and the raw messages."""
+        rand = random.Random(self.seed)
+        jars = {}
+        started = START
+        for i in xrange(count):
+            host = self.hosts[self._host_pick.pick(rand)]
+            jar = jars.setdefault(host, [])
+            url, query = self._url(rand, host)
+            method = self._method_pick.pick(rand)
+            status, status_text = self._status_pick.pick(rand)
+            mime, _, median, kind = self._mime_pick.pick(rand)
+            request_body = ""
+            if method in ("POST", "PUT"):
+                request_body = "&".join(
+                    "{0}={1}".format(rand.choice(WORDS), rand.randint(0, 99))
+                    for _ in range(rand.randint(1, 6)))
+            response_body = ""
+            if method != "HEAD" and status not in (204, 304):
+                response_body = self._body(rand, kind, median)
+            set_cookies = []
+            if len(jar) < self.max_cookies and rand.random() < 0.3:
+                for _ in range(rand.randint(1, 3)):
+                    cookie = ("{0}{1}".format(rand.choice(WORDS), len(jar)),
+                              "{0:x}".format(rand.getrandbits(64)))
+                    jar.append(cookie)
+                    set_cookies.append(cookie)
+            started += timedelta(milliseconds=rand.expovariate(1 / 50.0))
+            wait = int(rand.lognormvariate(3.5, 0.8))
+            yield {"index": i,
+                   "host": host,
+                   "url": url,
+                   "path": url.split(host, 1)[1],
+                   "query": query,
+                   "method": method,
+                   "request_headers": self._headers(rand),
+                   "request_cookies": list(jar[:-len(set_cookies) or None]),
+                   "request_body": request_body,
+                   "status": status,
+                   "status_text": status_text,
+                   "mime": mime,
+                   "kind": kind,
+                   "response_headers": self._headers(rand),
+                   "set_cookies": set_cookies,
+                   "response_body": response_body,
+                   "started": started,
+                   "timings": {"blocked": rand.choice([-1, 0, 1, 5]),
+                               "dns": -1,
+                               "connect": -1,
+                               "send": rand.randint(0, 3),
+                               "wait": wait,
+                               "receive": int(len(response_body) / 5000.0)},
+                   "page": "page_{0}".format(i // self.entries_per_page)}
+
+    def entries(self, count):
+        """Yield `count` HAR entries as dictionaries."""
+        for exchange in self.exchanges(count):
+            yield entry_from_exchange(exchange)
+
+    def pages(self, count):
+        """Return the pages for a log of `count` entries."""
+        pages = []
+        for i in xrange((count + self.entries_per_page - 1) //
+                        self.entries_per_page):
+            pages.append({"startedDateTime": _isoformat(
+                              START + timedelta(seconds=i * 2)),
+                          "id": "page_{0}".format(i),
+                          "title": "Page {0}".format(i),
+                          "pageTimings": {"onContentLoad": 800,
+                                          "onLoad": 1500}})
+        return pages
+
+    def har(self, count):
+        """Return a HAR of `count` entries as a dictionary."""
+        return {"log": {"version": "1.2",
+                        "creator": {"name": "Harpy synth",
+                                    "version": str(self.seed)},
+                        "pages": self.pages(count),
+                        "entries": list(self.entries(count))}}
+
+    def write_har(self, fd, count):
+        """Write a HAR of `count` entries to `fd` an entry at a time."""
+        writer = HarWriter(fd, pages=[_Json(page)
+                                      for page in self.pages(count)])
+        for entry in self.entries(count):
+            writer.write_raw(json.dumps(entry))
+        writer.close()
+
+    def raw_pairs(self, count):
+        """Yield `count` (raw request, raw response) pairs."""
+        for exchange in self.exchanges(count):
+            yield raw_request(exchange), raw_response(exchange)
+
+    def write_raw(self, fd, count, responses_fd=None):
+        """Write `count` raw requests, each followed by its response, to
+        `fd`. With `responses_fd` the responses go there instead."""
+        responses_fd = responses_fd or fd
+        for request, response in self.raw_pairs(count):
+            fd.write(request)
+            responses_fd.write(response)
+
+
+class _Json(object):
+    """Something HarWriter can dump that is already a dictionary."""
+
+    def __init__(self, data):
+        self.data = data
+
+    def dump(self, fd):
+        fd.write(json.dumps(self.data))
+
+
+###############################################################################
+# Rendering
+###############################################################################
+
+
+def _isoformat(dt):
+    return dt.isoformat() + "+00:00"
+
+
+def _request_headers(exchange):
+    headers = [("Host", exchange["host"])] + exchange["request_headers"]
+    if exchange["request_cookies"]:
+        headers.append(("Cookie", "; ".join(
+            "=".join(c) for c in exchange["request_cookies"])))
+    if exchange["request_body"]:
+        headers.append(("Content-Type", "application/x-www-form-urlencoded"))
+        headers.append(("Content-Length", str(len(exchange["request_body"]))))
+    return headers
+
+
+def _response_headers(exchange):
+    headers = list(exchange["response_headers"])
+    headers.extend(("Set-Cookie", "{0}={1}; Path=/; HttpOnly".format(*c))
+                   for c in exchange["set_cookies"])
+    if exchange["kind"] == "gzip":
+        headers.append(("Content-Encoding", "gzip"))
+    if exchange["status"] in (301, 302):
+        headers.append(("Location", "/{0}".format(WORDS[exchange["index"] %
+                                                        len(WORDS)])))
+    if exchange["response_body"]:
+        headers.append(("Content-Type", exchange["mime"]))
+        headers.append(("Content-Length",
+                        str(len(exchange["response_body"]))))
+    return headers
+
+
+def _har_headers(headers):
+    return [{"name": name, "value": value} for name, value in headers]
+
+
+def _har_text(body):
+    try:
+        return {"text": body.decode('utf8')}
+    except UnicodeDecodeError:
+        return {"text": b64encode(body), "encoding": "base64"}
+
+
+def entry_from_exchange(exchange):
+    """Return the HAR entry, as a dictionary, for an exchange."""
+    request = {"method": exchange["method"],
+               "url": exchange["url"],
+               "httpVersion": "HTTP/1.1",
+               "cookies": [{"name": n, "value": v}
+                           for n, v in exchange["request_cookies"]],
+               "headers": _har_headers(_request_headers(exchange)),
+               "queryString": [{"name": n, "value": v}
+                               for n, v in exchange["query"]],
+               "headersSize": -1,
+               "bodySize": len(exchange["request_body"])}
+    if exchange["request_body"]:
+        request["postData"] = {
+            "mimeType": "application/x-www-form-urlencoded",
+            "params": [dict(zip(["name", "value"], p.split("=", 1)))
+                       for p in exchange["request_body"].split("&")],
+            "text": exchange["request_body"]}
+    headers = _response_headers(exchange)
+    content = {"size": len(exchange["response_body"]),
+               "mimeType": exchange["mime"]}
+    if exchange["response_body"]:
+        content.update(_har_text(exchange["response_body"]))
+    response = {"status": exchange["status"],
+                "statusText": exchange["status_text"],
+                "httpVersion": "HTTP/1.1",
+                "cookies": [{"name": n, "value": v, "path": "/",
+                             "httpOnly": True}
+                            for n, v in exchange["set_cookies"]],
+                "headers": _har_headers(headers),
+                "content": content,
+                "redirectURL": dict(headers).get("Location", ""),
+                "headersSize": -1,
+                "bodySize": len(exchange["response_body"])}
+    timings = exchange["timings"]
+    return {"pageref": exchange["page"],
+            "startedDateTime": _isoformat(exchange["started"]),
+            "time": sum(t for t in timings.values() if t > 0),
+            "request": request,
+            "response": response,
+            "cache": {},
+            "timings": timings}
+
+
+def _raw(first_line, headers, body):
+    return "".join([first_line, "\r\n"] +
+                   ["{0}: {1}\r\n".format(*h) for h in headers] +
+                   ["\r\n", body])
+
+
+def raw_request(exchange):
+    """Return the raw request for an exchange."""
+    return _raw("{0} {1} HTTP/1.1".format(exchange["method"],
+                                          exchange["path"]),
+                _request_headers(exchange), exchange["request_body"])
+
+
+def raw_response(exchange):
+    """Return the raw response for an exchange."""
+    return _raw("HTTP/1.1 {0} {1}".format(exchange["status"],
+                                          exchange["status_text"]),
+                _response_headers(exchange), exchange["response_body"])
+
+
+###############################################################################
+# Interface Functions and Classes
+###############################################################################
+
+
+def usage(progn):
+    use = "usage: %s (har|raw) count [--seed N]\n\n" % progn
+    use += ("Write a synthetic HAR, or a stream of raw requests and "
+            "responses, of `count` entries to stdout.")
+    return use
+
+
+if __name__ == "__main__":
+    from sys import argv, stdout
+    if len(argv) < 3 or argv[1] not in ("har", "raw"):
+        print usage(argv[0])
+    else:
+        seed = "--seed" in argv and int(argv[argv.index("--seed") + 1]) or 0
+        corpus = Corpus(seed=seed)
+        if argv[1] == "har":
+            corpus.write_har(stdout, int(argv[2]))
+        else:
+            corpus.write_raw(stdout, int(argv[2]))
@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+# precompiled request templates
+"""Render one request many times over with different values in it,
+for fuzzing.
+
+`Request.replace` followed by `puke` copies, validates and renders the
+whole request for every payload. A RequestTemplate marks the places in
+a request that change, renders the request once with markers in those
+places and keeps the static strings between them. Every request after
+that is a join of those strings and the payload::
+
+    In [0]: template = RequestTemplate(request)
+
+    In [1]: template.mark_query("id")
+    Out[1]: 'query:id'
+
+    In [2]: template.mark_header("User-Agent")
+    Out[2]: 'header:User-Agent'
+
+    In [3]: compiled = template.compile()
+
+    In [4]: for raw in compiled.render_many(payloads):
+       ...:     send(raw)
+
+Every marked place gets the payload. `values` gives places, by the
+name mark_* returned, values of their own, and without a payload the
+places it leaves out keep their original value::
+
+    In [5]: compiled.render(values={"query:id": "1'--"})
+
+Places can be marked in the url path, the query string, a header, a
+cookie, a postData param or a range of the body. Content-Length is
+worked out again whenever the body has a marked place in it. Values go
+in as given, unicode as utf8, pass `encode` to a mark_* method
+(urllib.quote, say) to have them encoded first.
+
+"""
+
+import re
+
+try:
+    from ..har import Header
+except (ValueError, ImportError):
+    from har import Header
+
+
+###############################################################################
+# Constants
+###############################################################################
+LENGTH = "__length__" # slot for the Content-Length value
+LENGTH_VALUE = re.compile(r"^(Content-Length:[ \t]*)\d+", re.M | re.I)
+
+
+###############################################################################
+# Pieces
+###############################################################################
+
+
+def _identity(value):
+    return value
+
+
+def _finder(names):
+    """Return a regex that finds any of the strings in `names`."""
+    if not names:
+        return None
+    return re.compile("|".join(re.escape(value) for value in
+                               sorted(names, key=len, reverse=True)))
+
+
+class _Pieces(object):
+    """A string cut in to static strings and named slots. `names` maps
+    each string `finder` finds to the (name, encoder) of its slot."""
+
+    def __init__(self, text, finder=None, names=None):
+        self.parts = []
+        self.slots = [] # (position in parts, name, encoder)
+        last = 0
+        for match in finder and finder.finditer(text) or []:
+            self.parts.append(text[last:match.start()])
+            name, encode = names[match.group(0)]
+            self.slots.append((len(self.parts), name, encode))
+            self.parts.append(None)
+            last = match.end()
+        self.parts.append(text[last:])
+
+    def render(self, values):
+        parts = list(self.parts)
+        for position, name, encode in self.slots:
+            value = encode(values[name])
+            if isinstance(value, unicode): # bytes, for Content-Length
+                value = value.encode("utf8")
+            parts[position] = value
+        return "".join(parts)
+
+
+###############################################################################
+# Interface Functions and Classes
+###############################################################################
+
+
+class RequestTemplate(object):
+    """Marks the places in a copy of `request` that change. Each mark_*
+    method returns the name of the place it marked."""
+
+    def __init__(self, request):
+        self.request = request.replace()
+        self._places = {} # marker -> (name, original value, encoder)
+
+    def __repr__(self):
+        return "<RequestTemplate to '{0}': {1}>".format(
+            self.request._get("url"),
+            ", ".join(sorted(name for name, _, _ in
+                             self._places.itervalues())) or "no places")
+
+    def _marker(self, name, original, encode):
+        marker = "\0{0}\0".format(len(self._places))
+        if isinstance(original, unicode): # the copy came back from json
+            original = original.encode("utf8")
+        self._places[marker] = (name, original, encode or _identity)
+        return marker
+
+    def mark_path(self, index, encode=None):
+        """Mark segment `index` of the url path, /0/1/2."""
+        scheme, rest = self.request.url.split("://", 1)
+        host, _, path = rest.partition("/")
+        path, query = path.partition("?")[::2]
+        segments = path.split("/")
+        name = "path:{0}".format(index)
+        segments[index] = self._marker(name, segments[index], encode)
+        self.request.url = "{0}://{1}/{2}{3}".format(
+            scheme, host, "/".join(segments), query and "?" + query or "")
+        return name
+
+    def mark_query(self, param, encode=None):
+        """Mark the value of query string parameter `param`, adding it
+        if it is not there."""
+        url, _, query = self.request.url.partition("?")
+        pairs = query and query.split("&") or []
+        name = "query:{0}".format(param)
+        for i, pair in enumerate(pairs):
+            if pair.split("=", 1)[0] == param:
+                pairs[i] = "{0}={1}".format(param, self._marker(
+                    name, pair.partition("=")[2], encode))
+                break
+        else:
+            pairs.append("{0}={1}".format(param, self._marker(name, "",
+                                                              encode)))
+        self.request.url = url + "?" + "&".join(pairs)
+        return name
+
+    def mark_header(self, header, encode=None):
+        """Mark the value of `header`, adding it if it is not there."""
+        name = "header:{0}".format(header)
+        for h in self.request.headers:
+            if h.name.lower() == header.lower():
+                h.value = self._marker(name, h.value, encode)
+                return name
+        self.request.headers.append(Header({
+            "name": header, "value": self._marker(name, "", encode)}))
+        return name
+
+    def mark_cookie(self, cookie, encode=None):
+        """Mark the value of `cookie` in the Cookie header."""
+        name = "cookie:{0}".format(cookie)
+        for h in self.request.headers:
+            if h.name.lower() != "cookie":
+                continue
+            pairs = h.value.split("; ")
+            for i, pair in enumerate(pairs):
+                if pair.split("=", 1)[0] == cookie:
+                    pairs[i] = "{0}={1}".format(cookie, self._marker(
+                        name, pair.partition("=")[2], encode))
+                    h.value = "; ".join(pairs)
+                    return name
+        raise ValueError("The request sends no cookie {0}".format(cookie))
+
+    def mark_param(self, param, encode=None):
+        """Mark the value of postData param `param`."""
+        name = "param:{0}".format(param)
+        for p in self.request._get("postData", None) and \
+                 self.request.postData.params or []:
+            if p.name == param:
+                p.value = self._marker(name, p.value or "", encode)
+                return name
+        raise ValueError("The request has no param {0}".format(param))
+
+    def mark_body(self, start, end, encode=None):
+        """Mark characters `start` to `end` of the postData text."""
+        text = self.request.postData.text
+        name = "body:{0}:{1}".format(start, end)
+        self.request.postData.text = text[:start] + self._marker(
+            name, text[start:end], encode) + text[end:]
+        return name
+
+    def compile(self):
+        """Return the CompiledTemplate for the places marked so far."""
+        raw = self.request.puke()
+        end = raw.find("\r\n\r\n") + 4
+        head, body = raw[:end], raw[end:]
+        names = dict((marker, (name, encode)) for marker, (name, _, encode)
+                     in self._places.iteritems())
+        finder = _finder(names)
+        body = _Pieces(body, finder, names)
+        if body.slots:
+            head = LENGTH_VALUE.sub("\\1\0length\0", head, 1)
+            names["\0length\0"] = (LENGTH, _identity)
+            finder = _finder(names)
+        originals = dict((name, original) for name, original, _
+                         in self._places.itervalues())
+        return CompiledTemplate(_Pieces(head, finder, names), body,
+                                originals, raw.endswith("\r\n") and
+                                len(raw) > end and 2 or 0)
+
+
+class CompiledTemplate(object):
+    """Renders raw requests from a RequestTemplate."""
+
+    def __init__(self, head, body, originals, tail):
+        self.head = head
+        self.body = body
+        self.originals = originals
+        self.tail = tail # puke ends a body with a line break, not counted
+
+    def __repr__(self):
+        return "<CompiledTemplate: {0} places>".format(len(self.originals))
+
+    def render(self, payload=None, values=None):
+        """Return the raw request with `payload` in every place, or in
+        every place not in `values`. Places with neither keep their
+        original value."""
+        if payload is None:
+            filled = dict(self.originals)
+        else:
+            filled = dict.fromkeys(self.originals, payload)
+        if values:
+            filled.update(values)
+        body = self.body.render(filled)
+        filled[LENGTH] = str(len(body) - self.tail)
+        return self.head.render(filled) + body
+
+    def render_many(self, payloads):
+        """Yield a raw request for each payload."""
+        render = self.render
+        for payload in payloads:
+            yield render(payload)
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# timing analytics over many entries
+"""Pull the timings of a log out in to NumPy arrays and ask latency
+questions of them without a Python loop per entry.
+
+A TimingsFrame is built with one pass over the entries. After that,
+percentiles, totals and rankings by host, path prefix or page are done
+on whole arrays::
+
+    In [0]: frame = TimingsFrame(hc.log.entries)
+
+    In [1]: frame.percentiles("wait", (50, 99), by="host")
+    Out[1]: {'www.example.com': array([  38.,  210.]), ...}
+
+    In [2]: frame.slowest("time", by="page", count=3)
+    Out[2]: [('page_7', 18211.0), ('page_2', 17004.0), ('page_9', 16540.0)]
+
+    In [3]: frame.percentiles("wait", 50, by="path", depth=2)
+
+Entries can be Entry objects or plain dictionaries, so a capture can
+be analysed straight from json (or from mario.pull) without building
+the HAR objects first, which is most of the cost on a large log.
+
+Timings the HAR marks as not applicable (-1) are NaN in the frame and
+are left out of percentiles, totals and means.
+
+"""
+
+try:
+    import numpy
+except ImportError:
+    print ("Timing analytics need NumPy. On Debian based systems like "
+           "Ubuntu it can be installed with `aptitude install python-numpy` "
+           "or `pip install numpy`.")
+    raise
+
+
+###############################################################################
+# Constants
+###############################################################################
+TIMINGS = ("blocked", "dns", "connect", "ssl", "send", "wait", "receive")
+SIZES = ("request_headers_size", "request_body_size",
+         "response_headers_size", "response_body_size", "content_size")
+COLUMNS = TIMINGS + ("time", "ttfb") + SIZES + ("status",)
+
+
+###############################################################################
+# Extraction
+###############################################################################
+
+
+def _fields(obj):
+    """Return the fields of a HAR object, or of its json dictionary."""
+    if obj is None:
+        return {}
+    if isinstance(obj, dict):
+        return obj
+    return obj.__dict__
+
+
+def _host_path(url):
+    """Split an absolute url in to its host and path, much quicker than
+    urlsplit. An IPv6 host is given without its brackets."""
+    rest = url.partition("://")[2]
+    slash = rest.find("/")
+    if slash < 0:
+        host, path = rest, "/"
+    else:
+        host, path = rest[:slash], rest[slash:].partition("?")[0]
+    host = host.rpartition("@")[2]
+    if host.startswith("["):
+        return host[1:].partition("]")[0].lower(), path
+    return host.partition(":")[0].lower(), path
+
+
+def _row(entry):
+    """Return the numbers and the (host, path, page) of one entry."""
+    entry = _fields(entry)
+    timings = _fields(entry.get("timings")).get
+    request = _fields(entry.get("request")).get
+    response = _fields(entry.get("response")).get
+    values = [timings(name, -1) for name in TIMINGS]
+    values.append(entry.get("time", -1))
+    # time to first byte, ssl is already counted in connect, unknown
+    # if none of its timings are
+    known = [v for v in values[:3] + values[4:6] if v >= 0]
+    values.append(sum(known) if known else -1)
+    values.extend([request("headersSize", -1),
+                   request("bodySize", -1),
+                   response("headersSize", -1),
+                   response("bodySize", -1),
+                   _fields(response("content")).get("size", -1),
+                   response("status", 0)])
+    host, path = _host_path(request("url", ""))
+    return values, host, path, entry.get("pageref", "")
+
+
+class _Codes(object):
+    """Numbers the distinct labels of a column as they are seen."""
+
+    def __init__(self):
+        self.labels = []
+        self._index = {}
+
+    def code(self, label):
+        try:
+            return self._index[label]
+        except KeyError:
+            self._index[label] = code = len(self.labels)
+            self.labels.append(label)
+            return code
+
+
+###############################################################################
+# Interface Functions and Classes
+###############################################################################
+
+
+class TimingsFrame(object):
+    """Columns of timings, sizes and statuses for `entries`, one array
+    element per entry. Columns are float64 arrays named as in COLUMNS,
+    with NaN where the HAR has -1. `ttfb` is the time to first byte,
+    everything before `receive`, NaN if none of that is known.
+
+    """
+
+    def __init__(self, entries):
+        rows = []
+        hosts, pages = _Codes(), _Codes()
+        host_codes, page_codes, self.paths = [], [], []
+        for entry in entries:
+            values, host, path, page = _row(entry)
+            rows.append(values)
+            host_codes.append(hosts.code(host))
+            page_codes.append(pages.code(page))
+            self.paths.append(path)
+        data = numpy.array(rows, dtype=numpy.float64).reshape(
+            len(rows), len(COLUMNS))
+        data[data < 0] = numpy.nan
+        self._columns = dict((name, data[:, i])
+                             for i, name in enumerate(COLUMNS))
+        self._keys = {"host": (numpy.array(host_codes, dtype=numpy.intp),
+                               hosts.labels),
+                      "page": (numpy.array(page_codes, dtype=numpy.intp),
+                               pages.labels)}
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __repr__(self):
+        return "<TimingsFrame: {0} entries, {1} hosts, {2} pages>".format(
+            len(self), len(self._keys["host"][1]), len(self._keys["page"][1]))
+
+    def __getitem__(self, column):
+        return self._columns[column]
+
+    def keys(self, by="host", depth=1):
+        """Return (codes, labels) for grouping by "host", "page" or
+        "path". Each entry's code indexes its label. Paths are cut to
+        their first `depth` segments, so depth=1 groups /api/v1/users
+        under /api."""
+        if by != "path":
+            return self._keys[by]
+        name = "path", depth
+        if name not in self._keys:
+            prefixes = _Codes()
+            codes = [prefixes.code("/" + "/".join(
+                path.split("/")[1:depth + 1])) for path in self.paths]
+            self._keys[name] = (numpy.array(codes, dtype=numpy.intp),
+                                prefixes.labels)
+        return self._keys[name]
+
+    def groups(self, by="host", depth=1):
+        """Yield (label, indexes) for every group, indexes being an
+        array of the positions of the group's entries."""
+        codes, labels = self.keys(by, depth)
+        order = numpy.argsort(codes, kind="mergesort")
+        bounds = numpy.flatnonzero(numpy.diff(codes[order])) + 1
+        for indexes in numpy.split(order, bounds):
+            if len(indexes):
+                yield labels[codes[indexes[0]]], indexes
+
+    def percentiles(self, column, q=(50, 90, 99), by=None, depth=1):
+        """Return the `q` percentiles of `column`. With `by`, return a
+        dictionary of them for each host, page or path prefix."""
+        values = self._columns[column]
+        if by is None:
+            return _percentiles(values, q)
+        return dict((label, _percentiles(values[indexes], q))
+                    for label, indexes in self.groups(by, depth))
+
+    def totals(self, column, by="host", depth=1):
+        """Return a dictionary of the sum of `column` for each group."""
+        codes, labels = self.keys(by, depth)
+        values = self._columns[column]
+        known = ~numpy.isnan(values)
+        sums = numpy.bincount(codes[known], values[known],
+                              minlength=len(labels))
+        return dict(zip(labels, sums.tolist()))
+
+    def counts(self, by="host", depth=1):
+        """Return a dictionary of the number of entries in each group."""
+        codes, labels = self.keys(by, depth)
+        return dict(zip(labels, numpy.bincount(
+            codes, minlength=len(labels)).tolist()))
+
+    def slowest(self, column="time", by="page", count=10, depth=1):
+        """Return the `count` groups with the largest total `column`,
+        as (label, total) pairs, largest first."""
+        totals = self.totals(column, by, depth)
+        return sorted(totals.iteritems(), key=lambda t: -t[1])[:count]
+
+
+def _percentiles(values, q):
+    values = values[~numpy.isnan(values)]
+    if not len(values):
+        return numpy.nan * numpy.ones(numpy.shape(q))
+    return numpy.percentile(values, q)
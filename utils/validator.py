@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+# HAR validator
+"""Check a HAR against the rules of the HAR classes and report every
+problem in it, not just the first.
+
+Loading a HarContainer validates as it goes and stops at the first
+ValidationError. It also builds every object, hashes every body and
+parses every date on the way. The validator does none of that. It
+reads the HAR with a HarReader, so it is never all in memory, and
+runs the validate_input of the class each part of it would become
+against the json itself, recording each missing field and each field
+of the wrong type instead of raising::
+
+    In [0]: for error in validate(open('capture.har')):
+       ...:     print error
+    log.entries[12].request.url: missing from Request
+    log.entries[40].response.status: must be one of int, not unicode
+
+Entries are cut out of the file by their brackets, without being
+decoded, and handed as json text in batches to a pool of worker
+processes to be decoded and checked. Errors come back in entry order.
+If the file itself is broken, the error says at which byte. On top of
+the class rules, dates must parse and the pageref of an entry must be
+the id of a page. From the shell, which exits with 1 if anything was
+found::
+
+    $ python -m utils.validator capture.har
+
+"""
+
+import sys
+import json
+from collections import deque
+from multiprocessing import Pool, cpu_count
+
+try:
+    from .._internal import _epoch_ms, MissingValue, ValidationError
+    from .. import har
+    from .har_stream import HarReader
+except (ValueError, ImportError):
+    from _internal import _epoch_ms, MissingValue, ValidationError
+    import har
+    from utils.har_stream import HarReader
+
+
+###############################################################################
+# Constants
+###############################################################################
+BATCH_SIZE = 500 # entries handed to a worker at once
+READ_SIZE = 1024 * 1024
+QUEUED = 2 # batches waiting for each worker
+
+# the classes the fields of each class are made in to, [cls] for a list
+CHILDREN = {
+    har.Log: {"creator": har.Creator, "browser": har.Browser,
+              "pages": [har.Page], "entries": [har.Entry]},
+    har.Page: {"pageTimings": har.PageTimings},
+    har.Entry: {"request": har.Request, "response": har.Response,
+                "cache": har.Cache, "timings": har.Timings},
+    har.Request: {"headers": [har.Header], "cookies": [har.Cookie],
+                  "queryString": [har.QueryString],
+                  "postData": har.PostData},
+    har.Response: {"headers": [har.Header], "cookies": [har.Cookie],
+                   "content": har.Content},
+    har.PostData: {"params": [har.Param]},
+    har.Cache: {"beforeRequest": har.RequestCache,
+                "afterRequest": har.RequestCache},
+}
+DATES = {har.Page: "startedDateTime", har.Entry: "startedDateTime"}
+
+
+###############################################################################
+# Checks
+###############################################################################
+
+
+def _type_names(ftype):
+    return ", ".join(t.__name__ for t in
+                     (type(ftype) is list and ftype or [ftype]))
+
+
+class _Checker(object):
+    """Stands in for the _has_fields, _check_field_types and
+    _check_empty of one object, recording failures in `errors`."""
+
+    def __init__(self, obj, path, errors):
+        self.obj = obj
+        self.path = path
+        self.errors = errors
+
+    def has_fields(self, *fields):
+        for field in fields:
+            if not field in self.obj.__dict__:
+                self.errors.append(("{0}.{1}".format(self.path, field),
+                                    "missing from {0}".format(
+                                        self.obj.__class__.__name__)))
+
+    def check_field_types(self, field_defs):
+        values = self.obj.__dict__
+        for fname, ftype in field_defs.iteritems():
+            if not fname in values:
+                continue # reported by has_fields
+            kind = type(values[fname])
+            if type(ftype) is list and kind in ftype or kind is ftype:
+                continue
+            self.errors.append(("{0}.{1}".format(self.path, fname),
+                                "must be one of {0}, not {1}".format(
+                                    _type_names(ftype), kind.__name__)))
+
+    def check_empty(self, fields):
+        for field in type(fields) is list and fields or [fields]:
+            if not self.obj.__dict__.get(field):
+                self.errors.append(("{0}.{1}".format(self.path, field),
+                                    "must not be empty"))
+
+
+def check(cls, node, path, errors):
+    """Check the json `node` against the rules of `cls` and its
+    children, adding a (path, message) to `errors` for each problem.
+    Returns `errors`."""
+    if not isinstance(node, dict):
+        errors.append((path, "must be an object, not {0}".format(
+            type(node).__name__)))
+        return errors
+    obj = cls.__new__(cls) # nothing from __init__, only the rules
+    obj.__dict__.update(node)
+    checker = _Checker(obj, path, errors)
+    obj._has_fields = checker.has_fields
+    obj._check_field_types = checker.check_field_types
+    obj._check_empty = checker.check_empty
+    try:
+        obj.validate_input()
+    except (MissingValue, ValidationError, AssertionError), err:
+        errors.append((path, str(err)))
+    except Exception, err: # a rule that broke on odd input
+        errors.append((path, "{0}: {1}".format(type(err).__name__, err)))
+    date = DATES.get(cls)
+    if date and isinstance(node.get(date), basestring):
+        try:
+            _epoch_ms(node[date])
+        except (ValueError, TypeError, OverflowError):
+            errors.append(("{0}.{1}".format(path, date),
+                           "is not a date: {0!r}".format(node[date])))
+    for field, child in CHILDREN.get(cls, {}).iteritems():
+        value = node.get(field)
+        if value is None:
+            continue
+        if type(child) is not list:
+            check(child, value, "{0}.{1}".format(path, field), errors)
+        elif isinstance(value, list):
+            for i, item in enumerate(value):
+                check(child[0], item, "{0}.{1}[{2}]".format(path, field, i),
+                      errors)
+    return errors
+
+
+def _check_batch(batch):
+    """Return the errors of a batch of (index, entry json) and the
+    pagerefs it used, with the first entry to use each."""
+    errors, pagerefs = [], {}
+    for index, text in batch:
+        path = "log.entries[{0}]".format(index)
+        try:
+            entry = json.loads(text)
+        except ValueError, err:
+            errors.append((index, path, "is not json: {0}".format(err)))
+            continue
+        for error in check(har.Entry, entry, path, []):
+            errors.append((index,) + error)
+        if isinstance(entry, dict) and "pageref" in entry:
+            pagerefs.setdefault(entry["pageref"], index)
+    return errors, pagerefs
+
+
+def _batches(reader):
+    batch = []
+    for index, text in enumerate(reader.raw()):
+        batch.append((index, text))
+        if len(batch) == BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+###############################################################################
+# Interface Functions and Classes
+###############################################################################
+
+
+def validate(fd, processes=None):
+    """Yield an (entry index, path, message) for every problem in the
+    HAR read from the file like object `fd`, in the order of the
+    entries. Problems outside of the entries have None as their index
+    and come last. `processes` defaults to the number of CPUs, 1 checks
+    everything in this process."""
+    try:
+        reader = HarReader(fd, READ_SIZE)
+    except ValueError, err:
+        yield None, "log", str(err)
+        return
+    processes = processes or cpu_count()
+    pool = processes > 1 and Pool(processes) or None
+    pagerefs = {}
+    pending = deque()
+    broken = None
+    # batches are read here, not in the pool's feeder thread, so that a
+    # broken file is reported rather than lost
+    batches = _batches(reader)
+    try:
+        while True:
+            try:
+                batch = next(batches, None)
+            except ValueError, err: # the json itself is broken
+                batch, broken = None, (reader.entries, "log.entries",
+                                       str(err))
+            if batch is not None:
+                pending.append(pool and pool.apply_async(
+                    _check_batch, (batch,)) or _check_batch(batch))
+            while pending and (batch is None or
+                               len(pending) > processes * QUEUED):
+                checked = pending.popleft()
+                errors, used = pool and checked.get() or checked
+                for error in errors:
+                    yield error
+                for pageref, index in used.iteritems():
+                    pagerefs.setdefault(pageref, index)
+            if batch is None:
+                break
+    finally:
+        if pool:
+            pool.terminate()
+            pool.join()
+    if broken:
+        yield broken
+        return
+    log = dict(reader.log, entries=[])
+    for path, message in check(har.Log, log, "log", []):
+        yield None, path, message
+    ids = set()
+    for page in isinstance(log.get("pages"), list) and log["pages"] or []:
+        if isinstance(page, dict) and "id" in page:
+            if page["id"] in ids:
+                yield None, "log.pages", "page id {0!r} is not unique".format(
+                    page["id"])
+            ids.add(page["id"])
+    for pageref, index in sorted(pagerefs.iteritems(), key=lambda i: i[1]):
+        if not pageref in ids:
+            yield index, "log.entries[{0}].pageref".format(index), \
+                  "no page has the id {0!r}".format(pageref)
+
+
+def usage(progn):
+    use = "usage: %s [--processes N] file.har [file.har ...]\n\n" % progn
+    use += ("Check HARs and print every problem found in them, by the "
+            "path to it.")
+    return use
+
+
+def main(argv):
+    args = argv[1:]
+    processes = None
+    if args[:1] == ["--processes"] and len(args) > 1:
+        processes, args = int(args[1]), args[2:]
+    if not args or args[0].startswith("-"):
+        print usage(argv[0])
+        return 2
+    found = 0
+    for path in args:
+        with open(path) as fd:
+            for index, where, message in validate(fd, processes):
+                print "{0}: {1}: {2}".format(path, where, message)
+                found += 1
+    return found and 1 or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
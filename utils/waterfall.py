@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# page load waterfalls
+"""Rebuild how a page loaded from the entries that point at it.
+
+Entries are indexed once by pageref and, within a page, sorted by
+start time. Everything asked of a page after that works on its own
+sorted entries and costs O(n log n) at worst::
+
+    In [0]: waterfall = Waterfall(hc.log.entries, hc.log.pages)
+
+    In [1]: load = waterfall["page_0"]
+
+    In [2]: load.summary()
+    Out[2]: {'entries': 40, 'span': 2203.0, 'onLoad': 2500,
+             'max_parallel': 6, 'mean_parallel': 2.8, 'blocked': 120.0,
+             'idle': 88.0, 'critical': 5}
+
+    In [3]: [e["request"]["url"] for e in load.dominant(3)]
+
+`critical_path` works back from the request that finished last, at
+each step taking the request that finished last before the current one
+started, which is the best guess a HAR allows at what held the page up.
+`dominant` ranks the requests on that path by how long they took, which
+is where to look when onLoad is slow.
+
+Entries and pages can be HAR objects or plain json dictionaries.
+Times are in milliseconds from the start of the page.
+
+"""
+
+from bisect import bisect_right
+
+try:
+    from .._internal import _epoch_ms
+except (ValueError, ImportError):
+    from _internal import _epoch_ms
+
+
+###############################################################################
+# Helpers
+###############################################################################
+
+
+def _fields(obj):
+    if obj is None:
+        return {}
+    if isinstance(obj, dict):
+        return obj
+    return obj.__dict__
+
+
+###############################################################################
+# Interface Functions and Classes
+###############################################################################
+
+
+class PageLoad(object):
+    """The entries of one page, in the order they started. `bars` has
+    a (start, end, entry) tuple for each, relative to `start`, the
+    page's startedDateTime (or its first entry when there is no page).
+
+    """
+
+    def __init__(self, pageref, entries, page=None):
+        self.pageref = pageref
+        self.page = page
+        timed = []
+        for entry in entries:
+            fields = _fields(entry)
+            start = _epoch_ms(fields["startedDateTime"])
+            timed.append((start, start + max(fields.get("time", 0), 0),
+                          entry))
+        timed.sort(key=lambda bar: bar[0])
+        if page is not None:
+            self.start = _epoch_ms(_fields(page)["startedDateTime"])
+        else:
+            self.start = timed and timed[0][0] or 0.0
+        self.bars = [(start - self.start, end - self.start, entry)
+                     for start, end, entry in timed]
+
+    def __len__(self):
+        return len(self.bars)
+
+    def __repr__(self):
+        return "<PageLoad {0}: {1} entries over {2:.0f}ms>".format(
+            self.pageref, len(self), self.span())
+
+    @property
+    def entries(self):
+        return [entry for _, _, entry in self.bars]
+
+    def span(self):
+        """Time from the start of the page until its last request
+        finished."""
+        return max([end for _, end, _ in self.bars] or [0.0])
+
+    def on_load(self):
+        """The page's onLoad time, or None if it is not known."""
+        if self.page is None:
+            return None
+        timings = _fields(_fields(self.page).get("pageTimings"))
+        value = timings.get("onLoad", -1)
+        if value < 0:
+            return None
+        return value
+
+    def parallelism(self):
+        """Return (most requests in flight at once, mean requests in
+        flight while any were)."""
+        events = sorted([(start, 1) for start, _, _ in self.bars] +
+                        [(end, -1) for _, end, _ in self.bars])
+        busy = total = peak = current = 0
+        last = None
+        for time, change in events:
+            if current:
+                busy += time - last
+                total += (time - last) * current
+            current += change
+            peak = max(peak, current)
+            last = time
+        return peak, busy and float(total) / busy or 0.0
+
+    def idle(self):
+        """Time between the page start and its last request finishing
+        during which no request was in flight."""
+        idle = reached = 0.0
+        for start, end, _ in self.bars:
+            if start > reached:
+                idle += start - reached
+            reached = max(reached, end)
+        return idle
+
+    def blocked(self):
+        """Total time requests spent queued before they could be sent
+        (the 'blocked' timing)."""
+        total = 0.0
+        for _, _, entry in self.bars:
+            value = _fields(_fields(entry).get("timings")).get("blocked", -1)
+            if value > 0:
+                total += value
+        return total
+
+    def critical_path(self):
+        """Return the bars, first to last, of the chain of requests
+        that ends with the one that finished last."""
+        if not self.bars:
+            return []
+        by_end = sorted(self.bars, key=lambda bar: bar[1])
+        ends = [end for _, end, _ in by_end]
+        path = [by_end[-1]]
+        while True:
+            start = path[-1][0]
+            # the request that finished last before this one started
+            i = bisect_right(ends, start) - 1
+            if i < 0 or by_end[i] is path[-1]:
+                break
+            path.append(by_end[i])
+        path.reverse()
+        return path
+
+    def dominant(self, count=5):
+        """Return the `count` entries on the critical path that took
+        the longest, longest first."""
+        path = sorted(self.critical_path(), key=lambda bar: bar[0] - bar[1])
+        return [entry for _, _, entry in path[:count]]
+
+    def summary(self):
+        """Return the numbers above as a dictionary."""
+        peak, mean = self.parallelism()
+        return {"entries": len(self),
+                "span": self.span(),
+                "onLoad": self.on_load(),
+                "max_parallel": peak,
+                "mean_parallel": mean,
+                "blocked": self.blocked(),
+                "idle": self.idle(),
+                "critical": len(self.critical_path())}
+
+
+class Waterfall(object):
+    """Indexes `entries` by pageref so each page's load can be looked
+    up with waterfall[pageref]. `pages` gives the pages' start times
+    and timings; without it a page starts with its first entry.
+    Entries without a pageref are under None."""
+
+    def __init__(self, entries, pages=None):
+        self._entries = {}
+        for entry in entries:
+            self._entries.setdefault(_fields(entry).get("pageref"),
+                                     []).append(entry)
+        self._pages = dict((_fields(page)["id"], page)
+                           for page in pages or [])
+        self._loads = {}
+
+    def __repr__(self):
+        return "<Waterfall: {0} pages>".format(len(self._entries))
+
+    def __contains__(self, pageref):
+        return pageref in self._entries
+
+    def __iter__(self):
+        return iter(self.pagerefs())
+
+    def __getitem__(self, pageref):
+        if pageref not in self._loads:
+            self._loads[pageref] = PageLoad(pageref, self._entries[pageref],
+                                            self._pages.get(pageref))
+        return self._loads[pageref]
+
+    def pagerefs(self):
+        """The pagerefs, in the order their pages (or first entries)
+        started."""
+        return sorted(self._entries, key=lambda ref: self[ref].start)